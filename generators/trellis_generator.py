@@ -7,7 +7,9 @@ import os
 import subprocess
 import sys
 import threading
+import time
 import traceback
+from urllib.parse import parse_qs, urlparse
 
 import requests
 from ..utils import absolute_path
@@ -25,6 +27,11 @@ class TrellisGenerator:
 
     PYTHON_DEPENDENCIES = ("psutil==6.1.1", "websockets==11.0")
 
+    # Downloads read chunks sized to take about DOWNLOAD_CHUNK_SECONDS at the current speed, within these bounds
+    DOWNLOAD_MIN_CHUNK_SIZE = 64 * 1024
+    DOWNLOAD_MAX_CHUNK_SIZE = 8 * 1024 * 1024
+    DOWNLOAD_CHUNK_SECONDS = 0.1
+
     # make sure there is only one generator instance
     def __new__(cls):
         if not cls._instance:
@@ -294,38 +301,20 @@ class TrellisGenerator:
                 _("Suggestion: ", '*') + result["suggestion"]
             )
     
-    def _upload_image(self, image_path, type):
-        url = f"{self.http_base_url}/upload_image"
-        try:
-            # raise RuntimeError("Test Error")
-            with open(image_path, 'rb') as f:
-                files = {'image': (image_path, f, f'image/{type}')}
-                response = requests.post(url, files=files)
-                response.raise_for_status()
-                result = response.json()
-                return result
-        except Exception as e:
-            return {
-                "code": -1, 
-                "message": _("There is something wrong on the local machine: ", '*') + str(e), 
-                "suggestion": _("Bring the code and message and contact the admin of this blender addon", '*')
-            }
-    
-    def _create_img23d_task(self, task):
-        url = f"{self.http_base_url}/img23d_task"
+    def _upload_image_and_create_img23d_task(self, task):
+        url = f"{self.http_base_url}/img23d_task/upload"
         data = {
-            "image_type": task.image.type,
-            "image_token": task.image.token, 
             "preprocess_image": task.image.preprocess_image, 
             "output_type": task.output.type, 
+            "speed_tier": task.speed_tier, 
         }
         try:
-            response = requests.post(
-                url, 
-                json=data
-            )
-            response.raise_for_status()
-            return response.json()
+            # raise RuntimeError("Test Error")
+            with open(task.image.local_filepath, 'rb') as f:
+                files = {'image': (task.image.local_filepath, f, f'image/{task.image.type}')}
+                response = requests.post(url, data=data, files=files)
+                response.raise_for_status()
+                return response.json()
         except Exception as e:
             return {
                 "code": -1,
@@ -345,6 +334,10 @@ class TrellisGenerator:
                     result = json.loads(message)
                     data = result["data"]
                     task.watch_progress = f'{data["generate_status"]}: {data["progress"]}%'
+                    # The mesh preview comes after the voxel one and is closer to the final model
+                    preview_url = data.get("mesh_preview_url") or data.get("voxel_preview_url")
+                    if preview_url and preview_url != task.output.preview_url:
+                        await asyncio.to_thread(self._download_preview, task, preview_url)
                     if result["event"] == "finalized":
                         if data["generate_status"] == "generating_failed":
                             return {
@@ -382,31 +375,111 @@ class TrellisGenerator:
                 "suggestion": "Bring the code and message and contact the admin of the blender addon"
             }
 
+    def _read_etag(self, etag_filepath):
+        try:
+            with open(etag_filepath, 'r') as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _write_etag(self, etag_filepath, etag):
+        if etag:
+            with open(etag_filepath, 'w') as f:
+                f.write(etag)
+        elif os.path.exists(etag_filepath):
+            os.remove(etag_filepath)
+
+    def _download_file(self, url, local_filepath, on_progress=None):
+        """
+        Download a file, skipping it if the local copy is up to date and resuming it if a previous download was interrupted.
+        Both are checked against the ETag of the server, kept next to the file in a `.etag` file.
+        The file is downloaded to a `.part` file first, which only replaces the local copy once complete.
+
+        Args:
+            url (str): The url of the file.
+            local_filepath (str): Where to save the file.
+            on_progress (Callable): Called with the downloaded and the total bytes after every chunk, the total is 0 if unknown.
+        """
+        part_filepath = f"{local_filepath}.part"
+        etag_filepath = f"{local_filepath}.etag"
+        part_etag_filepath = f"{part_filepath}.etag"
+        headers = {}
+        etag = self._read_etag(etag_filepath)
+        part_etag = self._read_etag(part_etag_filepath)
+        if etag and os.path.exists(local_filepath):
+            headers["If-None-Match"] = etag
+        elif part_etag and os.path.exists(part_filepath):
+            headers["Range"] = f"bytes={os.path.getsize(part_filepath)}-"
+            headers["If-Range"] = part_etag
+            # The rest of a compressed response can't be appended to the decompressed part
+            headers["Accept-Encoding"] = "identity"
+        with requests.get(url, headers=headers, stream=True) as response:
+            if response.status_code == 304:
+                return
+            if response.status_code == 416:
+                # The part is already as long as the file, it can't be trusted
+                os.remove(part_filepath)
+                os.remove(part_etag_filepath)
+                return self._download_file(url, local_filepath, on_progress)
+            response.raise_for_status()
+            resumed = response.status_code == 206
+            offset = os.path.getsize(part_filepath) if resumed else 0
+            total_size = int(response.headers.get('content-length', 0))
+            # Only an uncompressed response can be resumed with a range of bytes
+            encoded = response.headers.get('content-encoding', 'identity') != 'identity'
+            self._write_etag(part_etag_filepath, None if encoded else response.headers.get('etag'))
+            chunk_size = self.DOWNLOAD_MIN_CHUNK_SIZE
+            with open(part_filepath, 'ab' if resumed else 'wb') as file:
+                while True:
+                    start = time.perf_counter()
+                    chunk = response.raw.read(chunk_size, decode_content=True)
+                    if not chunk:
+                        break
+                    file.write(chunk)
+                    if on_progress is not None:
+                        # Bytes received, not decompressed, to compare with the content-length
+                        on_progress(offset + response.raw.tell(), offset + total_size if total_size else 0)
+                    speed = len(chunk) / max(time.perf_counter() - start, 1e-6)
+                    chunk_size = int(min(max(speed * self.DOWNLOAD_CHUNK_SECONDS, self.DOWNLOAD_MIN_CHUNK_SIZE), self.DOWNLOAD_MAX_CHUNK_SIZE))
+        os.replace(part_filepath, local_filepath)
+        self._write_etag(etag_filepath, response.headers.get('etag'))
+        if os.path.exists(part_etag_filepath):
+            os.remove(part_etag_filepath)
+
+    def _download_preview(self, task, partial_url):
+        """Download a preview of the task, the operator watching the task imports it. Failures are only printed."""
+        token = parse_qs(urlparse(partial_url).query)["token"][0]
+        local_filepath = os.path.join(self.output_folder, f"{token}.glb")
+        try:
+            self._download_file(f"{self.http_base_url}{partial_url}", local_filepath)
+            task.output.preview_url = partial_url
+            task.output.preview_local_filepath = local_filepath
+        except Exception as e:
+            print(f"Error downloading the preview {partial_url}: {e}")
+
     def _download_model(self, task):
         get_url_result = self._get_task_output_url(task)
         if get_url_result["code"] == 0:
             partial_url = get_url_result["data"]["output_url"]
             url = f"{self.http_base_url}{partial_url}"
-            local_filepath = os.path.join(self.output_folder, f"{task.id}.glb")
+            # glb for the models, ply for the gaussian splats
+            extension = parse_qs(urlparse(partial_url).query).get("extension", ["glb"])[0]
+            local_filepath = os.path.join(self.output_folder, f"{task.id}.{extension}")
+            def report_progress(progress, total_size):
+                if total_size:
+                    task.output.download_progress = f"{round((progress / total_size) * 100, 2)}%"
+                else:
+                    task.output.download_progress = f"{round(progress / 1024**2, 2)}MB"
             try:
                 # raise RuntimeError("Test Error")
-                progress = 0
-                with requests.get(url, stream=True) as response:
-                    response.raise_for_status()
-                    total_size = int(response.headers.get('content-length', 0))
-                    with open(local_filepath, 'wb') as file:
-                        for chunk in response.iter_content(chunk_size=8192):
-                            if chunk:
-                                file.write(chunk)
-                                progress += len(chunk)
-                                progress_percentage = round((progress / total_size) * 100, 2)
-                                task.output.download_progress = f"{progress_percentage}%"
-                    return {
-                        "code": 0, 
-                        "data": {
-                            f"local_filepath": local_filepath
-                        }
+                self._download_file(url, local_filepath, report_progress)
+                task.output.download_progress = "100.0%"
+                return {
+                    "code": 0, 
+                    "data": {
+                        f"local_filepath": local_filepath
                     }
+                }
             except Exception as e:
                 return {
                     "code": -1, 
@@ -418,43 +491,38 @@ class TrellisGenerator:
 
 
     def image23d(self, operator, task):
+        # The image is uploaded along with the task parameters, in one request
         task.image.upload_status = "uploading"
-        upload_image_result = self._upload_image(task.image.local_filepath, task.image.type)
-        if upload_image_result["code"] != 0:
+        task.create_status = "creating"
+        task_create_result = self._upload_image_and_create_img23d_task(task)
+        if task_create_result["code"] != 0:
             task.image.upload_status = "uploading_failed"
-            self._report_message(upload_image_result, operator)
+            task.create_status = "creating_failed"
+            self._report_message(task_create_result, operator)
             operator.end_token = True
         else:
             task.image.upload_status = "uploading_end"
-            task.image.token = upload_image_result["data"]["image_token"]
-            task.create_status = "creating"
-            task_create_result = self._create_img23d_task(task)
-            if task_create_result["code"] != 0:
-                task.create_status = "creating_failed"
-                self._report_message(task_create_result, operator)
+            task.create_status = "creating_end"
+            task.id = task_create_result["data"]["task_id"]
+            task.watch_status = "watching"
+            watch_task_result = asyncio.run(self._watch_task(task))
+            if watch_task_result["code"] != 0:
+                task.watch_status = "watching_failed"
+                self._report_message(watch_task_result, operator)
                 operator.end_token = True
             else:
-                task.create_status = "creating_end"
-                task.id = task_create_result["data"]["task_id"]
-                task.watch_status = "watching"
-                watch_task_result = asyncio.run(self._watch_task(task))
-                if watch_task_result["code"] != 0:
-                    task.watch_status = "watching_failed"
-                    self._report_message(watch_task_result, operator)
-                    operator.end_token = True
+                task.watch_status = "watching_end"
+
+                # download model
+                task.output.download_status = "downloading"
+                download_result = self._download_model(task)
+                if download_result["code"] == 0:
+                    task.output.download_status = "downloading_end"
+                    task.output.local_filepath = download_result["data"]["local_filepath"]
                 else:
-                    task.watch_status = "watching_end"
-
-                    # download model
-                    task.output.download_status = "downloading"
-                    download_result = self._download_model(task)
-                    if download_result["code"] == 0:
-                        task.output.download_status = "downloading_end"
-                        task.output.local_filepath = download_result["data"]["local_filepath"]
-                    else:
-                        task.output.download_status = "downloading_failed"
-                        self._report_message(download_result, operator)
-                    operator.end_token = True
+                    task.output.download_status = "downloading_failed"
+                    self._report_message(download_result, operator)
+                operator.end_token = True
 
     def rewatch_img23d_task(self, operator, task):
         task.watch_status = "watching"
@@ -8,6 +8,65 @@ from ..generators.trellis_generator import TrellisGenerator
 from ..utils import absolute_path, open_console
 
 
+def import_model_file(filepath):
+    """Import a downloaded glb or ply file, the imported objects are selected afterwards."""
+    if filepath.endswith(".ply"):
+        bpy.ops.wm.ply_import(filepath=filepath)
+    else:
+        bpy.ops.import_scene.gltf(filepath=filepath)
+
+
+class TrellisPreviewMixin:
+    """
+    Import the previews of the task the operator watches as soon as they are downloaded, each one replacing the last,
+    then swap the preview for the final model once it is downloaded.
+    Blender data can only be changed from the main thread, so it's done on the timer events of the modal operator.
+    """
+
+    def modal(self, context, event):
+        if event.type == "TIMER":
+            try:
+                self._sync_preview(context)
+            except Exception as e:
+                print(f"Error importing the preview of task {self.task.name}: {e}")
+        return super().modal(context, event)
+
+    def _remove_preview(self):
+        """Remove the imported preview object, return its location."""
+        preview_object = bpy.data.objects.get(self.task.output.preview_object_name)
+        self.task.output.preview_object_name = ""
+        if preview_object is None:
+            return None
+        location = preview_object.location.copy()
+        bpy.data.objects.remove(preview_object, do_unlink=True)
+        return location
+
+    def _import_in_place_of_preview(self, context, filepath, name):
+        location = self._remove_preview()
+        import_model_file(filepath)
+        if not context.selected_objects:
+            return None
+        imported_object = context.selected_objects[0]
+        imported_object.location = location if location is not None else context.scene.cursor.location
+        imported_object.name = name
+        return imported_object
+
+    def _sync_preview(self, context):
+        output = self.task.output
+        if output.download_status == "downloading_end":
+            # Only swap a preview which was shown, the final model is otherwise imported by hand as before
+            if output.preview_object_name:
+                self._import_in_place_of_preview(context, output.local_filepath, self.task.name)
+                output.preview_local_filepath = ""
+        elif output.preview_local_filepath and output.preview_local_filepath != getattr(self, "imported_preview_filepath", ""):
+            self.imported_preview_filepath = output.preview_local_filepath
+            preview_object = self._import_in_place_of_preview(
+                context, output.preview_local_filepath, self.task.name + _(" (Preview)", '*')
+            )
+            if preview_object is not None:
+                output.preview_object_name = preview_object.name
+
+
 class Trellis_OT_CHECK_MANIFEST_NVIDIA_DRIVER(bpy.types.Operator):
     bl_idname = "blenderai_zealo.trellis_check_manifest_nvidia_driver"
     bl_label = _("Check Nvidia Driver Version if Manifest Min Version", '*') 
@@ -201,6 +260,7 @@ class Trellis_OT_TogglePanel(bpy.types.Operator):
         return {"FINISHED"}
     
 class Trellis_OT_AddImg23DTask(
+    TrellisPreviewMixin, 
     AsyncOperatorMixin, 
     bpy.types.Operator
 ):
@@ -227,10 +287,21 @@ class Trellis_OT_AddImg23DTask(
         items=[
             ("model", _("Model", '*'), ""), 
             ("base_model", _("Base Model", '*'), ""), 
+            ("gaussian", _("Gaussian Splat", '*'), ""), 
         ], 
         default="model"
     )
 
+    speed_tier: bpy.props.EnumProperty(
+        name=_("Speed Tier", '*'), 
+        items=[
+            ("quality", _("Quality", '*'), ""), 
+            ("balanced", _("Balanced", '*'), ""), 
+            ("fast", _("Fast", '*'), ""), 
+        ], 
+        default="quality"
+    )
+
 
 
     def invoke(self, context, event):
@@ -247,6 +318,7 @@ class Trellis_OT_AddImg23DTask(
         layout.prop(self, "image_path")
         layout.prop(self,"preprocess_image")
         layout.prop(self, "output_type")
+        layout.prop(self, "speed_tier")
         
 
     def _check_file_type(self, file_path):
@@ -274,6 +346,7 @@ class Trellis_OT_AddImg23DTask(
         task.image.type = type
         task.image.preprocess_image = self.preprocess_image
         task.output.type = self.output_type
+        task.speed_tier = self.speed_tier
         self.task = task
 
         def add_img23d_task_trellis_thread():
@@ -308,7 +381,7 @@ class Trellisgen_OT_RemoveFailedImg23DTask(bpy.types.Operator):
             return {"FINISHED"}
 
 
-class Trellisgen_OT_RewatchImg23DTask(AsyncOperatorMixin, bpy.types.Operator):
+class Trellisgen_OT_RewatchImg23DTask(TrellisPreviewMixin, AsyncOperatorMixin, bpy.types.Operator):
 
     bl_idname = "blenderai_zealo.trellisgen_rewatch_image_to_3d_task"
     bl_label = _("Rewatch Image to 3D Task", '*')
@@ -323,6 +396,7 @@ class Trellisgen_OT_RewatchImg23DTask(AsyncOperatorMixin, bpy.types.Operator):
             return {"FINISHED"}
         else:
             self.end_token = False
+            self.task = task
             def rewatch_img23d_task_trellis_thread():
                 trellis_generator.rewatch_img23d_task(self, task)
             self.async_thread = threading.Thread(target=rewatch_img23d_task_trellis_thread)
@@ -375,9 +449,9 @@ class Trellis_OT_ImportModelOfImg23DTask(bpy.types.Operator):
         else:
             local_filepath = task.output.local_filepath
             try:
-                bpy.ops.import_scene.gltf(filepath=local_filepath)
+                import_model_file(local_filepath)
             except Exception as e:
-                self.report({"ERROR"}, _("Try to import glb file from: ", '*') + local_filepath + _("But get an error: ", '*') + str(e))
+                self.report({"ERROR"}, _("Try to import model file from: ", '*') + local_filepath + _("But get an error: ", '*') + str(e))
                 return {"CANCELLED"}
             selected_objects = context.selected_objects
             if not selected_objects:
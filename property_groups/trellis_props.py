@@ -41,6 +41,7 @@ class TrellisGenTaskOutputProperties(bpy.types.PropertyGroup):
         items=[
             ("base_model", "", ""), 
             ("model", "", ""), 
+            ("gaussian", "", ""), 
         ],
         default="base_model"
     )
@@ -65,6 +66,13 @@ class TrellisGenTaskOutputProperties(bpy.types.PropertyGroup):
 
     local_filepath: bpy.props.StringProperty()
 
+    # The latest preview downloaded while watching the task, and the object it was imported as
+    preview_url: bpy.props.StringProperty()
+
+    preview_local_filepath: bpy.props.StringProperty()
+
+    preview_object_name: bpy.props.StringProperty()
+
 
 class TrellisGenImageTo3DTaskProperties(bpy.types.PropertyGroup):
 
@@ -92,6 +100,15 @@ class TrellisGenImageTo3DTaskProperties(bpy.types.PropertyGroup):
     
     id: bpy.props.StringProperty() 
 
+    speed_tier: bpy.props.EnumProperty(
+        items=[
+            ("quality", "", ""), 
+            ("balanced", "", ""), 
+            ("fast", "", ""), 
+        ], 
+        default="quality"
+    )
+
     watch_status: bpy.props.EnumProperty(
         name="Task Watch Status", 
         items=[
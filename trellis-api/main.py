@@ -33,13 +33,97 @@ parser.add_argument("--device",
                     default="dynamic",
                     help="Set the device for pipeline, default to dynamic(option which required least vram)")
 
+parser.add_argument("--attn-backend", 
+                    choices=["xformers", "flash_attn", "sdpa", "naive"], 
+                    default="xformers",
+                    help="Set the attention implementation, sdpa and naive run without xformers or flash-attn, default to xformers")
+
+parser.add_argument("--vram-budget", 
+                    type=float, 
+                    default=0,
+                    help="In dynamic device mode, GB of models allowed to stay on the gpu between uses, default to 0(move every model back to cpu after use)")
+
+parser.add_argument("--eviction-policy", 
+                    choices=["next_use", "lru"], 
+                    default="next_use",
+                    help="Which model leaves the gpu first when the vram budget is full, default to next_use(the one needed last)")
+
+parser.add_argument("--prefetch-models", 
+                    action="store_true", 
+                    help="In dynamic device mode, load the models of the next stage while the current stage runs, faster but needs more vram")
+
+parser.add_argument("--batched-cfg", 
+                    action="store_true", 
+                    help="Run the conditional and unconditional passes of classifier-free guidance as one batched forward pass, faster but needs more vram")
+
+parser.add_argument("--texture-preset", 
+                    choices=["quality", "balanced", "fast"], 
+                    default="quality",
+                    help="Trade texture quality for speed when postprocessing the model output type, balanced and fast fill holes and bake from fewer views and stop early, default to quality")
+
+parser.add_argument("--no-previews", 
+                    action="store_true", 
+                    help="Don't publish the voxel and untextured mesh previews of a task before its output is ready")
+
+parser.add_argument("--gzip-downloads", 
+                    action="store_true", 
+                    help="Compress large glb downloads for the clients accepting gzip, only worth it when the client is on another machine")
+
+parser.add_argument("--occupancy-slab-size", 
+                    type=int, 
+                    default=0,
+                    help="Decode the occupancy grid in slabs of this many voxels to bound the vram of large batches, default to 0(whole grid at once)")
+
+parser.add_argument("--compile-flow-model", 
+                    choices=["off", "default", "reduce-overhead"], 
+                    default="off",
+                    help="Compile the sparse structure flow model with torch.compile when the server starts, reduce-overhead also captures cuda graphs in cuda device mode, default to off")
+
+parser.add_argument("--preprocess-workers", 
+                    type=int, 
+                    default=1,
+                    help="Number of worker threads removing image backgrounds, default to 1")
+
+parser.add_argument("--postprocess-workers", 
+                    type=int, 
+                    default=1,
+                    help="Number of worker threads baking and exporting models, default to 1")
+
+parser.add_argument("--stage-queue-size", 
+                    type=int, 
+                    default=2,
+                    help="Max number of jobs waiting between two generation stages, default to 2")
+
+parser.add_argument("--max-batch-size", 
+                    type=int, 
+                    default=1,
+                    help="Max number of queued jobs sampled together as one batch, default to 1(no batching)")
+
+parser.add_argument("--max-batch-wait-ms", 
+                    type=float, 
+                    default=50,
+                    help="How long the sampling stage waits for more jobs to fill a batch, default to 50")
+
+parser.add_argument("--result-cache-size-mb", 
+                    type=float, 
+                    default=2048,
+                    help="Max total size of cached outputs reused by identical requests, 0 disables the cache, default to 2048")
+
+parser.add_argument("--latent-cache-size-mb", 
+                    type=float, 
+                    default=1024,
+                    help="Max total size of cached image conditions and latents kept on disk across restarts, 0 disables the cache, default to 1024")
+
 cmd_args = parser.parse_args()
 
 
 # -------------- Configure Env Vars ----------------
-os.environ['ATTN_BACKEND'] = 'xformers'    # or 'flash-attn'
+os.environ['ATTN_BACKEND'] = cmd_args.attn_backend
 os.environ['SPCONV_ALGO'] = 'native'       # or 'auto'
 os.environ['U2NET_HOME'] = REMBG_MODEL_FOLDER
+# Keep the compiled kernels across restarts, the next starts load them instead of compiling again
+os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR', COMPILE_CACHE_DIR)
+os.environ.setdefault('TORCHINDUCTOR_FX_GRAPH_CACHE', '1')
 
 # -------------- FastAPI ----------------
 
@@ -55,7 +139,28 @@ import ctypes
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Try to launch the trellis generator...")
-    trellis_generator = TrellisGenerator.instance(device=cmd_args.device, precision=cmd_args.precision)
+    trellis_generator = TrellisGenerator.instance(
+        device=cmd_args.device, 
+        precision=cmd_args.precision, 
+        batched_cfg=cmd_args.batched_cfg, 
+        stage_workers={
+            "preprocess": cmd_args.preprocess_workers, 
+            "postprocess": cmd_args.postprocess_workers, 
+        }, 
+        stage_queue_size=cmd_args.stage_queue_size, 
+        max_batch_size=cmd_args.max_batch_size, 
+        max_batch_wait_ms=cmd_args.max_batch_wait_ms, 
+        result_cache_size_mb=cmd_args.result_cache_size_mb, 
+        latent_cache_size_mb=cmd_args.latent_cache_size_mb, 
+        prefetch_models=cmd_args.prefetch_models, 
+        vram_budget_gb=cmd_args.vram_budget, 
+        eviction_policy=cmd_args.eviction_policy, 
+        texture_preset=cmd_args.texture_preset, 
+        previews=not cmd_args.no_previews, 
+        gzip_downloads=cmd_args.gzip_downloads, 
+        occupancy_slab_size=cmd_args.occupancy_slab_size, 
+        compile_flow_model=cmd_args.compile_flow_model, 
+    )
     logger.info("Trellis API Server is active and listening.")
     yield
     trellis_generator.close()
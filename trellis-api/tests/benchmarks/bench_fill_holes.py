@@ -0,0 +1,77 @@
+"""
+Time the visibility and mincut stage of hole filling on a synthetic mesh, an icosphere with a smaller one hidden inside,
+rasterizing one view at a time like before against batches of views, and with adaptive views.
+Only the faces of the outer sphere are visible, so both spheres show whether the visibility is still right.
+
+    python tests/benchmarks/bench_fill_holes.py --device cuda --subdivisions 6 --num-views 1000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import conftest  # noqa: F401, sets up the import paths
+
+import torch
+import trimesh
+from trellis.utils import postprocessing_utils
+
+
+def synthetic_mesh(subdivisions, device):
+    outer = trimesh.creation.icosphere(subdivisions=subdivisions, radius=0.5)
+    inner = trimesh.creation.icosphere(subdivisions=subdivisions - 1, radius=0.3)
+    verts = torch.tensor(list(outer.vertices) + list(inner.vertices), dtype=torch.float32, device=device)
+    faces = torch.tensor(list(outer.faces) + list(inner.faces + len(outer.vertices)), dtype=torch.int32, device=device)
+    return verts, faces, len(outer.faces)
+
+
+def timed(fn, device):
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    out = fn()
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    return time.perf_counter() - start, out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--device",
+                        default="cuda" if torch.cuda.is_available() else "cpu",
+                        help="The device to run on, cpu uses the pure PyTorch rasterizer")
+    parser.add_argument("--subdivisions",
+                        type=int,
+                        default=5,
+                        help="The subdivisions of the outer icosphere, 5 gives 20480 faces")
+    parser.add_argument("--num-views",
+                        type=int,
+                        default=500,
+                        help="The number of views, the max number with adaptive views")
+    parser.add_argument("--resolution",
+                        type=int,
+                        default=512,
+                        help="The resolution of the rasterization, clamped on cpu")
+    args = parser.parse_args()
+
+    verts, faces, num_outer = synthetic_mesh(args.subdivisions, args.device)
+    print(f"{faces.shape[0]} faces, {num_outer} visible, {args.num_views} views on {args.device}")
+
+    batch_size = postprocessing_utils.VISIBILITY_VIEW_BATCH
+    runs = [("one view at a time", 1, False), (f"batches of {batch_size}", batch_size, False), (f"adaptive, batches of {batch_size}", batch_size, True)]
+    for name, view_batch, adaptive in runs:
+        postprocessing_utils.VISIBILITY_VIEW_BATCH = view_batch
+        elapsed, visibility = timed(lambda: postprocessing_utils._compute_visibility(verts, faces, args.resolution, args.num_views, adaptive=adaptive), args.device)
+        seen = (visibility[:num_outer] > 0).float().mean().item()
+        hidden = (visibility[num_outer:] > 0).sum().item()
+        print(f"visibility, {name:<24} {elapsed:7.2f} s  outer faces seen {seen:6.1%}  inner faces seen {hidden}")
+    postprocessing_utils.VISIBILITY_VIEW_BATCH = batch_size
+
+    for adaptive in (False, True):
+        elapsed, (new_verts, new_faces) = timed(lambda: postprocessing_utils._fill_holes(verts, faces, resolution=args.resolution, num_views=args.num_views, adaptive_views=adaptive), args.device)
+        print(f"fill holes, {'adaptive' if adaptive else 'fixed'} views{'':<13} {elapsed:7.2f} s  {new_faces.shape[0]} faces left")
+
+
+if __name__ == "__main__":
+    main()
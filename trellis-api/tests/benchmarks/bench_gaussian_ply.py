@@ -0,0 +1,68 @@
+"""
+Compare the throughput of writing and reading gaussian PLY files with `ply_io` and with plyfile.
+
+    python tests/benchmarks/bench_gaussian_ply.py --num-points 300000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import conftest  # noqa: F401, sets up the import paths
+
+import numpy as np
+from plyfile import PlyData, PlyElement
+from trellis.representations.gaussian.ply_io import iter_vertex_ply, read_vertex_ply, write_vertex_ply
+
+NAMES = ['x', 'y', 'z', 'nx', 'ny', 'nz', 'f_dc_0', 'f_dc_1', 'f_dc_2', 'opacity',
+         'scale_0', 'scale_1', 'scale_2', 'rot_0', 'rot_1', 'rot_2', 'rot_3']
+
+
+def timed(fn):
+    start = time.perf_counter()
+    out = fn()
+    return time.perf_counter() - start, out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-points",
+                        type=int,
+                        default=300000,
+                        help="The number of gaussians")
+    args = parser.parse_args()
+
+    attributes = np.random.randn(args.num_points, len(NAMES)).astype(np.float32)
+    size_mb = attributes.nbytes / 1024 / 1024
+
+    def write_plyfile(path):
+        elements = np.empty(attributes.shape[0], dtype=[(name, 'f4') for name in NAMES])
+        elements[:] = list(map(tuple, attributes))
+        PlyData([PlyElement.describe(elements, 'vertex')]).write(path)
+
+    def read_plyfile(path):
+        ply = PlyData.read(path)
+        return np.stack([np.asarray(ply.elements[0][name]) for name in NAMES], axis=1)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path, plyfile_path = os.path.join(tmp_dir, 'ply_io.ply'), os.path.join(tmp_dir, 'plyfile.ply')
+        results = {
+            'write ply_io': timed(lambda: write_vertex_ply(path, attributes, NAMES))[0],
+            'write plyfile': timed(lambda: write_plyfile(plyfile_path))[0],
+            'stream ply_io': timed(lambda: b"".join(iter_vertex_ply(attributes, NAMES)))[0],
+        }
+        with open(path, 'rb') as f, open(plyfile_path, 'rb') as g:
+            assert f.read() == g.read(), "ply_io and plyfile wrote different files"
+        results['read ply_io'], (_, read) = timed(lambda: read_vertex_ply(path))
+        assert np.array_equal(read, attributes)
+        results['read plyfile'], read = timed(lambda: read_plyfile(path))
+        assert np.array_equal(read, attributes)
+
+    for name, seconds in results.items():
+        print(f"{name:<14} {seconds * 1000:8.1f} ms  {size_mb / seconds:8.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Time building the cameras of `render_multiview` one view at a time, like before, against the batched sequence and look-at,
+and against the cached rig, and check they give the same cameras.
+
+    python tests/benchmarks/bench_multiview_cameras.py --num-views 1000 --device cpu
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import conftest  # noqa: F401, sets up the import paths
+
+import torch
+import utils3d
+from trellis.utils.random_utils import sphere_hammersley_sequence, sphere_hammersley_sequence_batch
+from trellis.utils.render_utils import multiview_cameras, yaw_pitch_r_fov_to_extrinsics_intrinsics
+
+
+def per_view_cameras(nviews, r, fov, device):
+    """The cameras as built before, one sequence point and one look-at per view."""
+    extrinsics, intrinsics = [], []
+    for i in range(nviews):
+        yaw, pitch = sphere_hammersley_sequence(i, nviews)
+        fov_rad = torch.deg2rad(torch.tensor(float(fov))).to(device)
+        yaw = torch.tensor(float(yaw)).to(device)
+        pitch = torch.tensor(float(pitch)).to(device)
+        orig = torch.tensor([
+            torch.sin(yaw) * torch.cos(pitch),
+            torch.cos(yaw) * torch.cos(pitch),
+            torch.sin(pitch),
+        ], device=device) * r
+        extrinsics.append(utils3d.torch.extrinsics_look_at(orig, torch.tensor([0., 0., 0.], device=device), torch.tensor([0., 0., 1.], device=device)))
+        intrinsics.append(utils3d.torch.intrinsics_from_fov_xy(fov_rad, fov_rad))
+    return extrinsics, intrinsics
+
+
+def batched_cameras(nviews, r, fov, device):
+    yaws, pitchs = sphere_hammersley_sequence_batch(nviews)
+    return yaw_pitch_r_fov_to_extrinsics_intrinsics(yaws.tolist(), pitchs.tolist(), r, fov, device=device)
+
+
+def timed(fn, repeats, device):
+    fn()
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        out = fn()
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / repeats, out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-views",
+                        type=int,
+                        default=1000,
+                        help="The number of cameras")
+    parser.add_argument("--device",
+                        default="cpu",
+                        help="The device to build the cameras on")
+    parser.add_argument("--repeats",
+                        type=int,
+                        default=5,
+                        help="The number of timed runs")
+    args = parser.parse_args()
+
+    r, fov = 2, 40
+    runs = [
+        ("per view", lambda: per_view_cameras(args.num_views, r, fov, args.device)),
+        ("batched", lambda: batched_cameras(args.num_views, r, fov, args.device)),
+        ("cached", lambda: multiview_cameras(args.num_views, r=r, fov=fov, device=args.device)),
+    ]
+    results = {name: timed(fn, args.repeats, args.device) for name, fn in runs}
+
+    print(f"{args.num_views} views on {args.device}")
+    reference_time, (reference_extrinsics, reference_intrinsics) = results["per view"]
+    for name, (elapsed, (extrinsics, intrinsics)) in results.items():
+        extrinsics_diff = (torch.stack(extrinsics) - torch.stack(reference_extrinsics)).abs().max().item()
+        intrinsics_diff = (torch.stack(intrinsics) - torch.stack(reference_intrinsics)).abs().max().item()
+        print(f"{name:<10} {elapsed * 1000:9.2f} ms ({reference_time / elapsed:7.1f}x)  max diff {max(extrinsics_diff, intrinsics_diff):.1e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Time computing the window partition of the attention against looking it up in the partition cache,
+fingerprint and coordinate check included, for tensors rebuilt on the same coordinates like in every sampling step.
+
+    python tests/benchmarks/bench_partition_cache.py --num-points 20000 --device cpu
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import conftest  # noqa: F401, sets up the import paths
+
+import torch
+from trellis.modules import sparse as sp
+from trellis.modules.sparse.attention.partition_cache import get_partition
+from trellis.modules.sparse.attention.windowed_attn import calc_window_partition
+
+
+def timed(fn, repeats, device):
+    fn()
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-points",
+                        type=int,
+                        default=20000,
+                        help="The number of active voxels, up to 64^3")
+    parser.add_argument("--window-size",
+                        type=int,
+                        default=8,
+                        help="The window size of the attention")
+    parser.add_argument("--device",
+                        default="cpu",
+                        help="The device to run on")
+    parser.add_argument("--repeats",
+                        type=int,
+                        default=20,
+                        help="The number of timed runs")
+    args = parser.parse_args()
+
+    coords = torch.randperm(64 ** 3)[:args.num_points].sort().values
+    coords = torch.stack([torch.zeros_like(coords), coords // 64 ** 2, coords // 64 % 64, coords % 64], dim=1).int().to(args.device)
+    feats = torch.randn(coords.shape[0], 3, 2, 8, device=args.device)
+    name = f'window_partition_{args.window_size}_(0, 0, 0)'
+
+    def compute():
+        tensor = sp.SparseTensor(feats=feats, coords=coords.clone())
+        return calc_window_partition(tensor, args.window_size)
+
+    def lookup():
+        # A new tensor with a copy of the coordinates, so neither its spatial cache nor the identity check applies
+        tensor = sp.SparseTensor(feats=feats, coords=coords.clone())
+        return get_partition(tensor, name, lambda: calc_window_partition(tensor, args.window_size))
+
+    compute_time = timed(compute, args.repeats, args.device)
+    lookup_time = timed(lookup, args.repeats, args.device)
+    print(f"{coords.shape[0]} voxels, window size {args.window_size} on {args.device}")
+    print(f"compute: {compute_time * 1000:.2f} ms")
+    print(f"cached:  {lookup_time * 1000:.2f} ms ({compute_time / lookup_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Time the full sparse attention on the same variable length inputs with every attention backend available,
+and compare the output of each backend with the one of sdpa.
+The backend is picked when the sparse package is imported, so every backend runs in a process of its own.
+
+    python tests/benchmarks/bench_sparse_attention.py --device cuda --lengths 4000 9000 20000
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import conftest  # noqa: F401, sets up the import paths
+
+import torch
+
+BACKENDS = ['sdpa', 'naive', 'xformers', 'flash_attn']
+# The modules each backend imports, a backend is skipped if they are missing
+BACKEND_MODULES = {'xformers': 'xformers.ops', 'flash_attn': 'flash_attn'}
+
+
+def make_inputs(lengths, heads, channels, device, dtype):
+    generator = torch.Generator().manual_seed(0)
+    coords = torch.cat([
+        torch.cat([torch.full((n, 1), i), torch.randint(0, 64, (n, 3), generator=generator)], dim=1)
+        for i, n in enumerate(lengths)
+    ]).int()
+    qkv = torch.randn(coords.shape[0], 3, heads, channels, generator=generator)
+    return coords.to(device), qkv.to(device, dtype)
+
+
+def run_backend(args):
+    from trellis.modules import sparse as sp
+    from trellis.modules.sparse.attention.full_attn import sparse_scaled_dot_product_attention
+
+    coords, qkv = make_inputs(args.lengths, args.heads, args.channels, args.device, getattr(torch, args.dtype))
+    qkv = sp.SparseTensor(feats=qkv, coords=coords)
+    with torch.no_grad():
+        out = sparse_scaled_dot_product_attention(qkv)
+        if args.device.startswith("cuda"):
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            out = sparse_scaled_dot_product_attention(qkv)
+        if args.device.startswith("cuda"):
+            torch.cuda.synchronize()
+    elapsed = (time.perf_counter() - start) / args.repeats
+    torch.save({'time': elapsed, 'out': out.feats.float().cpu()}, args.output)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lengths",
+                        type=int,
+                        nargs="+",
+                        default=[2000, 4500, 3000],
+                        help="The number of tokens of every sequence of the batch")
+    parser.add_argument("--heads",
+                        type=int,
+                        default=16,
+                        help="The number of attention heads")
+    parser.add_argument("--channels",
+                        type=int,
+                        default=64,
+                        help="The channels of every head")
+    parser.add_argument("--device",
+                        default="cpu",
+                        help="The device to run on")
+    parser.add_argument("--dtype",
+                        choices=["float16", "bfloat16", "float32"],
+                        default="float32",
+                        help="The dtype of the inputs, flash_attn needs float16 or bfloat16")
+    parser.add_argument("--repeats",
+                        type=int,
+                        default=5,
+                        help="The number of timed runs")
+    parser.add_argument("--backend",
+                        choices=BACKENDS,
+                        help=argparse.SUPPRESS)
+    parser.add_argument("--output",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.backend is not None:
+        run_backend(args)
+        return
+
+    print(f"{sum(args.lengths)} tokens in {len(args.lengths)} sequences, {args.heads} heads of {args.channels} channels, {args.dtype} on {args.device}")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for backend in BACKENDS:
+            output = os.path.join(tmp_dir, f"{backend}.pt")
+            env = {**os.environ, 'SPARSE_ATTN_BACKEND': backend}
+            if backend in BACKEND_MODULES:
+                check = subprocess.run([sys.executable, "-c", f"import {BACKEND_MODULES[backend]}"], env=env, capture_output=True)
+                if check.returncode != 0:
+                    print(f"{backend:<12} not available")
+                    continue
+            run = subprocess.run([sys.executable, __file__, *sys.argv[1:], "--backend", backend, "--output", output], env=env, capture_output=True, text=True)
+            if run.returncode != 0:
+                print(f"{backend:<12} failed: {run.stderr.strip().splitlines()[-1]}")
+                continue
+            results[backend] = torch.load(output)
+
+    reference = results.get('sdpa')
+    for backend, result in results.items():
+        line = f"{backend:<12} {result['time'] * 1000:9.2f} ms"
+        if reference is not None:
+            line += f"  max abs diff to sdpa {(result['out'] - reference['out']).abs().max().item():.2e}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
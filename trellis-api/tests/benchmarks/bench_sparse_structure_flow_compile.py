@@ -0,0 +1,88 @@
+"""
+Time a forward pass of the sparse structure flow model in eager and in compiled mode, and compare their outputs.
+
+    python tests/benchmarks/bench_sparse_structure_flow_compile.py --device cpu --model-channels 256
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import conftest  # noqa: F401, sets up the import paths
+
+import torch
+from trellis.models.sparse_structure_flow import SparseStructureFlowModel
+
+
+def bench(model, inputs, steps):
+    with torch.no_grad():
+        model(*inputs)
+        if inputs[0].is_cuda:
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        for _ in range(steps):
+            out = model(*inputs)
+        if inputs[0].is_cuda:
+            torch.cuda.synchronize()
+    return (time.perf_counter() - start) / steps, out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--device",
+                        default="cpu",
+                        help="The device to run on")
+    parser.add_argument("--mode",
+                        choices=["default", "reduce-overhead"],
+                        default="default",
+                        help="The torch.compile mode")
+    parser.add_argument("--model-channels",
+                        type=int,
+                        default=256,
+                        help="The width of the model, the released model is 1024")
+    parser.add_argument("--num-blocks",
+                        type=int,
+                        default=12,
+                        help="The depth of the model, the released model is 24")
+    parser.add_argument("--batch-size",
+                        type=int,
+                        default=1,
+                        help="The batch size")
+    parser.add_argument("--steps",
+                        type=int,
+                        default=25,
+                        help="The number of timed forward passes")
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    model = SparseStructureFlowModel(
+        resolution=16, in_channels=8, model_channels=args.model_channels, cond_channels=1024, out_channels=8,
+        num_blocks=args.num_blocks, num_heads=args.model_channels // 64, patch_size=1,
+    ).eval().to(args.device)
+    with torch.no_grad():
+        for p in model.parameters():
+            p.add_(torch.randn_like(p) * 0.02)
+    inputs = (
+        torch.randn(args.batch_size, 8, 16, 16, 16, device=args.device),
+        torch.full((args.batch_size,), 500.0, device=args.device),
+        torch.randn(args.batch_size, 1374, 1024, device=args.device),
+    )
+
+    eager_time, eager_out = bench(model, inputs, args.steps)
+    if not model.enable_compile(args.mode):
+        print("torch.compile is not supported here")
+        return
+    start = time.perf_counter()
+    with torch.no_grad():
+        model(*inputs)
+    compile_time = time.perf_counter() - start
+    compiled_time, compiled_out = bench(model, inputs, args.steps)
+
+    print(f"eager:    {eager_time * 1000:.1f} ms/step")
+    print(f"compiled: {compiled_time * 1000:.1f} ms/step ({eager_time / compiled_time:.2f}x), first call {compile_time:.1f} s")
+    print(f"max abs diff: {(eager_out - compiled_out).abs().max().item():.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Compare the throughput of one worker running whole jobs with the staged scheduler of `TrellisGenerator`,
+on stub stages sleeping as long as the real ones take, so no model or gpu is needed.
+The stub sampling and decoding stages share a lock like the gpu stages do.
+
+    python tests/benchmarks/bench_staged_scheduler.py --jobs 40 --max-batch-size 4
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import conftest  # noqa: F401, sets up the import paths
+
+from trellis_codebase.scheduler import StagedScheduler
+
+
+class StubPipeline:
+    """Sleeps through the stages of a job, the sampling time of a batch grows by `sampling_extra_s` per extra job."""
+    def __init__(self, args):
+        self.args = args
+
+    def preprocess(self, job):
+        time.sleep(self.args.preprocess_s)
+        return job
+
+    def sampling(self, jobs):
+        time.sleep(self.args.sampling_s + self.args.sampling_extra_s * (len(jobs) - 1))
+        return jobs
+
+    def decoding(self, job):
+        time.sleep(self.args.decoding_s)
+        return job
+
+    def postprocess(self, job):
+        time.sleep(self.args.postprocess_s)
+        return job
+
+    def whole_job(self, job):
+        return self.postprocess(self.decoding(self.sampling([self.preprocess(job)])[0]))
+
+
+def run(scheduler: StagedScheduler, num_jobs: int) -> float:
+    scheduler.start()
+    start = time.perf_counter()
+    for i in range(num_jobs):
+        scheduler.submit(i)
+    scheduler.join()
+    return time.perf_counter() - start
+
+
+def single_worker(pipeline: StubPipeline, num_jobs: int) -> float:
+    scheduler = StagedScheduler(on_failed=print)
+    scheduler.add_stage("job", pipeline.whole_job)
+    return run(scheduler, num_jobs)
+
+
+def staged(pipeline: StubPipeline, num_jobs: int, args) -> float:
+    # Same stages and settings as `TrellisGenerator._initial_scheduler`
+    gpu_lock = threading.Lock()
+    scheduler = StagedScheduler(on_failed=print)
+    scheduler.add_stage("preprocess", pipeline.preprocess, workers=args.preprocess_workers)
+    scheduler.add_stage(
+        "sampling",
+        pipeline.sampling,
+        queue_size=max(args.queue_size, args.max_batch_size),
+        lock=gpu_lock,
+        batched=True,
+        batch_size=args.max_batch_size,
+        max_wait_ms=args.max_batch_wait_ms,
+    )
+    scheduler.add_stage("decoding", pipeline.decoding, queue_size=args.queue_size, lock=gpu_lock)
+    scheduler.add_stage("postprocess", pipeline.postprocess, workers=args.postprocess_workers, queue_size=args.queue_size)
+    return run(scheduler, num_jobs)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs",
+                        type=int,
+                        default=20,
+                        help="The number of jobs submitted at once")
+    parser.add_argument("--preprocess-s",
+                        type=float,
+                        default=0.3,
+                        help="The time of the preprocess stage, background removal on cpu")
+    parser.add_argument("--sampling-s",
+                        type=float,
+                        default=0.6,
+                        help="The time of the sampling stage for one job")
+    parser.add_argument("--sampling-extra-s",
+                        type=float,
+                        default=0.2,
+                        help="The extra sampling time of every other job of a batch")
+    parser.add_argument("--decoding-s",
+                        type=float,
+                        default=0.2,
+                        help="The time of the decoding stage")
+    parser.add_argument("--postprocess-s",
+                        type=float,
+                        default=0.5,
+                        help="The time of the postprocess stage, simplification, baking and export")
+    parser.add_argument("--preprocess-workers",
+                        type=int,
+                        default=1,
+                        help="The workers of the preprocess stage")
+    parser.add_argument("--postprocess-workers",
+                        type=int,
+                        default=1,
+                        help="The workers of the postprocess stage")
+    parser.add_argument("--queue-size",
+                        type=int,
+                        default=2,
+                        help="The max number of jobs waiting in front of a stage")
+    parser.add_argument("--max-batch-size",
+                        type=int,
+                        default=1,
+                        help="The max number of jobs sampled in one batch")
+    parser.add_argument("--max-batch-wait-ms",
+                        type=float,
+                        default=50,
+                        help="How long the sampling stage waits to fill a batch")
+    args = parser.parse_args()
+
+    pipeline = StubPipeline(args)
+    for name, elapsed in [("single worker", single_worker(pipeline, args.jobs)), ("staged", staged(pipeline, args.jobs, args))]:
+        print(f"{name:<14} {elapsed:7.2f} s  {args.jobs / elapsed * 3600:8.0f} jobs/hour")
+
+
+if __name__ == "__main__":
+    main()
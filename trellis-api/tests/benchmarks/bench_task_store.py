@@ -0,0 +1,88 @@
+"""
+Measure the updates/s of generator threads writing task progress to the task store,
+while watchers read the tasks back with `aread_item` from an event loop, on a temporary database.
+
+    python tests/benchmarks/bench_task_store.py --writers 4 --readers 16 --seconds 5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import conftest  # noqa: F401, sets up the import paths
+
+from trellis_codebase.models import Img23DTask, SqliteImg23dTask
+
+
+def writer(store: SqliteImg23dTask, task: Img23DTask, stop: threading.Event, counts: list, i: int):
+    while not stop.is_set():
+        task.progress = (task.progress + 1) % 100
+        store.update_item(task)
+        counts[i] += 1
+
+
+async def reader(store: SqliteImg23dTask, tids: list, stop: threading.Event, counts: list, i: int):
+    while not stop.is_set():
+        task = await store.aread_item(tids[counts[i] % len(tids)])
+        assert task is not None
+        counts[i] += 1
+
+
+async def read_all(store: SqliteImg23dTask, tids: list, stop: threading.Event, counts: list):
+    await asyncio.gather(*(reader(store, tids, stop, counts, i) for i in range(len(counts))))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writers",
+                        type=int,
+                        default=4,
+                        help="The number of threads writing task updates, like the generator stages")
+    parser.add_argument("--readers",
+                        type=int,
+                        default=16,
+                        help="The number of watchers reading the tasks from the event loop")
+    parser.add_argument("--seconds",
+                        type=float,
+                        default=5,
+                        help="How long to run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = SqliteImg23dTask.instance()
+        store.db_path = os.path.join(tmp_dir, "trellis.db")
+        store.create_table()
+        tasks = []
+        for _ in range(args.writers):
+            task = Img23DTask(image_type="png", image_token=uuid.uuid4().hex, preprocess_image=True, output_type="model", tid=uuid.uuid4().hex)
+            store.create_item(task)
+            tasks.append(task)
+
+        stop = threading.Event()
+        write_counts = [0] * args.writers
+        read_counts = [0] * args.readers
+        threads = [threading.Thread(target=writer, args=(store, task, stop, write_counts, i)) for i, task in enumerate(tasks)]
+        timer = threading.Timer(args.seconds, stop.set)
+        start = time.perf_counter()
+        timer.start()
+        for thread in threads:
+            thread.start()
+        if args.readers:
+            asyncio.run(read_all(store, [task.tid for task in tasks], stop, read_counts))
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        store.drop_table()
+
+    print(f"{args.writers} writer thread(s), {args.readers} reader(s), {elapsed:.1f} s")
+    print(f"updates/s: {sum(write_counts) / elapsed:10.0f}")
+    print(f"reads/s:   {sum(read_counts) / elapsed:10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Compare the speed tiers of the image to 3d pipeline with the quality tier on real images, needs the model weights and a gpu.
+Every tier samples from the same noise, for every image and tier it reports the sampling time and model evaluations,
+the IoU of the occupied voxels and the Chamfer distance of the voxels and of the mesh vertices to the ones of the quality tier.
+
+    python tests/benchmarks/eval_speed_tiers.py image_1.png image_2.png
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import torch
+from PIL import Image
+from trellis_codebase.trellis.pipelines import TrellisImageTo3DPipeline
+from trellis_codebase.utils import TRELLIS_IMAGE_LARGE_REPO_DIR
+
+
+def chamfer_distance(a: torch.Tensor, b: torch.Tensor, chunk: int = 4096) -> float:
+    """The symmetric Chamfer distance, the mean distance of every point to the closest point of the other set."""
+    def one_way(x, y):
+        return torch.cat([torch.cdist(x[i:i + chunk], y).min(dim=1).values for i in range(0, x.shape[0], chunk)]).mean()
+    return ((one_way(a, b) + one_way(b, a)) / 2).item()
+
+
+def voxel_iou(a: torch.Tensor, b: torch.Tensor) -> float:
+    resolution = int(max(a.max(), b.max())) + 1
+    keys_a = ((a[:, 0] * resolution + a[:, 1]) * resolution + a[:, 2]).unique()
+    keys_b = ((b[:, 0] * resolution + b[:, 1]) * resolution + b[:, 2]).unique()
+    intersection = torch.isin(keys_a, keys_b).sum().item()
+    return intersection / (len(keys_a) + len(keys_b) - intersection)
+
+
+def subsample(points: torch.Tensor, max_points: int) -> torch.Tensor:
+    if points.shape[0] <= max_points:
+        return points
+    indices = torch.randperm(points.shape[0], generator=torch.Generator().manual_seed(0))[:max_points]
+    return points[indices.to(points.device)]
+
+
+class CountCalls:
+    """Count the forward passes of a model."""
+    def __init__(self, model):
+        self.calls = 0
+        self._forward = model.forward
+        model.forward = self
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        return self._forward(*args, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("images",
+                        nargs="+",
+                        help="The image prompts")
+    parser.add_argument("--model",
+                        default=TRELLIS_IMAGE_LARGE_REPO_DIR,
+                        help="The folder of the pipeline weights")
+    parser.add_argument("--precision",
+                        choices=["float16", "float32"],
+                        default="float16",
+                        help="The precision of the models")
+    parser.add_argument("--seed",
+                        type=int,
+                        default=42,
+                        help="The random seed of every tier")
+    parser.add_argument("--max-points",
+                        type=int,
+                        default=20000,
+                        help="The number of mesh vertices compared at most")
+    args = parser.parse_args()
+
+    pipeline = TrellisImageTo3DPipeline.from_pretrained(args.model)
+    pipeline.cuda()
+    if args.precision == "float16":
+        pipeline.to(torch.float16)
+        pipeline.models['image_cond_model'].half()
+    pipeline.device_mode = "cuda"
+    counters = {name: CountCalls(pipeline.models[name]) for name in ['sparse_structure_flow_model', 'slat_flow_model']}
+
+    print(f"{'image':<24} {'tier':<10} {'time (s)':>9} {'evals':>6} {'voxel IoU':>10} {'voxel CD':>9} {'mesh CD':>9}")
+    for image_path in args.images:
+        image = pipeline.preprocess_image(Image.open(image_path))
+        cond = pipeline.get_cond([image])
+        results = {}
+        for tier, params in pipeline.speed_tiers.items():
+            for counter in counters.values():
+                counter.calls = 0
+            generators = [torch.Generator().manual_seed(args.seed)]
+            torch.cuda.synchronize()
+            start = time.perf_counter()
+            with torch.no_grad():
+                coords = pipeline.sample_sparse_structure(cond, 1, params['sparse_structure'], generators)
+                slat = pipeline.sample_slat(cond, coords, params['slat'], generators)
+            torch.cuda.synchronize()
+            elapsed = time.perf_counter() - start
+            with torch.no_grad():
+                mesh = pipeline.decode_slat(slat, ['mesh'])['mesh'][0]
+            evals = sum(counter.calls for counter in counters.values())
+            results[tier] = (elapsed, evals, coords[:, 1:], subsample(mesh.vertices.float(), args.max_points))
+
+        _, _, quality_coords, quality_vertices = results['quality']
+        for tier, (elapsed, evals, coords, vertices) in results.items():
+            # Voxel distances in voxels, mesh distances in the unit cube of the asset
+            voxel_cd = chamfer_distance(coords.float(), quality_coords.float())
+            mesh_cd = chamfer_distance(vertices, quality_vertices)
+            iou = voxel_iou(coords, quality_coords)
+            print(f"{os.path.basename(image_path):<24} {tier:<10} {elapsed:>9.2f} {evals:>6} {iou:>10.4f} {voxel_cd:>9.4f} {mesh_cd:>9.5f}")
+
+
+if __name__ == "__main__":
+    main()
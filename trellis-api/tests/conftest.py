@@ -0,0 +1,27 @@
+import os
+import sys
+import types
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CODEBASE_DIR = os.path.join(API_DIR, "trellis_codebase")
+for path in (API_DIR, CODEBASE_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# The tests run on cpu, where flash_attn and xformers are not available
+os.environ.setdefault("ATTN_BACKEND", "sdpa")
+
+try:
+    import trellis
+except ImportError:
+    # Without the gpu only packages (nvdiffrast, kaolin, ...) the package can't import all its subpackages eagerly,
+    # so register the packages without running their __init__, the tests import the modules they cover directly
+    for name in [name for name in sys.modules if name == "trellis" or name.startswith("trellis.")]:
+        del sys.modules[name]
+    for name in ["trellis", "trellis.models", "trellis.modules", "trellis.pipelines", "trellis.representations", "trellis.utils"]:
+        package = types.ModuleType(name)
+        package.__path__ = [os.path.join(CODEBASE_DIR, *name.split("."))]
+        sys.modules[name] = package
+        if "." in name:
+            parent, child = name.rsplit(".", 1)
+            setattr(sys.modules[parent], child, package)
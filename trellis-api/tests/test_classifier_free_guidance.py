@@ -0,0 +1,91 @@
+import pytest
+import torch
+
+from trellis.models.sparse_structure_flow import SparseStructureFlowModel
+from trellis.pipelines.samplers import FlowEulerCfgSampler, FlowEulerGuidanceIntervalSampler
+
+SAMPLER_PARAMS = {'steps': 4, 'cfg_strength': 3.0, 'rescale_t': 3.0, 'verbose': False}
+
+
+def _model():
+    torch.manual_seed(0)
+    model = SparseStructureFlowModel(
+        resolution=8, in_channels=4, model_channels=32, cond_channels=16, out_channels=4,
+        num_blocks=2, num_heads=2, patch_size=2,
+    ).eval()
+    # The output layer is zero initialized
+    with torch.no_grad():
+        for p in model.parameters():
+            p.add_(torch.randn_like(p) * 0.02)
+    return model
+
+
+def _inputs(batch_size=2):
+    torch.manual_seed(1)
+    noise = torch.randn(batch_size, 4, 8, 8, 8)
+    cond = torch.randn(batch_size, 6, 16)
+    return noise, cond, torch.zeros_like(cond)
+
+
+@pytest.mark.parametrize("sampler_cls, params", [
+    (FlowEulerCfgSampler, {}),
+    (FlowEulerGuidanceIntervalSampler, {'cfg_interval': [0.5, 0.95]}),
+    (FlowEulerGuidanceIntervalSampler, {'cfg_interval': [0.5, 0.95], 'solver': 'heun'}),
+])
+def test_batched_cfg_matches_two_passes(sampler_cls, params):
+    model = _model()
+    noise, cond, neg_cond = _inputs()
+    sampler = sampler_cls(sigma_min=1e-5)
+    expected = sampler.sample(model, noise, cond, neg_cond, **SAMPLER_PARAMS, **params).samples
+    sampler.batched_cfg = True
+    samples = sampler.sample(model, noise, cond, neg_cond, **SAMPLER_PARAMS, **params).samples
+    torch.testing.assert_close(samples, expected, rtol=1e-4, atol=1e-5)
+
+
+def test_batched_cfg_out_of_memory_falls_back_per_call(monkeypatch):
+    model = _model()
+    noise, cond, neg_cond = _inputs()
+    sampler = FlowEulerCfgSampler(sigma_min=1e-5)
+    expected = sampler.sample(model, noise, cond, neg_cond, **SAMPLER_PARAMS).samples
+
+    sampler.batched_cfg = True
+    batched_cfg_inference_model = sampler._batched_cfg_inference_model
+    calls = []
+    def out_of_memory_once(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise torch.cuda.OutOfMemoryError("out of memory")
+        return batched_cfg_inference_model(*args, **kwargs)
+    monkeypatch.setattr(sampler, "_batched_cfg_inference_model", out_of_memory_once)
+    samples = sampler.sample(model, noise, cond, neg_cond, **SAMPLER_PARAMS).samples
+
+    assert sampler.batched_cfg
+    assert len(calls) == SAMPLER_PARAMS['steps']
+    torch.testing.assert_close(samples, expected, rtol=1e-4, atol=1e-5)
+
+
+def test_batched_cfg_matches_two_passes_sparse():
+    pytest.importorskip("spconv.pytorch")
+    from trellis.modules import sparse as sp
+
+    def model(x_t, t, cond):
+        # A prediction depending on the features, the timestep and the condition of every batch item
+        scale = cond.mean(dim=(1, 2))[x_t.coords[:, 0].long()]
+        return x_t.replace(torch.tanh(x_t.feats * scale[:, None] + t[0] / 1000))
+
+    torch.manual_seed(0)
+    coords = torch.cat([
+        torch.cat([torch.full((n, 1), i), torch.randint(0, 16, (n, 3))], dim=1)
+        for i, n in enumerate([50, 70])
+    ]).int()
+    noise = sp.SparseTensor(feats=torch.randn(coords.shape[0], 8), coords=coords)
+    cond = torch.randn(2, 6, 16)
+    neg_cond = torch.zeros_like(cond)
+
+    sampler = FlowEulerCfgSampler(sigma_min=1e-5)
+    expected = sampler.sample(model, noise, cond, neg_cond, **SAMPLER_PARAMS).samples
+    sampler.batched_cfg = True
+    samples = sampler.sample(model, noise, cond, neg_cond, **SAMPLER_PARAMS).samples
+    assert torch.equal(samples.coords, expected.coords)
+    assert samples.layout == expected.layout
+    torch.testing.assert_close(samples.feats, expected.feats)
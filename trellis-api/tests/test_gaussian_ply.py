@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+import torch
+
+utils3d = pytest.importorskip("utils3d")
+if not hasattr(utils3d, "numpy"):
+    pytest.skip("needs the utils3d used by TRELLIS", allow_module_level=True)
+plyfile = pytest.importorskip("plyfile")
+
+from trellis.representations.gaussian import Gaussian
+from trellis.representations.gaussian.ply_io import read_vertex_ply
+
+
+def _gaussian(num_points=1000):
+    torch.manual_seed(0)
+    gaussian = Gaussian(aabb=[-0.5, -0.5, -0.5, 1.0, 1.0, 1.0], device="cpu")
+    gaussian.from_xyz(torch.rand(num_points, 3) - 0.5)
+    gaussian.from_features(torch.rand(num_points, 1, 3))
+    gaussian.from_opacity(torch.rand(num_points, 1) * 0.98 + 0.01)
+    gaussian.from_scaling(torch.rand(num_points, 3) * 0.02 + 0.001)
+    gaussian.from_rotation(torch.nn.functional.normalize(torch.randn(num_points, 4)))
+    return gaussian
+
+
+def _rotation_matrices(gaussian):
+    return utils3d.numpy.quaternion_to_matrix(gaussian.get_rotation.numpy())
+
+
+@pytest.mark.parametrize("transform", [None, [[1, 0, 0], [0, 0, -1], [0, 1, 0]]])
+def test_save_load_round_trip(tmp_path, transform):
+    gaussian = _gaussian()
+    path = str(tmp_path / "gaussian.ply")
+    gaussian.save_ply(path, transform=transform)
+    loaded = Gaussian(aabb=[-0.5, -0.5, -0.5, 1.0, 1.0, 1.0], device="cpu")
+    loaded.load_ply(path, transform=transform)
+
+    torch.testing.assert_close(loaded.get_xyz, gaussian.get_xyz, rtol=0, atol=1e-6)
+    torch.testing.assert_close(loaded.get_features, gaussian.get_features)
+    torch.testing.assert_close(loaded.get_opacity, gaussian.get_opacity, rtol=1e-5, atol=1e-6)
+    torch.testing.assert_close(loaded.get_scaling, gaussian.get_scaling, rtol=1e-5, atol=1e-6)
+    # A quaternion and its negation are the same rotation
+    np.testing.assert_allclose(_rotation_matrices(loaded), _rotation_matrices(gaussian), atol=1e-5)
+
+
+def test_save_ply_matches_plyfile(tmp_path):
+    gaussian = _gaussian()
+    names, attributes = gaussian.to_ply_attributes()
+    path = str(tmp_path / "gaussian.ply")
+    gaussian.save_ply(path)
+
+    # Written the way the gaussians were saved before, one structured element through plyfile
+    elements = np.empty(attributes.shape[0], dtype=[(name, "f4") for name in names])
+    elements[:] = list(map(tuple, attributes))
+    plyfile_path = str(tmp_path / "plyfile.ply")
+    plyfile.PlyData([plyfile.PlyElement.describe(elements, "vertex")]).write(plyfile_path)
+    with open(path, "rb") as f, open(plyfile_path, "rb") as g:
+        assert f.read() == g.read()
+
+    ply = plyfile.PlyData.read(path)
+    np.testing.assert_array_equal(np.stack([np.asarray(ply.elements[0][name]) for name in names], axis=1), attributes)
+    read_names, read_attributes = read_vertex_ply(plyfile_path)
+    assert read_names == names
+    np.testing.assert_array_equal(read_attributes, attributes)
+
+
+def test_iter_ply_matches_save_ply(tmp_path):
+    gaussian = _gaussian()
+    path = str(tmp_path / "gaussian.ply")
+    gaussian.save_ply(path)
+    with open(path, "rb") as f:
+        assert b"".join(bytes(chunk) for chunk in gaussian.iter_ply(chunk_bytes=1000)) == f.read()
+
+
+def test_read_ascii_ply(tmp_path):
+    names = ["x", "y", "z", "opacity"]
+    attributes = np.random.rand(10, len(names)).astype(np.float32)
+    elements = np.empty(attributes.shape[0], dtype=[(name, "f4") for name in names])
+    elements[:] = list(map(tuple, attributes))
+    path = str(tmp_path / "ascii.ply")
+    plyfile.PlyData([plyfile.PlyElement.describe(elements, "vertex")], text=True).write(path)
+    read_names, read_attributes = read_vertex_ply(path)
+    assert read_names == names
+    np.testing.assert_allclose(read_attributes, attributes, rtol=1e-6)
@@ -0,0 +1,96 @@
+import pytest
+import torch
+import torch.nn as nn
+
+from trellis.pipelines.model_residency import ModelResidencyManager, plan_evictions
+
+
+def _models(*names, numel=100):
+    """Models of `numel` float32 weights each, so every footprint is 4 * numel bytes."""
+    models = {}
+    for name in names:
+        model = nn.Module()
+        model.weight = nn.Parameter(torch.zeros(numel))
+        models[name] = model
+    return models
+
+
+def _weights(models):
+    return {name: (model.weight.device, model.weight.data_ptr()) for name, model in models.items()}
+
+
+def test_prefetch_is_disabled_by_default():
+    manager = ModelResidencyManager(_models("a", "b"), device="cpu", vram_budget=1000)
+    manager.prefetch(["a"])
+    assert list(manager.resident) == []
+
+
+def test_prefetch_on_cpu_only_keeps_the_books():
+    models = _models("a", "b", "c")
+    weights = _weights(models)
+    # Room for two models
+    manager = ModelResidencyManager(models, device="cpu", vram_budget=800, prefetch=True)
+    manager.prefetch(["a", "b"])
+    assert list(manager.resident) == ["a", "b"]
+    # Prefetched models are kept for their use, so there is no room to prefetch another one
+    manager.prefetch(["c"])
+    assert list(manager.resident) == ["a", "b"]
+    with manager.use(["a"]):
+        assert manager.trim() == []
+    assert list(manager.resident) == ["b", "a"]
+    # No tensor moved
+    assert _weights(models) == weights
+
+
+def test_evict_all_keeps_the_models_in_use():
+    models = _models("a", "b")
+    weights = _weights(models)
+    manager = ModelResidencyManager(models, device="cpu", vram_budget=800, prefetch=True)
+    manager.prefetch(["b"])
+    with manager.use(["a"]):
+        manager.evict_all()
+        assert list(manager.resident) == ["a"]
+    manager.evict_all()
+    assert list(manager.resident) == []
+    assert _weights(models) == weights
+
+
+FOOTPRINTS = {"a": 100, "b": 100, "c": 100, "d": 100}
+USE_ORDER = ["a", "b", "c", "d"]
+
+
+def test_plan_evictions_lru_evicts_the_least_recently_used_first():
+    assert plan_evictions(["a", "b", "c"], FOOTPRINTS, budget=200, extra_bytes=100) == ["a", "b"]
+    assert plan_evictions(["a", "b", "c"], FOOTPRINTS, budget=200, extra_bytes=100, protected=["a"]) == ["b", "c"]
+    assert plan_evictions(["a", "b", "c"], FOOTPRINTS, budget=300) == []
+
+
+def test_plan_evictions_next_use_evicts_the_model_needed_last():
+    # After b, the job uses c, then d, then a, and b last
+    kwargs = dict(budget=250, policy="next_use", use_order=USE_ORDER, last_used="b")
+    assert plan_evictions(["a", "b", "c"], FOOTPRINTS, **kwargs) == ["b"]
+    assert plan_evictions(["a", "b", "c"], FOOTPRINTS, extra_bytes=100, **kwargs) == ["b", "a"]
+    assert plan_evictions(["a", "b", "c"], FOOTPRINTS, budget=250) == ["a"]
+
+
+@pytest.mark.parametrize("policy, evicted", [("lru", "b"), ("next_use", "a")])
+def test_manager_evicts_by_policy_under_a_fake_device_capacity(policy, evicted):
+    models = _models("a", "b", "c", "d")
+    # Room for two of the 400 bytes models
+    manager = ModelResidencyManager(models, device="cpu", vram_budget=1000, policy=policy, use_order=USE_ORDER, device_capacity=1000)
+    for name in ["a", "b", "a"]:
+        with manager.use([name]):
+            pass
+    assert list(manager.resident) == ["b", "a"]
+    with manager.use(["c"]):
+        assert set(manager.resident) == {"a", "b", "c"} - {evicted}
+    assert manager.resident_bytes <= manager.vram_budget
+
+
+def test_budget_is_clamped_to_the_device_capacity():
+    manager = ModelResidencyManager(_models("a", "b", "c"), device="cpu", vram_budget=10_000, device_capacity=800)
+    assert manager.vram_budget == 800
+    for name in ["a", "b", "c"]:
+        with manager.use([name]):
+            pass
+    assert list(manager.resident) == ["b", "c"]
@@ -0,0 +1,48 @@
+import pytest
+import torch
+
+pytest.importorskip("spconv.pytorch")
+from trellis.modules import sparse as sp
+from trellis.modules.sparse.attention import partition_cache
+from trellis.modules.sparse.attention.windowed_attn import calc_window_partition
+
+
+def _tensor(seed, num_points=500):
+    generator = torch.Generator().manual_seed(seed)
+    coords = torch.randint(0, 64, (num_points, 3), generator=generator).unique(dim=0)
+    coords = torch.cat([torch.zeros(coords.shape[0], 1, dtype=coords.dtype), coords], dim=1).int()
+    return sp.SparseTensor(feats=torch.randn(coords.shape[0], 3, 2, 8), coords=coords)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    sp.clear_partition_cache()
+    yield
+    sp.clear_partition_cache()
+
+
+def _get_partition(tensor, calls):
+    def calc():
+        calls.append(1)
+        return calc_window_partition(tensor, 8)
+    return partition_cache.get_partition(tensor, 'window_partition_8_(0, 0, 0)', calc)
+
+
+def test_tensors_of_equal_coords_share_partitions():
+    calls = []
+    first = _get_partition(_tensor(0), calls)
+    # Rebuilt from a copy of the coordinates, like a tensor of the next sampling step
+    second = _get_partition(_tensor(0), calls)
+    assert len(calls) == 1
+    assert second is first
+
+
+def test_colliding_fingerprints_are_recomputed(monkeypatch):
+    monkeypatch.setattr(partition_cache, "coords_fingerprint", lambda tensor: (0,))
+    calls = []
+    tensor, other = _tensor(0), _tensor(1)
+    _get_partition(tensor, calls)
+    partition = _get_partition(other, calls)
+    assert len(calls) == 2
+    for got, expected in zip(partition, calc_window_partition(other, 8)):
+        assert got == expected if isinstance(expected, list) else torch.equal(got, expected)
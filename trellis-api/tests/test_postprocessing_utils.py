@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+import torch
+
+postprocessing_utils = pytest.importorskip("trellis.utils.postprocessing_utils")
+
+
+def _segments(num_items=200, num_segments=7):
+    generator = torch.Generator().manual_seed(0)
+    values = torch.rand(num_items, generator=generator)
+    # Every segment has at least one item, some have a single one
+    labels = torch.cat([torch.arange(num_segments), torch.randint(0, num_segments - 2, (num_items - num_segments,), generator=generator)])
+    labels = labels[torch.randperm(num_items, generator=generator)]
+    return values, labels, num_segments
+
+
+@pytest.mark.parametrize("q", [0.0, 0.25, 0.5, 0.75, 1.0])
+def test_segment_quantile_matches_every_segment(q):
+    values, labels, num_segments = _segments()
+    quantiles = postprocessing_utils._segment_quantile(values, labels, num_segments, q)
+    expected = [np.quantile(values[labels == i].numpy(), q) for i in range(num_segments)]
+    np.testing.assert_allclose(quantiles.numpy(), expected, rtol=1e-6)
+
+
+def test_segment_median_matches_every_segment():
+    values, labels, num_segments = _segments()
+    medians = postprocessing_utils._segment_median(values, labels, num_segments)
+    # The lower median, like torch.median
+    expected = [np.sort(values[labels == i].numpy())[(int((labels == i).sum()) - 1) // 2] for i in range(num_segments)]
+    np.testing.assert_array_equal(medians.numpy(), expected)
+
+
+def test_segment_labels():
+    segments = [torch.tensor([3, 0]), torch.tensor([4])]
+    labels = postprocessing_utils._segment_labels(segments, 6, torch.device('cpu'))
+    assert labels.tolist() == [0, -1, -1, 0, 1, -1]
+
+
+def test_cpu_rasterizer_keeps_the_nearest_face():
+    # Two views of a far triangle covering the left half and a near one covering the bottom half, of opposite windings
+    pos_clip = torch.tensor([
+        [-1.0, -1.0, 0.5, 1.0], [0.0, -1.0, 0.5, 1.0], [-1.0, 1.0, 0.5, 1.0],
+        [-1.0, -1.0, -0.5, 1.0], [-1.0, 0.0, -0.5, 1.0], [1.0, -1.0, -0.5, 1.0],
+    ]).repeat(2, 1, 1)
+    faces = torch.tensor([[0, 1, 2], [3, 4, 5]], dtype=torch.int32)
+    face_ids = postprocessing_utils._rasterize_face_ids_cpu(pos_clip, faces, 16)
+    assert face_ids.shape == (2, 16, 16)
+    assert torch.equal(face_ids[0], face_ids[1])
+    # Rows are y, columns are x, both triangles cover the pixel (2, 2)
+    assert face_ids[0, 2, 2] == 1
+    assert face_ids[0, 8, 1] == 0
+    assert face_ids[0, 2, 12] == -1
+    assert face_ids[0, 14, 14] == -1
+    assert set(face_ids.unique().tolist()) == {-1, 0, 1}
+    # Chunking the candidate pixels gives the same result
+    assert torch.equal(postprocessing_utils._rasterize_face_ids_cpu(pos_clip, faces, 16, max_pairs=50), face_ids)
@@ -0,0 +1,22 @@
+import pytest
+import torch
+
+
+def test_multiview_cameras_are_copies():
+    render_utils = pytest.importorskip("trellis.utils.render_utils")
+    extrinsics, intrinsics = render_utils.multiview_cameras(4, device='cpu')
+    assert extrinsics[0].device.type == 'cpu'
+    expected = extrinsics[0].clone()
+    extrinsics[0].zero_()
+    intrinsics[0].zero_()
+    extrinsics, intrinsics = render_utils.multiview_cameras(4, device='cpu')
+    torch.testing.assert_close(extrinsics[0], expected)
+    assert intrinsics[0].abs().sum() > 0
+
+
+def test_visibility_views_are_copies():
+    postprocessing_utils = pytest.importorskip("trellis.utils.postprocessing_utils")
+    views = postprocessing_utils._visibility_views(8, True, torch.device('cpu'))
+    expected = views.clone()
+    views.zero_()
+    torch.testing.assert_close(postprocessing_utils._visibility_views(8, True, torch.device('cpu')), expected)
@@ -0,0 +1,39 @@
+import os
+
+from trellis_codebase.result_cache import ResultCache
+
+
+def _output(output_dir, token, size):
+    path = os.path.join(output_dir, f"{token}.glb")
+    with open(path, "wb") as f:
+        f.write(os.urandom(size))
+    return path
+
+
+def test_eviction_keeps_task_outputs(tmp_path):
+    output_dir = tmp_path / "outputs"
+    output_dir.mkdir()
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=1500)
+    first = _output(output_dir, "first", 1000)
+    cache.put("a", "glb", first)
+    cache.put("b", "glb", _output(output_dir, "second", 1000))
+
+    assert cache.get("a") is None
+    assert os.path.exists(first)
+    assert cache.stats()["entries"] == 1
+
+
+def test_restore_links_the_cached_output(tmp_path):
+    output_dir = tmp_path / "outputs"
+    output_dir.mkdir()
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=10000)
+    first = _output(output_dir, "first", 1000)
+    cache.put("a", "glb", first)
+    os.remove(first)
+
+    entry = cache.restore("a", str(output_dir), "second")
+    assert entry["extension"] == "glb"
+    with open(output_dir / "second.glb", "rb") as f, open(entry["path"], "rb") as g:
+        assert f.read() == g.read()
+    assert cache.restore("b", str(output_dir), "third") is None
+    assert not os.path.exists(output_dir / "third.glb")
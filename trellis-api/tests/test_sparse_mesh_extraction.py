@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+import torch
+
+pytest.importorskip("spconv.pytorch")
+from trellis.modules import sparse as sp
+from trellis.representations.mesh import SparseFeatures2Mesh
+from trellis.representations.mesh.utils_cube import cube_corners
+
+RES = 16
+
+
+def _blob(center, radius, generator, noise=0.02):
+    """The cubes around a noisy sphere, with the sdf of the sphere on their corners and random other features."""
+    grid = torch.stack(torch.meshgrid(*[torch.arange(RES)] * 3, indexing='ij'), dim=-1).reshape(-1, 3)
+    center = torch.tensor(center)
+    coords = grid[((grid + 0.5 - center).norm(dim=1) - radius).abs() < 1.5]
+    corners = coords[:, None] + cube_corners[None]
+    sdf = ((corners - center).norm(dim=-1) - radius) / RES
+    sdf = sdf + torch.randn(sdf.shape, generator=generator) * noise / RES
+    feats = torch.randn(coords.shape[0], SparseFeatures2Mesh(device='cpu', res=RES).feats_channels, generator=generator) * 0.5
+    feats[:, :8] = sdf
+    return coords.int(), feats
+
+
+def _sparse_tensor(items):
+    coords = torch.cat([torch.nn.functional.pad(coords, (1, 0), value=i) for i, (coords, _) in enumerate(items)])
+    feats = torch.cat([feats for _, feats in items])
+    return sp.SparseTensor(feats=feats, coords=coords)
+
+
+def _canonical(mesh):
+    """The vertices sorted by position, and the faces by their sorted vertex positions, starting from their smallest vertex."""
+    vertices = mesh.vertices
+    order = torch.from_numpy(np.lexsort(vertices.numpy().T[::-1]))
+    remap = torch.empty_like(order)
+    remap[order] = torch.arange(order.shape[0])
+    faces = remap[mesh.faces]
+    # Rotate every face to start from its smallest vertex, which keeps its orientation
+    faces = faces.gather(1, (faces.argmin(dim=1, keepdim=True) + torch.arange(3)) % 3)
+    faces = faces[torch.from_numpy(np.lexsort(faces.numpy().T[::-1]))]
+    return vertices[order], faces, mesh.vertex_attrs[order]
+
+
+def _assert_same_mesh(mesh, expected):
+    assert mesh.vertices.shape == expected.vertices.shape and mesh.faces.shape == expected.faces.shape
+    for value, expected_value in zip(_canonical(mesh), _canonical(expected)):
+        torch.testing.assert_close(value, expected_value)
+
+
+@pytest.mark.parametrize("center, radius", [
+    ((8.0, 7.5, 8.2), 4.3),
+    # Cut by the border of the grid
+    ((2.0, 3.0, 13.5), 5.0),
+])
+def test_sparse_grid_matches_dense_grid(center, radius):
+    generator = torch.Generator().manual_seed(0)
+    cubefeats = _sparse_tensor([_blob(center, radius, generator)])
+    # The extraction adds the sdf bias to the features in place
+    sparse_mesh = SparseFeatures2Mesh(device='cpu', res=RES, sparse=True)(cubefeats.replace(cubefeats.feats.clone()))
+    dense_mesh = SparseFeatures2Mesh(device='cpu', res=RES, sparse=False)(cubefeats.replace(cubefeats.feats.clone()))
+    assert sparse_mesh.success
+    _assert_same_mesh(sparse_mesh, dense_mesh)
+
+
+def test_extract_batch_matches_every_item():
+    generator = torch.Generator().manual_seed(1)
+    # The first item reaches the last column of the grid along x, next to the second item in the batched grid.
+    # The noise makes cubes with several dual vertices, which FlexiCubes emits out of the order of the cubes.
+    items = [_blob((13.5, 8.0, 8.0), 4.0, generator, noise=0.5), _blob((6.0, 7.0, 9.0), 3.5, generator, noise=0.5)]
+    extractor = SparseFeatures2Mesh(device='cpu', res=RES, sparse=True)
+    cubefeats = _sparse_tensor(items)
+    meshes = extractor.extract_batch(cubefeats.replace(cubefeats.feats.clone()))
+    assert len(meshes) == len(items)
+    for mesh, item in zip(meshes, items):
+        expected = extractor(_sparse_tensor([(item[0], item[1].clone())]))
+        assert mesh.success
+        _assert_same_mesh(mesh, expected)
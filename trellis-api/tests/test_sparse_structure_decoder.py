@@ -0,0 +1,28 @@
+import pytest
+import torch
+
+from trellis.models.sparse_structure_vae import SparseStructureDecoder
+
+
+def _decoder(norm_type="layer", num_res_blocks=1):
+    torch.manual_seed(0)
+    decoder = SparseStructureDecoder(
+        out_channels=1, latent_channels=4, num_res_blocks=num_res_blocks, channels=[32, 32, 32], norm_type=norm_type,
+    ).eval()
+    # The second convolution of every res block is zero initialized
+    with torch.no_grad():
+        for p in decoder.parameters():
+            p.add_(torch.randn_like(p) * 0.05)
+    return decoder
+
+
+@pytest.mark.parametrize("norm_type, num_res_blocks", [("layer", 1), ("layer", 2), ("group", 1)])
+def test_decode_coords_matches_dense_decoding(norm_type, num_res_blocks):
+    decoder = _decoder(norm_type, num_res_blocks)
+    x = torch.randn(2, 4, 5, 5, 5, generator=torch.Generator().manual_seed(1))
+    with torch.no_grad():
+        expected = torch.argwhere(decoder(x)[:, 0] > 0).int()
+    # Some voxels but not all of them are occupied
+    assert 0 < expected.shape[0] < 2 * 20 ** 3
+    for slab_size in [0, 1, 2, 3, 4, 7, 8, 19, 20, 100]:
+        torch.testing.assert_close(decoder.decode_coords(x, slab_size=slab_size), expected, rtol=0, atol=0)
@@ -0,0 +1,64 @@
+import pytest
+import torch
+
+from trellis.models import sparse_structure_flow
+from trellis.models.sparse_structure_flow import SparseStructureFlowModel
+
+
+def _model():
+    torch.manual_seed(0)
+    model = SparseStructureFlowModel(
+        resolution=8, in_channels=4, model_channels=32, cond_channels=16, out_channels=4,
+        num_blocks=2, num_heads=2, patch_size=2,
+    ).eval()
+    # The output layer is zero initialized
+    with torch.no_grad():
+        for p in model.parameters():
+            p.add_(torch.randn_like(p) * 0.02)
+    return model
+
+
+def _inputs(batch_size=1):
+    return torch.randn(batch_size, 4, 8, 8, 8), torch.full((batch_size,), 500.0), torch.randn(batch_size, 6, 16)
+
+
+def test_compiled_forward_matches_eager():
+    model = _model()
+    x, t, cond = _inputs()
+    with torch.no_grad():
+        expected = model(x, t, cond)
+        if not model.enable_compile("default"):
+            pytest.skip("torch.compile is not supported here")
+        out = model(x, t, cond)
+        # A new shape compiles again
+        out_2 = model(*_inputs(2))
+    assert model.compile_mode == "default"
+    assert len(model._compiled_shapes) == 2
+    assert out_2.shape == (2, 4, 8, 8, 8)
+    torch.testing.assert_close(out, expected, rtol=1e-4, atol=1e-5)
+
+
+def test_compile_unsupported_platform_stays_eager(monkeypatch):
+    monkeypatch.setattr(sparse_structure_flow.sys, "platform", "win32")
+    model = _model()
+    assert not model.enable_compile("default")
+    assert model.compile_mode is None
+    with torch.no_grad():
+        assert model(*_inputs()).shape == (1, 4, 8, 8, 8)
+
+
+def test_compile_failure_stays_eager(monkeypatch):
+    def broken_compile(*args, **kwargs):
+        raise RuntimeError("no compiler")
+    monkeypatch.setattr(torch, "compile", broken_compile)
+    model = _model()
+    assert not model.enable_compile("default")
+    assert model.compile_mode is None
+
+
+def test_reduce_overhead_needs_cudagraph_mark_step(monkeypatch):
+    monkeypatch.setattr(sparse_structure_flow, "_cudagraph_mark_step_begin", None)
+    model = _model()
+    if not model.enable_compile("reduce-overhead"):
+        pytest.skip("torch.compile is not supported here")
+    assert model.compile_mode == "default"
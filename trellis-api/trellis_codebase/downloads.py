@@ -0,0 +1,96 @@
+import asyncio
+import gzip
+import logging
+import os
+import shutil
+import uuid
+from mimetypes import guess_type
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+
+logger = logging.getLogger("trellis")
+
+# Bytes read from disk and sent at once when streaming a file
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+# Files smaller than this are not worth compressing
+GZIP_MIN_BYTES = 256 * 1024
+# Only these extensions compress well, the ply files are mostly float noise
+GZIP_EXTENSIONS = (".glb", )
+
+
+class DownloadResponse(FileResponse):
+    """
+    File response streaming bigger chunks than the default 64KB, to spend less time per chunk on large models.
+    Range requests, If-Range, ETag and Last-Modified headers are handled by `FileResponse`.
+    """
+
+    chunk_size = DOWNLOAD_CHUNK_BYTES
+
+
+def _accepts_gzip(request: Request) -> bool:
+    for encoding in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = encoding.partition(";")
+        if name.strip() == "gzip":
+            # "gzip;q=0" refuses gzip
+            _, _, q = params.partition("q=")
+            try:
+                return float(q or 1) > 0
+            except ValueError:
+                return True
+    return False
+
+
+def _gzip_variant(path: str) -> str:
+    """
+    Compress the file next to it on first request, then reuse the compressed file as long as it's newer.
+    The compressed file is served like any other file, so its downloads can be resumed too.
+    """
+    gz_path = f"{path}.gz"
+    try:
+        if os.path.getmtime(gz_path) >= os.path.getmtime(path):
+            return gz_path
+    except OSError:
+        pass
+    # Requests racing for the same file compress it to their own temporary file, the last one wins
+    tmp_path = f"{gz_path}.{uuid.uuid4().hex}.tmp"
+    with open(path, "rb") as src, gzip.open(tmp_path, "wb", compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, DOWNLOAD_CHUNK_BYTES)
+    os.replace(tmp_path, gz_path)
+    logger.info(f"Compress {path} from {os.path.getsize(path)} to {os.path.getsize(gz_path)} bytes")
+    return gz_path
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison, as recommended for If-None-Match
+    return "*" in tags or etag.removeprefix("W/") in [tag.removeprefix("W/") for tag in tags]
+
+
+async def download_response(request: Request, path: str, allow_gzip: bool = False) -> Response:
+    """
+    Build the response serving a generated file.
+    A client which already has the file answers 304 Not Modified to its If-None-Match,
+    and a client with part of it can ask the rest with a Range and If-Range.
+
+    Args:
+        request (Request): The download request.
+        path (str): The path of the file to serve.
+        allow_gzip (bool): Whether to serve large glb files gzip compressed to the clients accepting it.
+    """
+    headers = {}
+    media_type = guess_type(path)[0] or "application/octet-stream"
+    served_path = path
+    if allow_gzip and path.endswith(GZIP_EXTENSIONS):
+        headers["vary"] = "accept-encoding"
+        if _accepts_gzip(request) and os.path.getsize(path) >= GZIP_MIN_BYTES:
+            served_path = await asyncio.to_thread(_gzip_variant, path)
+            headers["content-encoding"] = "gzip"
+    stat_result = await asyncio.to_thread(os.stat, served_path)
+    response = DownloadResponse(served_path, headers=headers, media_type=media_type, stat_result=stat_result)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and _etag_matches(if_none_match, response.headers["etag"]):
+        not_modified_headers = {"etag": response.headers["etag"]}
+        if "vary" in headers:
+            not_modified_headers["vary"] = headers["vary"]
+        return Response(status_code=304, headers=not_modified_headers)
+    return response
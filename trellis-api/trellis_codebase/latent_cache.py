@@ -0,0 +1,53 @@
+import logging
+import os
+import torch
+from .result_cache import ResultCache
+
+logger = logging.getLogger("trellis")
+
+
+class LatentCache(ResultCache):
+    """
+    On-disk cache of the intermediate results of the image to 3d pipeline,
+    the image condition and the sampled sparse structure and structured latent.
+    A request differing only in what is decoded from them can skip straight to decoding.
+    Unlike the result cache it survives restarts, the files already in `cache_dir` are picked up on startup.
+
+    Args:
+        cache_dir (str): The folder holding one .pt file per entry.
+        max_bytes (int): The max total size of the files, 0 disables the cache.
+        model_revision (str): Identifies the models and precision, entries of another revision never match.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, model_revision: str = ""):
+        super().__init__(cache_dir, max_bytes, model_revision)
+        self._load_existing()
+
+    def _load_existing(self):
+        paths = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith(".pt")]
+        # Oldest first, so the least recently written entries are evicted first
+        for path in sorted(paths, key=os.path.getmtime):
+            key = os.path.basename(path)[:-len(".pt")]
+            self._put(key, "pt", path)
+
+    def save(self, key: str, tensors: dict[str, torch.Tensor]):
+        if not self.enabled:
+            return
+        path = os.path.normpath(os.path.join(self.cache_dir, f"{key}.pt"))
+        try:
+            torch.save({name: tensor.detach().cpu() for name, tensor in tensors.items()}, path)
+        except Exception as e:
+            logger.warning(f"Can't save latents to {path}: {e}")
+            return
+        self._put(key, "pt", path)
+
+    def load(self, key: str, device: torch.device | str = "cpu") -> dict[str, torch.Tensor] | None:
+        entry = self.get(key)
+        if entry is None:
+            return None
+        try:
+            return torch.load(entry["path"], map_location=device)
+        except Exception as e:
+            # Evicted between get and load, or a broken file
+            logger.warning(f"Can't load latents from {entry['path']}: {e}")
+            return None
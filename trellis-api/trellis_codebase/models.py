@@ -1,5 +1,7 @@
 import os
+import asyncio
 import sqlite3
+import threading
 from pydantic import BaseModel, Field
 from typing import Literal, Annotated
 from .utils import absolute_path, DB_DIR
@@ -8,7 +10,9 @@ class Img23DTaskIn(BaseModel):
     image_type: Literal["png", "jpeg"]
     image_token: str 
     preprocess_image: bool
-    output_type: Literal["base_model", "model"]
+    output_type: Literal["base_model", "model", "gaussian"]
+    # Trade geometry quality for speed when sampling, balanced and fast sample with fewer steps of a higher order solver
+    speed_tier: Literal["quality", "balanced", "fast"] = "quality"
 
 class Img23DTask(Img23DTaskIn):
 
@@ -21,11 +25,36 @@ class Img23DTask(Img23DTaskIn):
         Field(ge=0, le=100)
     ] = 0
     output_url: str | None = None
+    # Download urls of the previews published before the output is ready, each file has its own token
+    voxel_preview_url: str | None = None
+    mesh_preview_url: str | None = None
 
 class SqliteImg23dTask:
+    """
+    Store of the image to 3d tasks.
+    Every thread keeps one persistent connection to the database, which runs in WAL mode,
+    so the generator threads writing progress don't block the api reading it.
+    The `a*` methods run the same queries in a worker thread, for use from the event loop.
+    """
 
     _instance = None
 
+    _UPDATE_ITEM_SQL = '''
+        UPDATE img23d_tasks 
+        SET create_status = ?, 
+            generate_status = ?,
+            generate_failed_message = ?,
+            progress = ?,
+            output_url = ?,
+            voxel_preview_url = ?,
+            mesh_preview_url = ?
+        WHERE tid  = ?
+    '''
+
+    _READ_ITEM_SQL = '''
+        SELECT * FROM img23d_tasks WHERE tid = ?
+    '''
+
     def __new__(cls):
         if not cls._instance:
             cls._instance = super(SqliteImg23dTask, cls).__new__(cls)
@@ -36,75 +65,82 @@ class SqliteImg23dTask:
         if self.initialized:
             return 
         self.db_path = os.path.normpath(os.path.join(DB_DIR, "trellis.db"))
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
         self.initialized = True
 
     @classmethod
     def instance(cls):
         return cls()
 
+    def _connection(self) -> sqlite3.Connection:
+        """Get the connection of the current thread, open it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # check_same_thread is off only so close_connections can close it from another thread
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def close_connections(self):
+        """Close the connections of every thread."""
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        # Threads still holding a closed connection will open a new one
+        self._local = threading.local()
+
     def create_table(self):
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS img23d_tasks (
-                tid TEXT PRIMARY KEY, 
-                image_type TEXT NOT NULL CHECK(image_type IN ('png', 'jpeg')), 
-                image_token TEXT NOT NULL, 
-                preprocess_image INTEGER NOT NULL CHECK(preprocess_image IN (0, 1)),
-                output_type TEXT NOT NULL CHECK(output_type IN ('base_model', 'model')),
-                create_status TEXT NOT NULL CHECK(create_status IN ('not_yet', 'creating', 'creating_end', 'creating_failed')) DEFAULT 'not_yet',
-                generate_status TEXT NOT NULL CHECK(generate_status IN ('not_yet', 'queued', 'generating', 'generating_end', 'generating_failed')) DEFAULT 'not_yet',
-                generate_failed_message TEXT,
-                progress INTEGER NOT NULL CHECK(progress >= 0 AND progress <= 100) DEFAULT 0,
-                output_url TEXT
-            ); 
-        ''')
-        conn.commit()
-        conn.close()
+        conn = self._connection()
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS img23d_tasks (
+                    tid TEXT PRIMARY KEY, 
+                    image_type TEXT NOT NULL CHECK(image_type IN ('png', 'jpeg')), 
+                    image_token TEXT NOT NULL, 
+                    preprocess_image INTEGER NOT NULL CHECK(preprocess_image IN (0, 1)),
+                    output_type TEXT NOT NULL CHECK(output_type IN ('base_model', 'model', 'gaussian')),
+                    speed_tier TEXT NOT NULL CHECK(speed_tier IN ('quality', 'balanced', 'fast')) DEFAULT 'quality',
+                    create_status TEXT NOT NULL CHECK(create_status IN ('not_yet', 'creating', 'creating_end', 'creating_failed')) DEFAULT 'not_yet',
+                    generate_status TEXT NOT NULL CHECK(generate_status IN ('not_yet', 'queued', 'generating', 'generating_end', 'generating_failed')) DEFAULT 'not_yet',
+                    generate_failed_message TEXT,
+                    progress INTEGER NOT NULL CHECK(progress >= 0 AND progress <= 100) DEFAULT 0,
+                    output_url TEXT,
+                    voxel_preview_url TEXT,
+                    mesh_preview_url TEXT
+                ); 
+            ''')
 
     def drop_table(self):
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        cur.execute('''
-            DROP TABLE IF EXISTS img23d_tasks;
-        ''')
-        conn.commit()
-        conn.close()
+        conn = self._connection()
+        with conn:
+            conn.execute('''
+                DROP TABLE IF EXISTS img23d_tasks;
+            ''')
+        self.close_connections()
 
     def create_item(self, task):
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        cur.execute("BEGIN")
-        cur.execute('''
-        INSERT INTO img23d_tasks (tid, image_type, image_token, preprocess_image, output_type)
-        VALUES (?, ?, ?, ?, ?)
-        ''', (task.tid, task.image_type, task.image_token, task.preprocess_image, task.output_type))
-        conn.commit()
-        conn.close()
+        conn = self._connection()
+        with conn:
+            conn.execute('''
+            INSERT INTO img23d_tasks (tid, image_type, image_token, preprocess_image, output_type, speed_tier)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', (task.tid, task.image_type, task.image_token, task.preprocess_image, task.output_type, task.speed_tier))
     
     def update_item(self, task):
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        cur.execute("BEGIN")
-        cur.execute('''
-            UPDATE img23d_tasks 
-            SET create_status = ?, 
-                generate_status = ?,
-                generate_failed_message = ?,
-                progress = ?,
-                output_url = ?
-            WHERE tid  = ?
-        ''', (task.create_status, task.generate_status, task.generate_failed_message, task.progress, task.output_url, task.tid))
-        conn.commit()
-        conn.close()
+        conn = self._connection()
+        with conn:
+            conn.execute(self._UPDATE_ITEM_SQL, (task.create_status, task.generate_status, task.generate_failed_message, task.progress, task.output_url, task.voxel_preview_url, task.mesh_preview_url, task.tid))
 
     def read_item(self, tid) -> Img23DTask | None:
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        cur.execute('''
-            SELECT * FROM img23d_tasks WHERE tid = ?
-        ''', (tid, ))
-        res = cur.fetchone()
+        conn = self._connection()
+        res = conn.execute(self._READ_ITEM_SQL, (tid, )).fetchone()
         if res is None:
             return None
         task = Img23DTask(
@@ -113,11 +149,22 @@ class SqliteImg23dTask:
             image_token=res[2], 
             preprocess_image=res[3], 
             output_type=res[4], 
-            create_status=res[5], 
-            generate_status=res[6], 
-            generate_failed_message=res[7], 
-            progress=res[8], 
-            output_url=res[9]
+            speed_tier=res[5], 
+            create_status=res[6], 
+            generate_status=res[7], 
+            generate_failed_message=res[8], 
+            progress=res[9], 
+            output_url=res[10], 
+            voxel_preview_url=res[11], 
+            mesh_preview_url=res[12]
         )
         return task
 
+    async def acreate_item(self, task):
+        await asyncio.to_thread(self.create_item, task)
+
+    async def aupdate_item(self, task):
+        await asyncio.to_thread(self.update_item, task)
+
+    async def aread_item(self, tid) -> Img23DTask | None:
+        return await asyncio.to_thread(self.read_item, tid)
@@ -0,0 +1,61 @@
+import asyncio
+import threading
+from .models import Img23DTask
+
+
+class TaskProgressBus:
+    """
+    In-process publish/subscribe of task updates.
+    The generator threads publish a task every time its progress or status changes,
+    and every websocket watching the task receives a snapshot of it on its own event loop.
+    SQLite stays the durable record, the bus only carries notifications.
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if not cls._instance:
+            cls._instance = super(TaskProgressBus, cls).__new__(cls)
+            cls._instance.initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self.initialized:
+            return
+        self._subscribers: dict[str, list[tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._lock = threading.Lock()
+        self.initialized = True
+
+    @classmethod
+    def instance(cls):
+        return cls()
+
+    def subscribe(self, tid: str) -> asyncio.Queue:
+        """Subscribe to the updates of a task, must be called from the event loop which reads the queue."""
+        queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers.setdefault(tid, []).append((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, tid: str, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = [s for s in self._subscribers.get(tid, []) if s[1] is not queue]
+            if subscribers:
+                self._subscribers[tid] = subscribers
+            else:
+                self._subscribers.pop(tid, None)
+
+    def publish(self, task: Img23DTask):
+        """Notify the subscribers of the task, safe to call from any thread."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(task.tid, []))
+        if not subscribers:
+            return
+        # Snapshot the task, the publishing thread keeps mutating it
+        snapshot = task.model_copy()
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, snapshot)
+            except RuntimeError:
+                # The loop of the subscriber is closed
+                self.unsubscribe(task.tid, queue)
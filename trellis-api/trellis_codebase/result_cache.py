@@ -0,0 +1,147 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger("trellis")
+
+
+class ResultCache:
+    """
+    Content addressed cache of generated outputs.
+    The key is a hash of the image bytes, the generation parameters and the model revision,
+    so resubmitting the same image with the same settings returns the existing output at once.
+    The cache keeps a hard link (or a copy) of every output in `cache_dir`, and links it to the output of every task reusing it,
+    so evicting an entry, least recently used first when their total size exceeds `max_bytes`, never deletes the output of a task.
+
+    Args:
+        cache_dir (str): The folder holding the cached outputs.
+        max_bytes (int): The max total size of the cached outputs, 0 disables the cache.
+        model_revision (str): Identifies the models and precision, outputs of another revision never match.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, model_revision: str = ""):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.model_revision = model_revision
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def key(self, image_bytes: bytes, params: dict) -> str:
+        """Hash the image and every parameter which changes the output."""
+        h = hashlib.sha256()
+        h.update(image_bytes)
+        h.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+        h.update(self.model_revision.encode("utf-8"))
+        return h.hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        """Return the entry of the key, with the extension and path of the cached output, or None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not os.path.exists(entry["path"]):
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, extension: str, path: str):
+        """Cache the output at `path`, which stays owned by its task."""
+        if not self.enabled:
+            return
+        cached_path = os.path.normpath(os.path.join(self.cache_dir, f"{key}.{extension}"))
+        try:
+            _link_or_copy(path, cached_path)
+        except OSError as e:
+            logger.warning(f"Can't cache the output {path}: {e}")
+            return
+        self._put(key, extension, cached_path)
+
+    def restore(self, key: str, output_dir: str, token: str) -> dict | None:
+        """
+        Link the cached output of the key to `{output_dir}/{token}.{extension}`, the output of the task reusing it.
+
+        Returns:
+            dict | None: The entry of the key, or None if it isn't cached.
+        """
+        entry = self.get(key)
+        if entry is None:
+            return None
+        path = os.path.normpath(os.path.join(output_dir, f"{token}.{entry['extension']}"))
+        try:
+            _link_or_copy(entry["path"], path)
+        except OSError as e:
+            # Evicted between get and link
+            logger.warning(f"Can't restore the cached output {entry['path']}: {e}")
+            return None
+        return entry
+
+    def _put(self, key: str, extension: str, path: str):
+        """Index a file of the cache folder, which is deleted when it is evicted."""
+        if not self.enabled:
+            return
+        try:
+            size = os.path.getsize(path)
+        except OSError as e:
+            logger.warning(f"Can't cache {path}: {e}")
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key, delete_file=False)
+            self._entries[key] = {"extension": extension, "path": path, "size": size}
+            self._size += size
+            self._evict()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _evict(self):
+        # Keep the newest entry even if it alone exceeds the limit
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            logger.info(f"Evict cached output {self._entries[oldest]['path']}")
+            self._remove(oldest)
+
+    def _remove(self, key: str, delete_file: bool = True):
+        entry = self._entries.pop(key)
+        self._size -= entry["size"]
+        if delete_file:
+            try:
+                os.remove(entry["path"])
+            except OSError:
+                pass
+
+
+def _link_or_copy(src: str, dst: str):
+    """Hard link `src` to `dst`, or copy it where the file system can't link."""
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
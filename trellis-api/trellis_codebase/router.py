@@ -1,16 +1,20 @@
 import logging
 import os
 import uuid
-from fastapi import APIRouter, Body, Path, UploadFile, File, Query, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Body, Path, UploadFile, File, Form, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.responses import FileResponse, HTMLResponse
 from typing import Annotated
 from .models import *
 from .utils import absolute_path, UPLOADS_IMAGE_DIR, OUTPUTS_DIR
 from .trellis_generator import TrellisGenerator
+from .progress_bus import TaskProgressBus
+from .downloads import download_response
 import asyncio
 
 logger = logging.getLogger("trellis")
 
+WATCH_RESYNC_SECONDS = 30
+
 
 router = APIRouter()
 
@@ -42,6 +46,22 @@ async def get_queue_size():
         }
     
 
+@router.get("/result_cache_stats")
+async def get_result_cache_stats():
+    try:
+        trellis_generator = TrellisGenerator.instance()
+        return {
+            "code": 0, 
+            "data": trellis_generator.result_cache.stats()
+        }
+    except Exception as e:
+        return {
+            "code": 100, 
+            "message": f"There is a problem when query the result cache: {e}", 
+            "suggestion": "Try do it again or contact the admin of this blender addon"
+        }
+
+
 @router.post("/upload_image")
 async def upload_image(
     image: Annotated[
@@ -100,9 +120,70 @@ async def create_img_23d_task(
             **task_in.model_dump(), 
             tid=tid
         )
-        trellis_generator.sqlite_img23d_task.create_item(task)
-        trellis_generator.create_img23d_task(task)
-        trellis_generator.sqlite_img23d_task.update_item(task)
+        await trellis_generator.sqlite_img23d_task.acreate_item(task)
+        # Reading, hashing and decoding the image would block the event loop
+        await asyncio.to_thread(trellis_generator.create_img23d_task, task)
+        await trellis_generator.sqlite_img23d_task.aupdate_item(task)
+        return {
+            "code": 0, 
+            "data": {
+                "task_id": tid
+            }
+        }
+    except Exception as e:
+        return {
+            "code": 200, 
+            "message": f"There is a problem when creating task: {e}", 
+            "suggestion": "Try upload it again or contact the admin of this blender addon"
+        }
+
+@router.post("/img23d_task/upload")
+async def upload_image_and_create_img23d_task(
+    image: Annotated[
+        UploadFile, 
+        File()
+    ], 
+    preprocess_image: Annotated[
+        bool, 
+        Form()
+    ], 
+    output_type: Annotated[
+        Literal["base_model", "model", "gaussian"], 
+        Form()
+    ], 
+    speed_tier: Annotated[
+        Literal["quality", "balanced", "fast"], 
+        Form()
+    ] = "quality", 
+):
+    """
+    Same as `/upload_image` followed by `/img23d_task` in a single request.
+    The image is kept in memory instead of being saved to the uploads folder and read back.
+    """
+    image_extension = image.filename.split(".")[-1]
+    if image_extension not in ["png", "jpeg"]:
+        return {
+            "code": 100, 
+            "message": "Only support PNG and JPEG format of image.", 
+            "suggestion": "Please convert the image to png or jpeg format."
+        }
+    trellis_generator = TrellisGenerator.instance()
+    try:
+        image_bytes = await image.read()
+        tid = uuid.uuid4().hex
+        task = Img23DTask(
+            image_type=image_extension, 
+            # Only identifies the image, no file is saved under this token
+            image_token=uuid.uuid4().hex, 
+            preprocess_image=preprocess_image, 
+            output_type=output_type, 
+            speed_tier=speed_tier, 
+            tid=tid
+        )
+        await trellis_generator.sqlite_img23d_task.acreate_item(task)
+        # Hashing and decoding the image would block the event loop
+        await asyncio.to_thread(trellis_generator.create_img23d_task, task, image_bytes)
+        await trellis_generator.sqlite_img23d_task.aupdate_item(task)
         return {
             "code": 0, 
             "data": {
@@ -125,7 +206,7 @@ async def get_img23d_task_info(
 ) -> Img23DTask | dict:
     try:
         trellis_generator = TrellisGenerator.instance()
-        task = trellis_generator.sqlite_img23d_task.read_item(tid)
+        task = await trellis_generator.sqlite_img23d_task.aread_item(tid)
         if task is None:
             return {
                 "code": 100, 
@@ -146,6 +227,7 @@ async def get_img23d_task_info(
     
 @router.get("/download")
 async def download_file(
+    request: Request, 
     extension: Annotated[
         Literal["glb", "ply"], 
         Query()
@@ -164,7 +246,8 @@ async def download_file(
                 "suggestion": "Try to request a correct file."
             }
         else:
-            return FileResponse(filepath)
+            trellis_generator = TrellisGenerator.instance()
+            return await download_response(request, filepath, allow_gzip=trellis_generator.gzip_downloads)
     except Exception as e:
         return {
             "code": 200, 
@@ -183,14 +266,17 @@ async def get_img23d_task_ws(
     ]
 ):
     trellis_generator = TrellisGenerator.instance()
-    task = trellis_generator.sqlite_img23d_task.read_item(tid)
+    task = await trellis_generator.sqlite_img23d_task.aread_item(tid)
     if task is None:
         await websocket.close(code=1008, reason="The task id is not in our server.")
         return 
     await websocket.accept()
+    progress_bus = TaskProgressBus.instance()
+    # Subscribe before reading the current state, so no update between the two is lost
+    updates = progress_bus.subscribe(tid)
     try:
+        task = await trellis_generator.sqlite_img23d_task.aread_item(tid)
         while True:
-            task = trellis_generator.sqlite_img23d_task.read_item(tid)
             ret = {
                 "event": "update" if task.generate_status in ["queued", "generating"] else "finalized", 
                 "data": task.model_dump()
@@ -198,7 +284,12 @@ async def get_img23d_task_ws(
             await websocket.send_json(ret)
             if ret["event"] == "finalized":
                 break
-            else:
-                await asyncio.sleep(0.5)
+            try:
+                task = await asyncio.wait_for(updates.get(), timeout=WATCH_RESYNC_SECONDS)
+            except asyncio.TimeoutError:
+                # Nothing published for a while, resync with the durable record
+                task = await trellis_generator.sqlite_img23d_task.aread_item(tid)
     except WebSocketDisconnect as e:
-        logger.info("Client Disconnected")
\ No newline at end of file
+        logger.info("Client Disconnected")
+    finally:
+        progress_bus.unsubscribe(tid, updates)
@@ -0,0 +1,153 @@
+import logging
+import queue
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger("trellis")
+
+
+class Stage:
+    """
+    One stage of the job pipeline, owns a bounded input queue and a pool of worker threads.
+
+    Args:
+        name (str): The name of the stage, used for thread names and logs.
+        operation (Callable): Called with the job, returns the job for the next stage or None to stop it here.
+        workers (int): The number of worker threads of this stage.
+        queue_size (int): The max number of jobs waiting in front of this stage, 0 means unbounded.
+        lock (threading.Lock): An optional lock held while the operation runs, shared by stages which can't run concurrently.
+        batched (bool): If True, the operation is called with a list of jobs and returns a list of the same length.
+        batch_size (int): The max number of jobs handed to a batched operation at once.
+        max_wait_ms (float): How long a batched stage waits for more jobs to fill the batch after the first one arrives.
+        batch_key (Callable): Jobs with different keys are never put in the same batch.
+    """
+
+    def __init__(
+        self, 
+        name: str, 
+        operation: Callable[[Any], Any], 
+        workers: int = 1, 
+        queue_size: int = 0, 
+        lock: Optional[threading.Lock] = None, 
+        batched: bool = False, 
+        batch_size: int = 1, 
+        max_wait_ms: float = 0, 
+        batch_key: Optional[Callable[[Any], Any]] = None, 
+    ):
+        self.name = name
+        self.operation = operation
+        self.workers = max(1, workers)
+        self.lock = lock
+        self.batched = batched
+        self.batch_size = max(1, batch_size) if batched else 1
+        self.max_wait_ms = max_wait_ms
+        self.batch_key = batch_key
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.next_stage: Optional[Stage] = None
+        self.threads: list[threading.Thread] = []
+
+
+class StagedScheduler:
+    """
+    Run jobs through a chain of stages, every stage has its own workers,
+    so a job can be in a later stage while the next job is in an earlier one.
+
+    Args:
+        on_failed (Callable): Called with the job and the exception when a stage raises.
+    """
+
+    def __init__(self, on_failed: Callable[[Any, Exception], None]):
+        self.on_failed = on_failed
+        self.stages: list[Stage] = []
+        self._pending = 0
+        self._pending_cond = threading.Condition()
+
+    def add_stage(self, name: str, operation: Callable[[Any], Any], **kwargs) -> Stage:
+        """Append a stage after the current last one, see `Stage` for the keyword arguments."""
+        stage = Stage(name, operation, **kwargs)
+        if self.stages:
+            self.stages[-1].next_stage = stage
+        self.stages.append(stage)
+        return stage
+
+    def start(self):
+        for stage in self.stages:
+            for i in range(stage.workers):
+                thread = threading.Thread(target=self._worker, args=(stage, ), name=f"trellis-{stage.name}-{i}", daemon=True)
+                thread.start()
+                stage.threads.append(thread)
+            logger.info(f"Start stage {stage.name} with {stage.workers} worker(s)")
+
+    def submit(self, job):
+        """Put a job into the first stage, never blocks."""
+        with self._pending_cond:
+            self._pending += 1
+        self.stages[0].queue.put(job)
+
+    @property
+    def pending(self) -> int:
+        """The number of jobs submitted and not finished yet."""
+        with self._pending_cond:
+            return self._pending
+
+    def join(self):
+        """Wait until every submitted job has left the last stage."""
+        with self._pending_cond:
+            self._pending_cond.wait_for(lambda: self._pending == 0)
+
+    def _finish(self):
+        with self._pending_cond:
+            self._pending -= 1
+            self._pending_cond.notify_all()
+
+    def _collect(self, stage: Stage) -> list:
+        """Block for one job, then gather more until the batch is full or max_wait_ms has passed."""
+        jobs = [stage.queue.get()]
+        deadline = time.monotonic() + stage.max_wait_ms / 1000
+        while len(jobs) < stage.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    jobs.append(stage.queue.get(timeout=timeout))
+                else:
+                    jobs.append(stage.queue.get_nowait())
+            except queue.Empty:
+                break
+        return jobs
+
+    def _group(self, stage: Stage, jobs: list) -> list[list]:
+        if stage.batch_key is None:
+            return [jobs]
+        groups = {}
+        for job in jobs:
+            groups.setdefault(stage.batch_key(job), []).append(job)
+        return list(groups.values())
+
+    def _run(self, stage: Stage, jobs: list) -> list:
+        try:
+            with stage.lock or nullcontext():
+                if stage.batched:
+                    return stage.operation(jobs)
+                return [stage.operation(jobs[0])]
+        except Exception as e:
+            for job in jobs:
+                try:
+                    self.on_failed(job, e)
+                except Exception as callback_error:
+                    logger.error(f"Error in failure handler of stage {stage.name}: {callback_error}")
+            return [None] * len(jobs)
+
+    def _worker(self, stage: Stage):
+        while True:
+            jobs = self._collect(stage)
+            for group in self._group(stage, jobs):
+                for job in self._run(stage, group):
+                    if job is not None and stage.next_stage is not None:
+                        # Blocks when the next stage is full, which holds this worker back
+                        stage.next_stage.queue.put(job)
+                    else:
+                        self._finish()
+            for _ in jobs:
+                stage.queue.task_done()
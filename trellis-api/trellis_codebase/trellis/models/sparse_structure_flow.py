@@ -1,4 +1,6 @@
 from typing import *
+import sys
+import logging
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -7,6 +9,11 @@ from ..modules.utils import convert_module_to_f16, convert_module_to_f32
 from ..modules.transformer import AbsolutePositionEmbedder, ModulatedTransformerCrossBlock
 from ..modules.spatial import patchify, unpatchify
 
+logger = logging.getLogger("trellis")
+
+# Marks the start of a new CUDA graph replay, missing before torch 2.2
+_cudagraph_mark_step_begin = getattr(getattr(torch, "compiler", None), "cudagraph_mark_step_begin", None)
+
 
 class TimestepEmbedder(nn.Module):
     """
@@ -57,6 +64,9 @@ class TimestepEmbedder(nn.Module):
 
 
 class SparseStructureFlowModel(nn.Module):
+    # The torch.compile mode of the forward pass, None to run it eagerly, see `enable_compile`
+    compile_mode = None
+
     def __init__(
         self,
         resolution: int,
@@ -177,10 +187,64 @@ class SparseStructureFlowModel(nn.Module):
         nn.init.constant_(self.out_layer.weight, 0)
         nn.init.constant_(self.out_layer.bias, 0)
 
+    def enable_compile(self, mode: str = "default", max_shapes: int = 8) -> bool:
+        """
+        Run the forward pass compiled by torch.compile, once for every shape of the inputs.
+        The shapes stay the same through all the sampling steps of a batch, so the steps reuse the compiled graph
+        instead of dispatching every op of every block from Python.
+        Past `max_shapes` different shapes, or if compiling fails, the forward pass runs eagerly again.
+        Where torch.compile is not supported (e.g. Windows, or an old torch), the model stays in eager mode.
+
+        Args:
+            mode (str): The torch.compile mode, "reduce-overhead" also captures the graph with CUDA graphs.
+            max_shapes (int): The number of shapes to compile at most.
+
+        Returns:
+            bool: Whether the forward pass will run compiled.
+        """
+        is_dynamo_supported = getattr(getattr(torch, "_dynamo", None), "is_dynamo_supported", None)
+        if not hasattr(torch, "compile") or sys.platform == "win32" or (is_dynamo_supported is not None and not is_dynamo_supported()):
+            logger.warning(f"torch.compile is not supported with torch {torch.__version__} on {sys.platform}, run the sparse structure flow model in eager mode")
+            return False
+        if mode == "reduce-overhead" and _cudagraph_mark_step_begin is None:
+            logger.warning(f"torch {torch.__version__} can't mark the CUDA graph steps, compile the sparse structure flow model in the default mode")
+            mode = "default"
+        try:
+            compiled_forward = torch.compile(self._forward, mode=mode, dynamic=False)
+        except Exception as e:
+            logger.warning(f"torch.compile failed, run the sparse structure flow model in eager mode: {e}")
+            return False
+        self.compile_mode = mode
+        self.max_compiled_shapes = max_shapes
+        self._compiled_forward = compiled_forward
+        self._compiled_shapes = set()
+        return True
+
     def forward(self, x: torch.Tensor, t: torch.Tensor, cond: torch.Tensor) -> torch.Tensor:
         assert [*x.shape] == [x.shape[0], self.in_channels, *[self.resolution] * 3], \
                 f"Input shape mismatch, got {x.shape}, expected {[x.shape[0], self.in_channels, *[self.resolution] * 3]}"
 
+        if self.compile_mode is not None:
+            shape = (*x.shape, *cond.shape, x.dtype, cond.dtype, x.device)
+            if shape in self._compiled_shapes or len(self._compiled_shapes) < self.max_compiled_shapes:
+                try:
+                    if self.compile_mode == "reduce-overhead":
+                        _cudagraph_mark_step_begin()
+                    h = self._compiled_forward(x, t, cond)
+                except torch.cuda.OutOfMemoryError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Compiling the sparse structure flow model failed, fall back to eager mode: {e}")
+                    self.compile_mode = None
+                else:
+                    if shape not in self._compiled_shapes:
+                        logger.info(f"Compiled the sparse structure flow model for inputs {[*x.shape]} and cond {[*cond.shape]}")
+                        self._compiled_shapes.add(shape)
+                    # The CUDA graphs write the output of every replay to the same memory
+                    return h.clone() if self.compile_mode == "reduce-overhead" else h
+        return self._forward(x, t, cond)
+
+    def _forward(self, x: torch.Tensor, t: torch.Tensor, cond: torch.Tensor) -> torch.Tensor:
         h = patchify(x, self.patch_size)
         h = h.view(*h.shape[:2], -1).permute(0, 2, 1).contiguous()
 
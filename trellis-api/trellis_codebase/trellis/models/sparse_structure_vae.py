@@ -308,3 +308,72 @@ class SparseStructureDecoder(nn.Module):
         h = h.type(x.dtype)
         h = self.out_layer(h)
         return h
+
+    def _slab_start(self) -> int:
+        """
+        Index of the last upsampling block, the blocks from there on run on the largest volumes.
+        """
+        upsamples = [i for i, block in enumerate(self.blocks) if isinstance(block, UpsampleBlock3d)]
+        return upsamples[-1] if upsamples else len(self.blocks)
+
+    def _slab_halo(self, start: int) -> Tuple[int, int]:
+        """
+        Voxels of overlap a slab needs on each side for the blocks from `start` on to compute its inside exactly,
+        and the scale factor of these blocks.
+        """
+        halo, scale = 1, 1  # the convolution of the output layer
+        for block in reversed(self.blocks[start:]):
+            if isinstance(block, UpsampleBlock3d):
+                halo = (halo + 1) // 2 + (1 if hasattr(block, "conv") else 0)
+                scale *= 2
+            else:
+                halo += 2
+        return halo, scale
+
+    @torch.no_grad()
+    def decode_coords(self, x: torch.Tensor, slab_size: int = 0) -> torch.Tensor:
+        """
+        Decode occupancy latents straight to the coordinates of the occupied voxels, instead of the dense logits.
+        With a slab size, the blocks from the last upsampling on, where the volume is the largest, run on slabs of that
+        many output voxels along x at a time, each with enough overlap for the convolutions to give the same result.
+        This bounds the memory of large batches. Group norms need the whole volume, so they always decode it at once.
+
+        Args:
+            x (torch.Tensor): The [N x C x R x R x R] occupancy latents.
+            slab_size (int): The thickness of the slabs in output voxels, 0 to decode the whole volume at once.
+
+        Returns:
+            (torch.Tensor): The [M x 4] int32 batch indices and coordinates of the occupied voxels, in the order of `torch.argwhere`.
+        """
+        start = self._slab_start()
+        slab_modules = [*self.blocks[start:], self.out_layer]
+        if slab_size <= 0 or any(isinstance(m, nn.GroupNorm) for module in slab_modules for m in module.modules()):
+            return torch.argwhere(self(x)[:, 0] > 0).int()
+
+        desired_dtype = next(self.parameters()).dtype #so that it works with half-precision
+        x = x.to(dtype=desired_dtype)
+        h = self.input_layer(x)
+        h = h.type(self.dtype)
+        h = self.middle_block(h)
+        for block in self.blocks[:start]:
+            h = block(h)
+
+        halo, scale = self._slab_halo(start)
+        step = max(1, slab_size // scale)
+        coords = []
+        for slab_start in range(0, h.shape[2], step):
+            slab_end = min(slab_start + step, h.shape[2])
+            lo, hi = max(slab_start - halo, 0), min(slab_end + halo, h.shape[2])
+            slab = h[:, :, lo:hi]
+            for block in self.blocks[start:]:
+                slab = block(slab)
+            slab = slab.type(x.dtype)
+            slab = self.out_layer(slab)
+            slab = slab[:, 0, (slab_start - lo) * scale:(slab_end - lo) * scale]
+            slab_coords = torch.argwhere(slab > 0)
+            slab_coords[:, 1] += slab_start * scale
+            coords.append(slab_coords)
+        coords = torch.cat(coords)
+        # The slabs come x after x, put the batch items back one after the other
+        coords = coords[torch.sort(coords[:, 0], stable=True).indices]
+        return coords.int()
@@ -1,9 +1,10 @@
 from typing import *
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from ...modules import sparse as sp
-from ...utils.random_utils import hammersley_sequence
+from ...utils.random_utils import hammersley_sequence_batch
 from .base import SparseTransformerBase
 from ...representations import Gaussian
 
@@ -57,7 +58,7 @@ class SLatGaussianDecoder(SparseTransformerBase):
         nn.init.constant_(self.out_layer.bias, 0)
 
     def _build_perturbation(self) -> None:
-        perturbation = [hammersley_sequence(3, i, self.rep_config['num_gaussians']) for i in range(self.rep_config['num_gaussians'])]
+        perturbation = hammersley_sequence_batch(3, np.arange(self.rep_config['num_gaussians']), self.rep_config['num_gaussians'])
         perturbation = torch.tensor(perturbation).float() * 2 - 1
         perturbation = perturbation / self.rep_config['voxel_size']
         perturbation = torch.atanh(perturbation).to(self.device)
@@ -87,7 +88,25 @@ class SLatGaussianDecoder(SparseTransformerBase):
         Returns:
             list of representations
         """
+        # The attributes of the whole batch are computed at once, then sliced per batch item with the layout
+        xyz = (x.coords[:, 1:].float() + 0.5) / self.resolution
+        attrs = {}
+        for k, v in self.layout.items():
+            if k == '_xyz':
+                offset = x.feats[:, v['range'][0]:v['range'][1]].reshape(-1, *v['shape'])
+                offset = offset * self.rep_config['lr'][k]
+                if self.rep_config['perturb_offset']:
+                    offset = offset + self.offset_perturbation
+                offset = torch.tanh(offset) / self.resolution * 0.5 * self.rep_config['voxel_size']
+                _xyz = xyz.unsqueeze(1) + offset
+                attrs[k] = _xyz.flatten(0, 1)
+            else:
+                feats = x.feats[:, v['range'][0]:v['range'][1]].reshape(-1, *v['shape']).flatten(0, 1)
+                feats = feats * self.rep_config['lr'][k]
+                attrs[k] = feats
+
         ret = []
+        num_gaussians = self.rep_config['num_gaussians']
         for i in range(x.shape[0]):
             representation = Gaussian(
                 sh_degree=0,
@@ -97,20 +116,9 @@ class SLatGaussianDecoder(SparseTransformerBase):
                 opacity_bias = self.rep_config['opacity_bias'],
                 scaling_activation = self.rep_config['scaling_activation']
             )
-            xyz = (x.coords[x.layout[i]][:, 1:].float() + 0.5) / self.resolution
-            for k, v in self.layout.items():
-                if k == '_xyz':
-                    offset = x.feats[x.layout[i]][:, v['range'][0]:v['range'][1]].reshape(-1, *v['shape'])
-                    offset = offset * self.rep_config['lr'][k]
-                    if self.rep_config['perturb_offset']:
-                        offset = offset + self.offset_perturbation
-                    offset = torch.tanh(offset) / self.resolution * 0.5 * self.rep_config['voxel_size']
-                    _xyz = xyz.unsqueeze(1) + offset
-                    setattr(representation, k, _xyz.flatten(0, 1))
-                else:
-                    feats = x.feats[x.layout[i]][:, v['range'][0]:v['range'][1]].reshape(-1, *v['shape']).flatten(0, 1)
-                    feats = feats * self.rep_config['lr'][k]
-                    setattr(representation, k, feats)
+            rows = slice(x.layout[i].start * num_gaussians, x.layout[i].stop * num_gaussians)
+            for k, v in attrs.items():
+                setattr(representation, k, v[rows])
             ret.append(representation)
         return ret
 
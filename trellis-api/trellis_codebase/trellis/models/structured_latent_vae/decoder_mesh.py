@@ -152,6 +152,9 @@ class SLatMeshDecoder(SparseTransformerBase):
         Returns:
             list of representations
         """
+        if not self.training and self.mesh_extractor.sparse:
+            # One surface extraction for the whole batch
+            return self.mesh_extractor.extract_batch(x)
         ret = []
         for i in range(x.shape[0]):
             mesh = self.mesh_extractor(x[i], training=self.training)
@@ -1,4 +1,5 @@
 from .full_attn import *
 from .serialized_attn import *
 from .windowed_attn import *
+from .partition_cache import *
 from .modules import *
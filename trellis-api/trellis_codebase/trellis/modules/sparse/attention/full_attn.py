@@ -2,11 +2,14 @@ from typing import *
 import torch
 from .. import SparseTensor
 from .. import DEBUG, ATTN
+from .padded_attn import varlen_scaled_dot_product_attention
 
 if ATTN == 'xformers':
     import xformers.ops as xops
 elif ATTN == 'flash_attn':
     import flash_attn
+elif ATTN in ['sdpa', 'naive']:
+    pass
 else:
     raise ValueError(f"Unknown attention module: {ATTN}")
 
@@ -206,6 +209,12 @@ def sparse_scaled_dot_product_attention(*args, **kwargs):
             out = flash_attn.flash_attn_varlen_kvpacked_func(q, kv, cu_seqlens_q, cu_seqlens_kv, max(q_seqlen), max(kv_seqlen))
         elif num_all_args == 3:
             out = flash_attn.flash_attn_varlen_func(q, k, v, cu_seqlens_q, cu_seqlens_kv, max(q_seqlen), max(kv_seqlen))
+    elif ATTN in ['sdpa', 'naive']:
+        if num_all_args == 1:
+            q, k, v = qkv.unbind(dim=1)
+        elif num_all_args == 2:
+            k, v = kv.unbind(dim=1)
+        out = varlen_scaled_dot_product_attention(q, k, v, q_seqlen, kv_seqlen, ATTN)
     else:
         raise ValueError(f"Unknown attention module: {ATTN}")
     
@@ -0,0 +1,118 @@
+from typing import *
+import torch
+import math
+from torch.nn.functional import scaled_dot_product_attention as sdpa
+
+
+__all__ = [
+    'batched_scaled_dot_product_attention',
+    'varlen_scaled_dot_product_attention',
+]
+
+# Max number of query rows the naive backend attends at once, bounds the [N, H, L_Q, L_KV] weights it materializes
+NAIVE_QUERY_CHUNK = 1024
+
+
+def _naive_sdpa(q, k, v, key_mask=None):
+    """
+    Naive implementation of scaled dot product attention, on [N, H, L, C] tensors.
+    """
+    scale_factor = 1 / math.sqrt(q.size(-1))
+    outs = []
+    for start in range(0, q.shape[2], NAIVE_QUERY_CHUNK):
+        attn_weight = q[:, :, start:start+NAIVE_QUERY_CHUNK] @ k.transpose(-2, -1) * scale_factor
+        if key_mask is not None:
+            attn_weight = attn_weight.masked_fill(~key_mask, float('-inf'))
+        attn_weight = torch.softmax(attn_weight, dim=-1)
+        outs.append(attn_weight @ v)
+    return torch.cat(outs, dim=2)
+
+
+def batched_scaled_dot_product_attention(
+    q: torch.Tensor,
+    k: torch.Tensor,
+    v: torch.Tensor,
+    backend: Literal['sdpa', 'naive'] = 'sdpa',
+    key_mask: Optional[torch.Tensor] = None,
+) -> torch.Tensor:
+    """
+    Apply scaled dot product attention with pure PyTorch.
+
+    Args:
+        q (torch.Tensor): A [N, L_Q, H, Ci] tensor containing Qs.
+        k (torch.Tensor): A [N, L_KV, H, Ci] tensor containing Ks.
+        v (torch.Tensor): A [N, L_KV, H, Co] tensor containing Vs.
+        backend (str): 'sdpa' for torch.nn.functional.scaled_dot_product_attention, 'naive' for explicit matmuls.
+        key_mask (torch.Tensor): An optional [N, L_KV] bool tensor, False for padded keys.
+
+    Returns:
+        (torch.Tensor): A [N, L_Q, H, Co] tensor.
+    """
+    q = q.permute(0, 2, 1, 3)   # [N, H, L, C]
+    k = k.permute(0, 2, 1, 3)   # [N, H, L, C]
+    v = v.permute(0, 2, 1, 3)   # [N, H, L, C]
+    if key_mask is not None:
+        key_mask = key_mask[:, None, None, :]   # [N, 1, 1, L_KV]
+    if backend == 'sdpa':
+        out = sdpa(q, k, v, attn_mask=key_mask)
+    elif backend == 'naive':
+        out = _naive_sdpa(q, k, v, key_mask)
+    else:
+        raise ValueError(f"Unknown attention module: {backend}")
+    return out.permute(0, 2, 1, 3)   # [N, L, H, C]
+
+
+def _pad_indices(seqlen: List[int], device: torch.device) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Get the batch index and the position in its sequence of every element of packed sequences.
+    """
+    seqlen_t = torch.tensor(seqlen, device=device)
+    batch_indices = torch.repeat_interleave(torch.arange(len(seqlen), device=device), seqlen_t)
+    starts = torch.cumsum(seqlen_t, dim=0) - seqlen_t
+    positions = torch.arange(batch_indices.shape[0], device=device) - starts[batch_indices]
+    return batch_indices, positions
+
+
+def varlen_scaled_dot_product_attention(
+    q: torch.Tensor,
+    k: torch.Tensor,
+    v: torch.Tensor,
+    q_seqlen: List[int],
+    kv_seqlen: List[int],
+    backend: Literal['sdpa', 'naive'] = 'sdpa',
+) -> torch.Tensor:
+    """
+    Apply scaled dot product attention to packed variable length sequences with pure PyTorch.
+    The sequences are padded into a batch, and padded keys are masked out.
+
+    Args:
+        q (torch.Tensor): A [T_Q, H, Ci] tensor containing the Qs of every sequence one after another.
+        k (torch.Tensor): A [T_KV, H, Ci] tensor containing Ks.
+        v (torch.Tensor): A [T_KV, H, Co] tensor containing Vs.
+        q_seqlen (List[int]): The length of every query sequence.
+        kv_seqlen (List[int]): The length of every key/value sequence.
+        backend (str): 'sdpa' or 'naive', see `batched_scaled_dot_product_attention`.
+
+    Returns:
+        (torch.Tensor): A [T_Q, H, Co] tensor.
+    """
+    N = len(q_seqlen)
+    L_Q, L_KV = max(q_seqlen), max(kv_seqlen)
+    if min(q_seqlen) == L_Q and min(kv_seqlen) == L_KV:
+        # Every sequence has the same length, no padding needed
+        out = batched_scaled_dot_product_attention(
+            q.reshape(N, L_Q, *q.shape[1:]), k.reshape(N, L_KV, *k.shape[1:]), v.reshape(N, L_KV, *v.shape[1:]), backend
+        )
+        return out.reshape(N * L_Q, *out.shape[2:])
+
+    q_batch, q_pos = _pad_indices(q_seqlen, q.device)
+    kv_batch, kv_pos = _pad_indices(kv_seqlen, q.device)
+    q_padded = q.new_zeros(N, L_Q, *q.shape[1:])
+    k_padded = k.new_zeros(N, L_KV, *k.shape[1:])
+    v_padded = v.new_zeros(N, L_KV, *v.shape[1:])
+    q_padded[q_batch, q_pos] = q
+    k_padded[kv_batch, kv_pos] = k
+    v_padded[kv_batch, kv_pos] = v
+    key_mask = torch.arange(L_KV, device=q.device).unsqueeze(0) < torch.tensor(kv_seqlen, device=q.device).unsqueeze(1)
+    out = batched_scaled_dot_product_attention(q_padded, k_padded, v_padded, backend, key_mask)
+    return out[q_batch, q_pos]
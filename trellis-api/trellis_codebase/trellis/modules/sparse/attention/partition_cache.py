@@ -0,0 +1,102 @@
+from typing import *
+from collections import OrderedDict
+import threading
+import torch
+from .. import SparseTensor
+
+__all__ = [
+    'coords_fingerprint',
+    'get_partition',
+    'clear_partition_cache',
+]
+
+# Cached partitions of the latest coordinates, shared by every SparseTensor with the same coordinates.
+# During sampling the coordinates stay the same for every step, while the tensors holding them are rebuilt.
+MAX_ENTRIES = 64
+MAX_BYTES = 512 * 1024 ** 2
+
+# Every entry keeps the coordinates it was computed from, to rule out a collision of fingerprints on a hit
+_cache: OrderedDict[Tuple, Tuple[Any, int, torch.Tensor]] = OrderedDict()
+_cache_bytes = 0
+_lock = threading.Lock()
+
+
+def coords_fingerprint(tensor: SparseTensor) -> Tuple:
+    """
+    Fingerprint the coordinates of a sparse tensor, equal coordinates in the same order give equal fingerprints.
+    The fingerprint is computed once per tensor and kept in its spatial cache.
+
+    Args:
+        tensor (SparseTensor): The input tensor.
+
+    Returns:
+        (Tuple): The number of points, the device and three hashes of the coordinates.
+    """
+    fingerprint = tensor.get_spatial_cache('coords_fingerprint')
+    if fingerprint is not None:
+        return fingerprint
+    coords = tensor.coords.long()
+    code = coords[:, 0]
+    for i in range(1, coords.shape[1]):
+        code = code * 4096 + coords[:, i]
+    # The position weight makes the hash depend on the order of the points, the partitions index into it
+    weights = torch.arange(1, code.shape[0] + 1, device=code.device, dtype=torch.int64) * 0x9E3779B1
+    hashes = torch.stack([code.sum(), (code * weights).sum(), (code * code).sum()]).tolist()
+    fingerprint = (coords.shape[0], str(coords.device), *hashes)
+    tensor.register_spatial_cache('coords_fingerprint', fingerprint)
+    return fingerprint
+
+
+def _nbytes(value: Any) -> int:
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(v) for v in value)
+    return 0
+
+
+def get_partition(tensor: SparseTensor, name: str, calc: Callable[[], Any]) -> Any:
+    """
+    Get a partition of the coordinates of a sparse tensor, computing it with `calc` only when
+    neither the tensor nor another tensor with the same coordinates has computed it before.
+    A cached partition is only reused after checking that its coordinates equal the ones of the tensor.
+
+    Args:
+        tensor (SparseTensor): The input tensor.
+        name (str): The name of the partition, including every parameter it depends on.
+        calc (Callable): Computes the partition.
+    """
+    global _cache_bytes
+    value = tensor.get_spatial_cache(name)
+    if value is not None:
+        return value
+    key = (coords_fingerprint(tensor), name)
+    with _lock:
+        entry = _cache.get(key)
+    if entry is not None and (entry[2] is tensor.coords or torch.equal(entry[2], tensor.coords)):
+        value = entry[0]
+        with _lock:
+            if key in _cache:
+                _cache.move_to_end(key)
+    if value is None:
+        value = calc()
+        size = _nbytes(value)
+        with _lock:
+            # A missing entry, or one of other coordinates with the same fingerprint
+            if key in _cache:
+                _cache_bytes -= _cache.pop(key)[1]
+            _cache[key] = (value, size, tensor.coords)
+            _cache_bytes += size
+            while len(_cache) > 1 and (len(_cache) > MAX_ENTRIES or _cache_bytes > MAX_BYTES):
+                _, (_, evicted_size, _) = _cache.popitem(last=False)
+                _cache_bytes -= evicted_size
+    tensor.register_spatial_cache(name, value)
+    return value
+
+
+def clear_partition_cache() -> None:
+    """Drop every cached partition."""
+    global _cache_bytes
+    with _lock:
+        _cache.clear()
+        _cache_bytes = 0
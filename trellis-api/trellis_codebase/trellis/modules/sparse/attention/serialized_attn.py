@@ -4,11 +4,15 @@ import torch
 import math
 from .. import SparseTensor
 from .. import DEBUG, ATTN
+from .padded_attn import batched_scaled_dot_product_attention, varlen_scaled_dot_product_attention
+from .partition_cache import get_partition
 
 if ATTN == 'xformers':
     import xformers.ops as xops
 elif ATTN == 'flash_attn':
     import flash_attn
+elif ATTN in ['sdpa', 'naive']:
+    pass
 else:
     raise ValueError(f"Unknown attention module: {ATTN}")
 
@@ -90,22 +94,22 @@ def calc_serialization(
             seq_batch_indices.append(bi)
             offsets.append(offsets[-1] + seq_lens[-1])
         else:
-            # Partition the input
-            offset = 0
-            mids = [(i + 0.5) * valid_window_size + shift_sequence for i in range(num_windows)]
-            split = [math.floor(i * valid_window_size + shift_sequence) for i in range(num_windows + 1)]
+            # Partition the input, every window gets window_size points centered on its valid range,
+            # padded with points of the neighbouring windows
+            window_indices = torch.arange(num_windows, device=tensor.device, dtype=torch.float64)
+            mids = (window_indices + 0.5) * valid_window_size + shift_sequence
+            valid_starts = torch.floor(window_indices * valid_window_size + shift_sequence).long()
+            valid_ends = torch.floor((window_indices + 1) * valid_window_size + shift_sequence).long()
+            padded_starts = torch.floor(mids - 0.5 * window_size).long()
+            in_window = torch.arange(window_size, device=tensor.device)
+            window_fwd = to_ordered[(padded_starts.unsqueeze(1) + in_window.unsqueeze(0)) % num_points]     # [W, window_size]
+            # Only the points in the valid range of a window map back to it
+            valid = (in_window.unsqueeze(0) >= (valid_starts - padded_starts).unsqueeze(1)) \
+                  & (in_window.unsqueeze(0) < (valid_ends - padded_starts).unsqueeze(1))
+            padded_positions = torch.arange(num_windows * window_size, device=tensor.device).reshape(num_windows, window_size)
             bwd_index = torch.zeros((num_points,), dtype=torch.int64, device=tensor.device)
-            for i in range(num_windows):
-                mid = mids[i]
-                valid_start = split[i]
-                valid_end = split[i + 1]
-                padded_start = math.floor(mid - 0.5 * window_size)
-                padded_end = padded_start + window_size
-                fwd_indices.append(to_ordered[torch.arange(padded_start, padded_end, device=tensor.device) % num_points])
-                offset += valid_start - padded_start
-                bwd_index.scatter_(0, fwd_indices[-1][valid_start-padded_start:valid_end-padded_start], torch.arange(offset, offset + valid_end - valid_start, device=tensor.device))
-                offset += padded_end - valid_start
-                fwd_indices[-1] += s.start
+            bwd_index[window_fwd[valid]] = padded_positions[valid]
+            fwd_indices.append(window_fwd.reshape(-1) + s.start)
             seq_lens.extend([window_size] * num_windows)
             seq_batch_indices.extend([bi] * num_windows)
             bwd_indices.append(bwd_index + offsets[-1])
@@ -138,12 +142,10 @@ def sparse_serialized_scaled_dot_product_self_attention(
     assert len(qkv.shape) == 4 and qkv.shape[1] == 3, f"Invalid shape for qkv, got {qkv.shape}, expected [N, *, 3, H, C]"
 
     serialization_spatial_cache_name = f'serialization_{serialize_mode}_{window_size}_{shift_sequence}_{shift_window}'
-    serialization_spatial_cache = qkv.get_spatial_cache(serialization_spatial_cache_name)
-    if serialization_spatial_cache is None:
-        fwd_indices, bwd_indices, seq_lens, seq_batch_indices = calc_serialization(qkv, window_size, serialize_mode, shift_sequence, shift_window)
-        qkv.register_spatial_cache(serialization_spatial_cache_name, (fwd_indices, bwd_indices, seq_lens, seq_batch_indices))
-    else:
-        fwd_indices, bwd_indices, seq_lens, seq_batch_indices = serialization_spatial_cache
+    fwd_indices, bwd_indices, seq_lens, seq_batch_indices = get_partition(
+        qkv, serialization_spatial_cache_name,
+        lambda: calc_serialization(qkv, window_size, serialize_mode, shift_sequence, shift_window)
+    )
 
     M = fwd_indices.shape[0]
     T = qkv.feats.shape[0]
@@ -168,6 +170,9 @@ def sparse_serialized_scaled_dot_product_self_attention(
             out = xops.memory_efficient_attention(q, k, v)          # [B, N, H, C]
         elif ATTN == 'flash_attn':
             out = flash_attn.flash_attn_qkvpacked_func(qkv_feats)   # [B, N, H, C]
+        elif ATTN in ['sdpa', 'naive']:
+            q, k, v = qkv_feats.unbind(dim=2)                       # [B, N, H, C]
+            out = batched_scaled_dot_product_attention(q, k, v, ATTN)   # [B, N, H, C]
         else:
             raise ValueError(f"Unknown attention module: {ATTN}")
         out = out.reshape(B * N, H, C)                              # [M, H, C]
@@ -183,6 +188,9 @@ def sparse_serialized_scaled_dot_product_self_attention(
             cu_seqlens = torch.cat([torch.tensor([0]), torch.cumsum(torch.tensor(seq_lens), dim=0)], dim=0) \
                         .to(qkv.device).int()
             out = flash_attn.flash_attn_varlen_qkvpacked_func(qkv_feats, cu_seqlens, max(seq_lens)) # [M, H, C]
+        elif ATTN in ['sdpa', 'naive']:
+            q, k, v = qkv_feats.unbind(dim=1)                       # [M, H, C]
+            out = varlen_scaled_dot_product_attention(q, k, v, seq_lens, seq_lens, ATTN)   # [M, H, C]
 
     out = out[bwd_indices]      # [T, H, C]
 
@@ -3,11 +3,15 @@ import torch
 import math
 from .. import SparseTensor
 from .. import DEBUG, ATTN
+from .padded_attn import batched_scaled_dot_product_attention, varlen_scaled_dot_product_attention
+from .partition_cache import get_partition
 
 if ATTN == 'xformers':
     import xformers.ops as xops
 elif ATTN == 'flash_attn':
     import flash_attn
+elif ATTN in ['sdpa', 'naive']:
+    pass
 else:
     raise ValueError(f"Unknown attention module: {ATTN}")
 
@@ -77,12 +81,10 @@ def sparse_windowed_scaled_dot_product_self_attention(
     assert len(qkv.shape) == 4 and qkv.shape[1] == 3, f"Invalid shape for qkv, got {qkv.shape}, expected [N, *, 3, H, C]"
 
     serialization_spatial_cache_name = f'window_partition_{window_size}_{shift_window}'
-    serialization_spatial_cache = qkv.get_spatial_cache(serialization_spatial_cache_name)
-    if serialization_spatial_cache is None:
-        fwd_indices, bwd_indices, seq_lens, seq_batch_indices = calc_window_partition(qkv, window_size, shift_window)
-        qkv.register_spatial_cache(serialization_spatial_cache_name, (fwd_indices, bwd_indices, seq_lens, seq_batch_indices))
-    else:
-        fwd_indices, bwd_indices, seq_lens, seq_batch_indices = serialization_spatial_cache
+    fwd_indices, bwd_indices, seq_lens, seq_batch_indices = get_partition(
+        qkv, serialization_spatial_cache_name,
+        lambda: calc_window_partition(qkv, window_size, shift_window)
+    )
 
     M = fwd_indices.shape[0]
     T = qkv.feats.shape[0]
@@ -110,6 +112,9 @@ def sparse_windowed_scaled_dot_product_self_attention(
             out = xops.memory_efficient_attention(q, k, v)          # [B, N, H, C]
         elif ATTN == 'flash_attn':
             out = flash_attn.flash_attn_qkvpacked_func(qkv_feats)   # [B, N, H, C]
+        elif ATTN in ['sdpa', 'naive']:
+            q, k, v = qkv_feats.unbind(dim=2)                       # [B, N, H, C]
+            out = batched_scaled_dot_product_attention(q, k, v, ATTN)   # [B, N, H, C]
         else:
             raise ValueError(f"Unknown attention module: {ATTN}")
         out = out.reshape(B * N, H, C)                              # [M, H, C]
@@ -125,6 +130,9 @@ def sparse_windowed_scaled_dot_product_self_attention(
             cu_seqlens = torch.cat([torch.tensor([0]), torch.cumsum(torch.tensor(seq_lens), dim=0)], dim=0) \
                         .to(qkv.device).int()
             out = flash_attn.flash_attn_varlen_qkvpacked_func(qkv_feats, cu_seqlens, max(seq_lens)) # [M, H, C]
+        elif ATTN in ['sdpa', 'naive']:
+            q, k, v = qkv_feats.unbind(dim=1)                       # [M, H, C]
+            out = varlen_scaled_dot_product_attention(q, k, v, seq_lens, seq_lens, ATTN)   # [M, H, C]
 
     out = out[bwd_indices]      # [T, H, C]
 
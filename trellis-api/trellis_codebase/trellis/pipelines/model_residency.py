@@ -0,0 +1,273 @@
+from typing import *
+from collections import OrderedDict
+from contextlib import contextmanager
+import threading
+import logging
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger("trellis")
+
+
+def plan_evictions(
+    resident: List[str],
+    footprints: Dict[str, int],
+    budget: int,
+    extra_bytes: int = 0,
+    protected: Iterable[str] = (),
+    policy: Literal["lru", "next_use"] = "lru",
+    use_order: Optional[List[str]] = None,
+    last_used: Optional[str] = None,
+) -> List[str]:
+    """
+    Choose the resident models to evict, so the rest plus `extra_bytes` of models to load fit the budget.
+
+    Args:
+        resident (List[str]): The resident models, least recently used first.
+        footprints (Dict[str, int]): The bytes of every model.
+        budget (int): The bytes of models allowed on the device.
+        extra_bytes (int): The bytes of the models about to be loaded.
+        protected (Iterable[str]): Models which can't be evicted, because they are in use or prefetched.
+        policy (str): 'lru' evicts the least recently used first,
+            'next_use' evicts first the model whose next use comes last in the cyclic `use_order`.
+        use_order (List[str]): The order a job uses the models in, required by 'next_use'.
+        last_used (str): The model used last, required by 'next_use'.
+
+    Returns:
+        List[str]: The models to evict, in eviction order. The rest may still exceed the budget if too much is protected.
+    """
+    protected = set(protected)
+    candidates = [name for name in resident if name not in protected]
+    if policy == "next_use" and use_order and last_used in use_order:
+        position = use_order.index(last_used)
+        def steps_until_use(name):
+            if name not in use_order:
+                return len(use_order)
+            return (use_order.index(name) - position - 1) % len(use_order)
+        candidates.sort(key=steps_until_use, reverse=True)
+    total = sum(footprints[name] for name in resident) + extra_bytes
+    evictions = []
+    for name in candidates:
+        if total <= budget:
+            break
+        evictions.append(name)
+        total -= footprints[name]
+    return evictions
+
+
+class ModelResidencyManager:
+    """
+    Decide which models of a pipeline are on the gpu in dynamic device mode, and move them there.
+
+    Every model keeps a pinned copy of its weights on the host. Loading a model copies them to the gpu
+    on a side stream, so the next stage's models can be prefetched while the current stage computes.
+    Evicting a model only points it back to the host copy, as the weights never change during inference.
+    Models stay resident after use as long as their total footprint fits `vram_budget`,
+    when a model doesn't fit, others are evicted before it is loaded, following `policy`.
+
+    Without a gpu the same bookkeeping runs but no tensor is moved, so placement decisions can be checked on cpu,
+    `device_capacity` then stands in for the memory of the device.
+
+    Args:
+        models (dict[str, nn.Module]): The models of the pipeline.
+        device (torch.device): The device the models run on, default to cuda if available.
+        vram_budget (int): Bytes of weights allowed to stay on the gpu between uses, 0 evicts every model after use.
+        prefetch (bool): Whether `prefetch` starts loading models ahead of their use.
+        policy (str): 'lru' or 'next_use', see `plan_evictions`.
+        use_order (List[str]): The order a job uses the models in, for the 'next_use' policy.
+        device_capacity (int): The bytes of the device memory, the budget is clamped to it. Read from the gpu if not given.
+    """
+    def __init__(
+        self,
+        models: dict[str, nn.Module],
+        device: Optional[torch.device] = None,
+        vram_budget: int = 0,
+        prefetch: bool = False,
+        policy: Literal["lru", "next_use"] = "lru",
+        use_order: Optional[List[str]] = None,
+        device_capacity: Optional[int] = None,
+    ):
+        self.models = models
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.device = torch.device(device)
+        self.physical = self.device.type == "cuda"
+        if device_capacity is None and self.physical:
+            device_capacity = torch.cuda.get_device_properties(self.device).total_memory
+        self.device_capacity = device_capacity
+        if device_capacity is not None and vram_budget > device_capacity:
+            logger.warning(f"VRAM budget {vram_budget / 1024**3:.1f}GB exceeds the device memory {device_capacity / 1024**3:.1f}GB, use the device memory as budget")
+            vram_budget = device_capacity
+        self.vram_budget = vram_budget
+        self.prefetch_enabled = prefetch
+        self.policy = policy
+        self.use_order = use_order
+        self.footprints = {name: self.footprint(model) for name, model in models.items()}
+        self._last_used: Optional[str] = None
+        # Resident models, least recently used first
+        self.resident: OrderedDict[str, None] = OrderedDict()
+        self._in_use: dict[str, int] = {}
+        # Models prefetched and not used yet, they are kept until their use even over the budget
+        self._reserved: set[str] = set()
+        self._events: dict[str, Any] = {}
+        self._host: dict[str, list[torch.Tensor]] = {}
+        self._stream = torch.cuda.Stream(self.device) if self.physical else None
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def footprint(model: nn.Module) -> int:
+        """The bytes of the parameters and buffers of a model."""
+        return sum(t.numel() * t.element_size() for t in ModelResidencyManager._tensors(model))
+
+    @staticmethod
+    def _tensors(model: nn.Module) -> list[torch.Tensor]:
+        return list(model.parameters()) + list(model.buffers())
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(self.footprints[name] for name in self.resident)
+
+    def prefetch(self, model_names: list[str]) -> None:
+        """
+        Start loading the models on the side stream and return at once.
+        """
+        if not self.prefetch_enabled:
+            return
+        with self._lock:
+            for name in model_names:
+                if name in self.resident:
+                    continue
+                if self.vram_budget > 0 and not self._make_room([name]):
+                    # Prefetching would go over the budget, load it when it's used instead
+                    continue
+                logger.debug(f"Prefetch model {name}")
+                self._load(name)
+                self._reserved.add(name)
+
+    @contextmanager
+    def use(self, model_names: list[str]):
+        """
+        Make sure the models are on the device while the block runs.
+        """
+        with self._lock:
+            self._make_room(model_names)
+            for name in model_names:
+                if name not in self.resident:
+                    self._load(name)
+                self._wait(name)
+                self._reserved.discard(name)
+                self._in_use[name] = self._in_use.get(name, 0) + 1
+                self.resident.move_to_end(name)
+                self._last_used = name
+            logger.debug(f"Use models {model_names}, resident: {list(self.resident)}")
+        try:
+            yield
+        finally:
+            with self._lock:
+                for name in model_names:
+                    self._in_use[name] -= 1
+                    if self._in_use[name] == 0:
+                        del self._in_use[name]
+                self.trim()
+
+    def trim(self) -> list[str]:
+        """
+        Evict models which are neither in use nor prefetched, until the rest fits the budget.
+
+        Returns:
+            list[str]: The names of the evicted models.
+        """
+        with self._lock:
+            evictions = self._plan(extra_bytes=0)
+            self._evict_many(evictions)
+        return evictions
+
+    def _make_room(self, model_names: list[str]) -> bool:
+        """
+        Evict models so the given ones can be loaded within the budget.
+
+        Returns:
+            bool: Whether they fit the budget now.
+        """
+        missing = [name for name in model_names if name not in self.resident]
+        extra_bytes = sum(self.footprints[name] for name in missing)
+        evictions = self._plan(extra_bytes, protected=set(model_names))
+        self._evict_many(evictions)
+        return self.resident_bytes + extra_bytes <= self.vram_budget
+
+    def _plan(self, extra_bytes: int, protected: set[str] = set()) -> list[str]:
+        return plan_evictions(
+            list(self.resident),
+            self.footprints,
+            self.vram_budget,
+            extra_bytes=extra_bytes,
+            protected=set(self._in_use) | self._reserved | protected,
+            policy=self.policy,
+            use_order=self.use_order,
+            last_used=self._last_used,
+        )
+
+    def _evict_many(self, model_names: list[str]) -> None:
+        if not model_names:
+            return
+        for name in model_names:
+            self._evict(name)
+        logger.debug(f"Evict models {model_names}")
+        if self.physical:
+            torch.cuda.empty_cache()
+
+    def evict_all(self) -> None:
+        """Evict every model not in use, regardless of the budget."""
+        with self._lock:
+            for name in list(self.resident):
+                if name not in self._in_use:
+                    self._reserved.discard(name)
+                    self._evict(name)
+            if self.physical:
+                torch.cuda.empty_cache()
+
+    def _load(self, name: str) -> None:
+        self.resident[name] = None
+        if not self.physical:
+            return
+        tensors = self._tensors(self.models[name])
+        if name not in self._host:
+            self._host[name] = [self._pin(t) for t in tensors]
+        with torch.cuda.stream(self._stream):
+            for t, host in zip(tensors, self._host[name]):
+                t.data = host.to(self.device, non_blocking=True)
+        event = torch.cuda.Event()
+        event.record(self._stream)
+        self._events[name] = event
+
+    def _wait(self, name: str) -> None:
+        event = self._events.pop(name, None)
+        if event is None:
+            return
+        stream = torch.cuda.current_stream(self.device)
+        stream.wait_event(event)
+        # The weights were allocated on the side stream, don't let the allocator reuse them before the compute stream is done
+        for t in self._tensors(self.models[name]):
+            t.data.record_stream(stream)
+
+    def _evict(self, name: str) -> None:
+        del self.resident[name]
+        event = self._events.pop(name, None)
+        if not self.physical:
+            return
+        if event is not None:
+            # Still copying a prefetch, let it land before dropping its memory
+            event.synchronize()
+        for t, host in zip(self._tensors(self.models[name]), self._host[name]):
+            t.data = host
+
+    @staticmethod
+    def _pin(t: torch.Tensor) -> torch.Tensor:
+        host = t.data if t.device.type == "cpu" else t.data.cpu()
+        try:
+            host = host.pin_memory()
+        except RuntimeError as e:
+            # Non blocking copies from pageable memory still work, they just don't overlap
+            logger.warning(f"Can't pin model weights in host memory: {e}")
+        t.data = host
+        return host
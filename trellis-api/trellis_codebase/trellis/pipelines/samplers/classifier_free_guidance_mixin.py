@@ -1,12 +1,55 @@
 from typing import *
+import logging
+import torch
+from ...modules import sparse as sp
+
+logger = logging.getLogger("trellis")
 
 
 class ClassifierFreeGuidanceSamplerMixin:
     """
     A mixin class for samplers that apply classifier-free guidance.
+
+    Set `batched_cfg` to True on a sampler to run the conditional and the unconditional
+    branch in one forward pass over a doubled batch instead of two passes.
     """
+    batched_cfg: bool = False
 
     def _inference_model(self, model, x_t, t, cond, neg_cond, cfg_strength, **kwargs):
-        pred = super()._inference_model(model, x_t, t, cond, **kwargs)
-        neg_pred = super()._inference_model(model, x_t, t, neg_cond, **kwargs)
+        pred, neg_pred = None, None
+        if self.batched_cfg:
+            try:
+                pred, neg_pred = self._batched_cfg_inference_model(model, x_t, t, cond, neg_cond, **kwargs)
+            except torch.cuda.OutOfMemoryError:
+                # The doubled batch doesn't fit this time, run two passes for this call only,
+                # the next calls may have a smaller batch or more free memory
+                logger.warning("Batched classifier-free guidance ran out of memory, fall back to two forward passes")
+                torch.cuda.empty_cache()
+        if pred is None:
+            pred = super()._inference_model(model, x_t, t, cond, **kwargs)
+            neg_pred = super()._inference_model(model, x_t, t, neg_cond, **kwargs)
         return (1 + cfg_strength) * pred - cfg_strength * neg_pred
+
+    def _batched_cfg_inference_model(self, model, x_t, t, cond, neg_cond, **kwargs):
+        """
+        Run the conditional and unconditional predictions in a single forward pass.
+
+        Returns:
+            a tuple of (pred, neg_pred).
+        """
+        batch_size = x_t.shape[0]
+        if isinstance(x_t, sp.SparseTensor):
+            x_in = sp.sparse_cat([x_t, x_t])
+        else:
+            x_in = torch.cat([x_t, x_t], dim=0)
+        cond_in = torch.cat([cond, neg_cond.expand_as(cond)], dim=0)
+        out = super()._inference_model(model, x_in, t, cond_in, **kwargs)
+        if isinstance(out, sp.SparseTensor):
+            # The doubled batch holds the rows of x_t twice, one after the other,
+            # keep the layout and spatial cache of the input so the update stays on the same coords
+            num_rows = x_t.feats.shape[0]
+            pred = x_t.replace(out.feats[:num_rows])
+            neg_pred = x_t.replace(out.feats[num_rows:])
+        else:
+            pred, neg_pred = out[:batch_size], out[batch_size:]
+        return pred, neg_pred
@@ -11,6 +11,7 @@ from .guidance_interval_mixin import GuidanceIntervalSamplerMixin
 class FlowEulerSampler(Sampler):
     """
     Generate samples from a flow-matching model using Euler sampling.
+    Heun's method, the second order improvement of Euler's method, is available with the 'heun' solver.
 
     Args:
         sigma_min: The minimum scale of noise in flow.
@@ -74,6 +75,40 @@ class FlowEulerSampler(Sampler):
         pred_x_prev = x_t - (t - t_prev) * pred_v
         return edict({"pred_x_prev": pred_x_prev, "pred_x_0": pred_x_0})
 
+    @torch.no_grad()
+    def sample_once_heun(
+        self,
+        model,
+        x_t,
+        t: float,
+        t_prev: float,
+        cond: Optional[Any] = None,
+        **kwargs
+    ):
+        """
+        Sample x_{t-1} from the model using Heun's method.
+        The Euler step is corrected with the velocity at its end, for two model evaluations per step.
+
+        Args and returns are the same as `sample_once`.
+        """
+        pred_x_0, pred_eps, pred_v = self._get_model_prediction(model, x_t, t, cond, **kwargs)
+        pred_x_prev = x_t - (t - t_prev) * pred_v
+        pred_v_prev = self._inference_model(model, pred_x_prev, t_prev, cond, **kwargs)
+        pred_x_prev = x_t - (t - t_prev) * 0.5 * (pred_v + pred_v_prev)
+        return edict({"pred_x_prev": pred_x_prev, "pred_x_0": pred_x_0})
+
+    def _schedule_breakpoints(self, **kwargs) -> List[float]:
+        """
+        The timesteps where the model prediction jumps, like the bounds of a guidance interval.
+        """
+        return []
+
+    @staticmethod
+    def _relative_change(x, x_ref) -> float:
+        if hasattr(x, "feats"):
+            x, x_ref = x.feats, x_ref.feats
+        return ((x - x_ref).float().norm() / x_ref.float().norm().clamp(min=1e-12)).item()
+
     @torch.no_grad()
     def sample(
         self,
@@ -83,6 +118,10 @@ class FlowEulerSampler(Sampler):
         steps: int = 50,
         rescale_t: float = 1.0,
         verbose: bool = True,
+        trajectory_stride: int = 0,
+        callback: Optional[Callable[[int, float, Any], None]] = None,
+        solver: Literal["euler", "heun"] = "euler",
+        early_exit_tol: float = 0.0,
         **kwargs
     ):
         """
@@ -95,24 +134,52 @@ class FlowEulerSampler(Sampler):
             steps: The number of steps to sample.
             rescale_t: The rescale factor for t.
             verbose: If True, show a progress bar.
+            trajectory_stride: Keep the intermediate predictions of every n-th step, 0 keeps none.
+            callback: Called as callback(step, t, out) after every step, where out holds 'pred_x_prev' and 'pred_x_0'.
+            solver: "euler", or "heun" for Heun's method, which needs fewer steps for the same quality.
+            early_exit_tol: Once the prediction of x_0 changes less than this, relative to its norm, from one step
+                to the next, return it instead of sampling the remaining steps. Only below t = 0.5 and past the jumps of
+                the prediction, like the end of the guidance interval, before that x_0 can stall and change again.
+                0 samples every step.
             **kwargs: Additional arguments for model_inference.
 
         Returns:
             a dict containing the following
             - 'samples': the model samples.
-            - 'pred_x_t': a list of prediction of x_t.
-            - 'pred_x_0': a list of prediction of x_0.
+            - 'pred_x_t': a list of prediction of x_t, empty unless trajectory_stride > 0.
+            - 'pred_x_0': a list of prediction of x_0, empty unless trajectory_stride > 0.
         """
         sample = noise
         t_seq = np.linspace(1, 0, steps + 1)
         t_seq = rescale_t * t_seq / (1 + (rescale_t - 1) * t_seq)
+        breakpoints = self._schedule_breakpoints(**kwargs)
+        if solver == "heun" and steps > 1:
+            # Move the closest timesteps onto the jumps of the prediction, so that no step crosses one
+            for t_break in breakpoints:
+                t_seq[1 + np.abs(t_seq[1:-1] - t_break).argmin()] = t_break
+        early_exit_t = min([0.5, *breakpoints])
         t_pairs = list((t_seq[i], t_seq[i + 1]) for i in range(steps))
         ret = edict({"samples": None, "pred_x_t": [], "pred_x_0": []})
-        for t, t_prev in tqdm(t_pairs, desc="Sampling", disable=not verbose):
-            out = self.sample_once(model, sample, t, t_prev, cond, **kwargs)
+        sample_once = self.sample_once_heun if solver == "heun" else self.sample_once
+        prev_pred_x_0 = None
+        for step, (t, t_prev) in enumerate(tqdm(t_pairs, desc="Sampling", disable=not verbose)):
+            out = sample_once(model, sample, t, t_prev, cond, **kwargs)
             sample = out.pred_x_prev
-            ret.pred_x_t.append(out.pred_x_prev)
-            ret.pred_x_0.append(out.pred_x_0)
+            converged = early_exit_tol > 0 and prev_pred_x_0 is not None and t < early_exit_t and \
+                self._relative_change(out.pred_x_0, prev_pred_x_0) < early_exit_tol
+            if converged:
+                # The remaining steps would land on the same x_0
+                sample = out.pred_x_0
+            if callback is not None:
+                callback(step, t, out)
+            if trajectory_stride > 0 and (step % trajectory_stride == 0 or step == steps - 1 or converged):
+                ret.pred_x_t.append(out.pred_x_prev)
+                ret.pred_x_0.append(out.pred_x_0)
+            if converged:
+                break
+            prev_pred_x_0 = out.pred_x_0 if early_exit_tol > 0 else None
+            # Drop the references so only the current sample stays alive between steps
+            del out
         ret.samples = sample
         return ret
 
@@ -132,6 +199,8 @@ class FlowEulerCfgSampler(ClassifierFreeGuidanceSamplerMixin, FlowEulerSampler):
         rescale_t: float = 1.0,
         cfg_strength: float = 3.0,
         verbose: bool = True,
+        trajectory_stride: int = 0,
+        callback: Optional[Callable[[int, float, Any], None]] = None,
         **kwargs
     ):
         """
@@ -146,15 +215,17 @@ class FlowEulerCfgSampler(ClassifierFreeGuidanceSamplerMixin, FlowEulerSampler):
             rescale_t: The rescale factor for t.
             cfg_strength: The strength of classifier-free guidance.
             verbose: If True, show a progress bar.
+            trajectory_stride: Keep the intermediate predictions of every n-th step, 0 keeps none.
+            callback: Called as callback(step, t, out) after every step.
             **kwargs: Additional arguments for model_inference.
 
         Returns:
             a dict containing the following
             - 'samples': the model samples.
-            - 'pred_x_t': a list of prediction of x_t.
-            - 'pred_x_0': a list of prediction of x_0.
+            - 'pred_x_t': a list of prediction of x_t, empty unless trajectory_stride > 0.
+            - 'pred_x_0': a list of prediction of x_0, empty unless trajectory_stride > 0.
         """
-        return super().sample(model, noise, cond, steps, rescale_t, verbose, neg_cond=neg_cond, cfg_strength=cfg_strength, **kwargs)
+        return super().sample(model, noise, cond, steps, rescale_t, verbose, trajectory_stride, callback, neg_cond=neg_cond, cfg_strength=cfg_strength, **kwargs)
 
 
 class FlowEulerGuidanceIntervalSampler(GuidanceIntervalSamplerMixin, FlowEulerSampler):
@@ -173,6 +244,8 @@ class FlowEulerGuidanceIntervalSampler(GuidanceIntervalSamplerMixin, FlowEulerSa
         cfg_strength: float = 3.0,
         cfg_interval: Tuple[float, float] = (0.0, 1.0),
         verbose: bool = True,
+        trajectory_stride: int = 0,
+        callback: Optional[Callable[[int, float, Any], None]] = None,
         **kwargs
     ):
         """
@@ -188,12 +261,14 @@ class FlowEulerGuidanceIntervalSampler(GuidanceIntervalSamplerMixin, FlowEulerSa
             cfg_strength: The strength of classifier-free guidance.
             cfg_interval: The interval for classifier-free guidance.
             verbose: If True, show a progress bar.
+            trajectory_stride: Keep the intermediate predictions of every n-th step, 0 keeps none.
+            callback: Called as callback(step, t, out) after every step.
             **kwargs: Additional arguments for model_inference.
 
         Returns:
             a dict containing the following
             - 'samples': the model samples.
-            - 'pred_x_t': a list of prediction of x_t.
-            - 'pred_x_0': a list of prediction of x_0.
+            - 'pred_x_t': a list of prediction of x_t, empty unless trajectory_stride > 0.
+            - 'pred_x_0': a list of prediction of x_0, empty unless trajectory_stride > 0.
         """
-        return super().sample(model, noise, cond, steps, rescale_t, verbose, neg_cond=neg_cond, cfg_strength=cfg_strength, cfg_interval=cfg_interval, **kwargs)
+        return super().sample(model, noise, cond, steps, rescale_t, verbose, trajectory_stride, callback, neg_cond=neg_cond, cfg_strength=cfg_strength, cfg_interval=cfg_interval, **kwargs)
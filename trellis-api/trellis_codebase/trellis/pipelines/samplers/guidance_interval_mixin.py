@@ -1,15 +1,26 @@
 from typing import *
+from .classifier_free_guidance_mixin import ClassifierFreeGuidanceSamplerMixin
 
 
-class GuidanceIntervalSamplerMixin:
+class GuidanceIntervalSamplerMixin(ClassifierFreeGuidanceSamplerMixin):
     """
     A mixin class for samplers that apply classifier-free guidance with interval.
     """
 
-    def _inference_model(self, model, x_t, t, cond, neg_cond, cfg_strength, cfg_interval, **kwargs):
-        if cfg_interval[0] <= t <= cfg_interval[1]:
-            pred = super()._inference_model(model, x_t, t, cond, **kwargs)
-            neg_pred = super()._inference_model(model, x_t, t, neg_cond, **kwargs)
-            return (1 + cfg_strength) * pred - cfg_strength * neg_pred
+    def _inference_model(self, model, x_t, t, cond, neg_cond, cfg_strength, cfg_interval, guided=None, **kwargs):
+        if guided is None:
+            guided = cfg_interval[0] <= t <= cfg_interval[1]
+        if guided:
+            return super()._inference_model(model, x_t, t, cond, neg_cond, cfg_strength, **kwargs)
         else:
-            return super()._inference_model(model, x_t, t, cond, **kwargs)
+            return super(ClassifierFreeGuidanceSamplerMixin, self)._inference_model(model, x_t, t, cond, **kwargs)
+
+    def sample_once_heun(self, model, x_t, t, t_prev, cond=None, **kwargs):
+        # Both evaluations of a step are guided or neither, by where the middle of the step falls,
+        # the guidance switching within a step would break the second order of Heun's method
+        cfg_interval = kwargs['cfg_interval']
+        guided = cfg_interval[0] <= (t + t_prev) / 2 <= cfg_interval[1]
+        return super().sample_once_heun(model, x_t, t, t_prev, cond, guided=guided, **kwargs)
+
+    def _schedule_breakpoints(self, cfg_interval, **kwargs):
+        return [bound for bound in cfg_interval if 0 < bound < 1]
@@ -1,7 +1,9 @@
 import gc
 import os
+import itertools
 from typing import * # type: ignore
-from contextlib import contextmanager # type: ignore
+from contextlib import contextmanager, nullcontext # type: ignore
+from concurrent.futures import ThreadPoolExecutor
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -16,6 +18,7 @@ from . import samplers
 from ..modules import sparse as sp
 from ..representations import Gaussian, Strivec, MeshExtractResult
 from ...models import Img23DTask, SqliteImg23dTask
+from ...progress_bus import TaskProgressBus
 from ..utils import postprocessing_utils
 from ...utils import absolute_path, DINOV2_FOLDER, DINOV2_PRETRAINED_MODEL_PATH, OUTPUTS_DIR
 import traceback
@@ -23,6 +26,9 @@ import logging
 
 logger = logging.getLogger("trellis")
 
+# Builds and exports the voxel previews, so the sampling stage doesn't hold the gpu lock for them.
+# A single worker runs the previews and their cleanup in submission order.
+_preview_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trellis-preview")
 
 
 class TrellisImageTo3DPipeline(Pipeline):
@@ -36,6 +42,44 @@ class TrellisImageTo3DPipeline(Pipeline):
         slat_normalization (dict): The normalization parameters for the structured latent.
         image_cond_model (str): The name of the image conditioning model.
     """
+    # The order a job uses the models in, for placing them in dynamic device mode
+    model_use_order = [
+        'image_cond_model',
+        'sparse_structure_flow_model',
+        'sparse_structure_decoder',
+        'slat_flow_model',
+        'slat_decoder_mesh',
+        'slat_decoder_gs',
+        'slat_decoder_rf',
+    ]
+
+    # The texture baking preset of the 'model' output type, see `postprocessing_utils.TEXTURE_BAKE_PRESETS`
+    texture_preset = 'quality'
+
+    # Whether to publish a voxel preview after sampling the sparse structure and an untextured mesh preview after decoding
+    publish_previews = True
+
+    # Thickness in voxels of the slabs decoding the occupancy grid one after the other, 0 to decode it at once
+    occupancy_slab_size = 0
+
+    # Sampler params of every speed tier of the tasks, over the ones of pipeline.json.
+    # Heun's method takes two model evaluations per step but far fewer steps than Euler's,
+    # and the early exit stops sampling once the prediction of x_0 settles.
+    speed_tiers = {
+        'quality': {
+            'sparse_structure': {},
+            'slat': {},
+        },
+        'balanced': {
+            'sparse_structure': {'solver': 'heun', 'steps': 8},
+            'slat': {'solver': 'heun', 'steps': 8},
+        },
+        'fast': {
+            'sparse_structure': {'solver': 'heun', 'steps': 5, 'early_exit_tol': 0.01},
+            'slat': {'solver': 'heun', 'steps': 5, 'early_exit_tol': 0.01},
+        },
+    }
+
     def __init__(
         self,
         models: dict[str, nn.Module] = None,
@@ -95,6 +139,13 @@ class TrellisImageTo3DPipeline(Pipeline):
         ])
         self.image_cond_model_transform = transform
 
+    @property
+    def compute_device(self) -> torch.device:
+        """
+        The device the models run on while they are in use, even if they are parked on cpu in dynamic mode.
+        """
+        return torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+
     def preprocess_image(self, input: Image.Image) -> Image.Image:
         """
         Preprocess the input image.
@@ -171,24 +222,44 @@ class TrellisImageTo3DPipeline(Pipeline):
         Returns:
             dict: The conditioning information
         """
-        if self.device_mode == "dynamic":
-            with MoveModelsToCuda(['image_cond_model'], self) as mm:
-                cond = self.encode_image(image)
-                neg_cond = torch.zeros_like(cond)
-        else:
+        with self._use_models(['image_cond_model']):
+            self._prefetch_models(['sparse_structure_flow_model', 'sparse_structure_decoder'])
             cond = self.encode_image(image)
             neg_cond = torch.zeros_like(cond)
         return {
             'cond': cond,
             'neg_cond': neg_cond,
         }
-    
+
+    @torch.no_grad()
+    def warmup_sparse_structure_flow_model(self, max_batch_size: int = 1) -> None:
+        """
+        Run the sparse structure flow model once for every batch size a job can sample with,
+        so that a compiled model compiles when the server starts instead of during the first jobs.
+
+        Args:
+            max_batch_size (int): The largest number of jobs sampled together.
+        """
+        cond = self.get_cond([Image.new('RGB', (518, 518))])['cond']
+        batch_sizes = set(range(1, max_batch_size + 1))
+        if self.sparse_structure_sampler.batched_cfg:
+            # The conditional and unconditional passes run as one doubled batch inside the guidance interval
+            batch_sizes |= {2 * batch_size for batch_size in batch_sizes}
+        with self._use_models(['sparse_structure_flow_model']):
+            flow_model = self.models['sparse_structure_flow_model']
+            reso = flow_model.resolution
+            desired_dtype = next(flow_model.parameters()).dtype
+            for batch_size in sorted(batch_sizes):
+                noise = torch.zeros(batch_size, flow_model.in_channels, reso, reso, reso, dtype=desired_dtype).to(self.device)
+                t = torch.full((batch_size, ), 1000.0, device=self.device)
+                flow_model(noise, t, cond.repeat(batch_size, 1, 1))
 
     def sample_sparse_structure(
         self,
         cond: dict,
         num_samples: int = 1,
         sampler_params: dict = {},
+        generators: Optional[List[torch.Generator]] = None,
     ) -> torch.Tensor:
         """
         Sample sparse structures with the given conditioning.
@@ -197,33 +268,20 @@ class TrellisImageTo3DPipeline(Pipeline):
             cond (dict): The conditioning information.
             num_samples (int): The number of samples to generate.
             sampler_params (dict): Additional parameters for the sampler.
+            generators (List[torch.Generator]): One random generator per sample to draw its noise from, the global one if None.
         """
         # Sample occupancy latent
-        if self.device_mode == "dynamic":
-            with MoveModelsToCuda(model_names=['sparse_structure_flow_model', 'sparse_structure_decoder'], pipeline=self) as mm:
-                flow_model = self.models['sparse_structure_flow_model']
-                reso = flow_model.resolution
-                desired_dtype = next(flow_model.parameters()).dtype #so that it workws with float16, float32, etc.
-                noise = torch.randn(num_samples, flow_model.in_channels, reso, reso, reso, dtype=desired_dtype).to(self.device)
-                sampler_params = {**self.sparse_structure_sampler_params, **sampler_params}
-                z_s = self.sparse_structure_sampler.sample(
-                    flow_model,
-                    noise,
-                    **cond,
-                    **sampler_params,
-                    verbose=True,
-                ).samples
-                
-                # Decode occupancy latent
-                decoder = self.models['sparse_structure_decoder']
-                coords = torch.argwhere(decoder(z_s)>0)[:, [0, 2, 3, 4]].int()
-                
-                return coords
-        else: 
+        with self._use_models(['sparse_structure_flow_model', 'sparse_structure_decoder']):
+            self._prefetch_models(['slat_flow_model'])
             flow_model = self.models['sparse_structure_flow_model']
             reso = flow_model.resolution
             desired_dtype = next(flow_model.parameters()).dtype #so that it workws with float16, float32, etc.
-            noise = torch.randn(num_samples, flow_model.in_channels, reso, reso, reso, dtype=desired_dtype).to(self.device)
+            noise_shape = (flow_model.in_channels, reso, reso, reso)
+            if generators is None:
+                noise = torch.randn(num_samples, *noise_shape, dtype=desired_dtype)
+            else:
+                noise = torch.cat([torch.randn(1, *noise_shape, generator=generator, dtype=desired_dtype) for generator in generators])
+            noise = noise.to(self.device)
             sampler_params = {**self.sparse_structure_sampler_params, **sampler_params}
             z_s = self.sparse_structure_sampler.sample(
                 flow_model,
@@ -235,7 +293,7 @@ class TrellisImageTo3DPipeline(Pipeline):
             
             # Decode occupancy latent
             decoder = self.models['sparse_structure_decoder']
-            coords = torch.argwhere(decoder(z_s)>0)[:, [0, 2, 3, 4]].int()
+            coords = decoder.decode_coords(z_s, slab_size=self.occupancy_slab_size)
             
             return coords
     
@@ -244,6 +302,7 @@ class TrellisImageTo3DPipeline(Pipeline):
         cond: dict,
         coords: torch.Tensor,
         sampler_params: dict = {},
+        generators: Optional[List[torch.Generator]] = None,
     ) -> sp.SparseTensor:
         """
         Sample structured latent with the given conditioning.
@@ -252,34 +311,23 @@ class TrellisImageTo3DPipeline(Pipeline):
             cond (dict): The conditioning information.
             coords (torch.Tensor): The coordinates of the sparse structure.
             sampler_params (dict): Additional parameters for the sampler.
+            generators (List[torch.Generator]): One random generator per sample to draw the noise of its voxels from, the global one if None.
         """
         # Sample structured latent
-        if self.device_mode == "dynamic":
-            with MoveModelsToCuda(['slat_flow_model'], self) as mm:
-                flow_model = self.models['slat_flow_model']
-                desired_dtype = next(flow_model.parameters()).dtype #so that it workws with float16, float32, etc.
-                noise = sp.SparseTensor(
-                    feats=torch.randn(coords.shape[0], flow_model.in_channels, dtype=desired_dtype).to(self.device),
-                    coords=coords,
-                )
-                sampler_params = {**self.slat_sampler_params, **sampler_params}
-                slat = self.slat_sampler.sample(
-                    flow_model,
-                    noise,
-                    **cond,
-                    **sampler_params,
-                    verbose=True
-                ).samples
-
-                std = torch.tensor(self.slat_normalization['std'])[None].to(slat.device)
-                mean = torch.tensor(self.slat_normalization['mean'])[None].to(slat.device)
-                slat = slat * std + mean
-                return slat
-        else:
+        with self._use_models(['slat_flow_model']):
+            self._prefetch_models(['slat_decoder_mesh'])
             flow_model = self.models['slat_flow_model']
             desired_dtype = next(flow_model.parameters()).dtype #so that it workws with float16, float32, etc.
+            if generators is None:
+                feats = torch.randn(coords.shape[0], flow_model.in_channels, dtype=desired_dtype)
+            else:
+                feats = torch.empty(coords.shape[0], flow_model.in_channels, dtype=desired_dtype)
+                batch_indices = coords[:, 0].cpu()
+                for i, generator in enumerate(generators):
+                    mask = batch_indices == i
+                    feats[mask] = torch.randn(int(mask.sum()), flow_model.in_channels, generator=generator, dtype=desired_dtype)
             noise = sp.SparseTensor(
-                feats=torch.randn(coords.shape[0], flow_model.in_channels, dtype=desired_dtype).to(self.device),
+                feats=feats.to(self.device),
                 coords=coords,
             )
             sampler_params = {**self.slat_sampler_params, **sampler_params}
@@ -317,37 +365,265 @@ class TrellisImageTo3DPipeline(Pipeline):
         if 'mesh' in formats:
             torch.cuda.synchronize() #important, to avoid Out Of Memory exceptions
             with torch.no_grad():
-                if self.device_mode == "dynamic":
-                    with MoveModelsToCuda(model_names=["slat_decoder_mesh"], pipeline=self) as mm:
-                        ret['mesh'] = self.models['slat_decoder_mesh'](slat)
-                        torch.cuda.synchronize() 
-                else:
+                with self._use_models(["slat_decoder_mesh"]):
+                    if 'gaussian' in formats:
+                        self._prefetch_models(["slat_decoder_gs"])
                     ret['mesh'] = self.models['slat_decoder_mesh'](slat)
                     torch.cuda.synchronize() 
         if 'gaussian' in formats:
             torch.cuda.synchronize() #important, to avoid OOM exceptions
             with torch.no_grad():
-                if self.device_mode == "dynamic":
-                    with MoveModelsToCuda(["slat_decoder_gs"], self) as mm:
-                        ret['gaussian'] = self.models['slat_decoder_gs'](slat)
-                        torch.cuda.synchronize()
-                else:
+                with self._use_models(["slat_decoder_gs"]):
                     ret['gaussian'] = self.models['slat_decoder_gs'](slat)
                     torch.cuda.synchronize()
         
         if 'radiance_field' in formats:
             torch.cuda.synchronize() #important, to avoid OOM exceptions
             with torch.no_grad():
-                if self.device_mode == "dynamic":
-                    with MoveModelsToCuda(["slat_decoder_rf"], self) as mm:
-                        ret['radiance_field'] = self.models['slat_decoder_rf'](slat)
-                        torch.cuda.synchronize()
-                else:
+                with self._use_models(["slat_decoder_rf"]):
                     ret['radiance_field'] = self.models['slat_decoder_rf'](slat)
-                    torch.cuda.synchronize() 
+                    torch.cuda.synchronize()
         return ret
+
+    def _use_models(self, model_names: List[str]):
+        """
+        Keep the models on the device while the block runs, they are only moved around in dynamic device mode.
+        """
+        if self.device_mode == "dynamic":
+            return self.residency.use(model_names)
+        return nullcontext()
+
+    def _prefetch_models(self, model_names: List[str]) -> None:
+        """
+        Start loading the models of the next stage while the current one runs, only in dynamic device mode.
+        """
+        if self.device_mode == "dynamic":
+            self.residency.prefetch(model_names)
     
     
+    @torch.no_grad()
+    def run_preprocess(
+        self,
+        image: Image.Image,
+        task: Img23DTask,
+    ) -> Image.Image:
+        """
+        First stage of `run`: remove the background and crop the image if the task asks for it.
+        Only uses the CPU.
+
+        Args:
+            image (Image.Image): The image prompt.
+            task (Img23DTask): The task to report progress to.
+        """
+        task.generate_status = "generating"
+        self._update_task(task)
+        if task.preprocess_image:
+            task.progress = 15
+            self._update_task(task)
+            image = self.preprocess_image(image)
+        task.progress = 30
+        self._update_task(task)
+        return image
+
+    @torch.no_grad()
+    def run_sampling(
+        self,
+        image: Image.Image,
+        task: Img23DTask,
+        num_samples: int = 1,
+        seed: int = 42,
+        sparse_structure_sampler_params: dict = {},
+        slat_sampler_params: dict = {},
+    ) -> sp.SparseTensor:
+        """
+        Second stage of `run`: encode the image and sample the sparse structure and the structured latent.
+
+        Args:
+            image (Image.Image): The preprocessed image prompt.
+            task (Img23DTask): The task to report progress to.
+            num_samples (int): The number of samples to generate.
+            seed (int): The random seed.
+            sparse_structure_sampler_params (dict): Additional parameters for the sparse structure sampler, over the ones of the speed tier of the task.
+            slat_sampler_params (dict): Additional parameters for the structured latent sampler, over the ones of the speed tier of the task.
+        """
+        if self.device_mode == "dynamic":
+            # Start from the models the vram budget allows to keep
+            self.residency.trim()
+
+        speed_tier = self.speed_tiers[task.speed_tier]
+        sparse_structure_sampler_params = {**speed_tier['sparse_structure'], **sparse_structure_sampler_params}
+        slat_sampler_params = {**speed_tier['slat'], **slat_sampler_params}
+
+        cond = self.get_cond([image])
+        task.progress = 45
+        self._update_task(task)
+
+        # A generator of its own, the global one is shared with the jobs of the other stages
+        generators = [torch.Generator().manual_seed(seed)] * num_samples
+
+        coords = self.sample_sparse_structure(cond, num_samples, sparse_structure_sampler_params, generators)
+        task.progress = 65
+        self._update_task(task)
+        self._publish_voxel_preview(task, coords[coords[:, 0] == 0, 1:])
+
+        slat = self.sample_slat(cond, coords, slat_sampler_params, generators)
+        task.progress = 75
+        self._update_task(task)
+        return slat
+
+    @torch.no_grad()
+    def run_sampling_batch(
+        self,
+        images: List[Optional[Image.Image]],
+        tasks: List[Img23DTask],
+        seed: int = 42,
+        sparse_structure_sampler_params: dict = {},
+        slat_sampler_params: dict = {},
+        conds: Optional[List[Optional[torch.Tensor]]] = None,
+    ) -> List[edict]:
+        """
+        Same as `run_sampling`, but samples one structured latent for each of several tasks in a single batch.
+        The noise of every task is drawn from a generator of its own seeded with `seed`, the same noise as `run_sampling` draws,
+        so the result of a task doesn't depend on the tasks batched with it.
+
+        Args:
+            images (List[Image.Image]): The preprocessed image prompts, one per task, None where the condition is given.
+            tasks (List[Img23DTask]): The tasks to report progress to, all of the same speed tier.
+            seed (int): The random seed of every task.
+            sparse_structure_sampler_params (dict): Additional parameters for the sparse structure sampler, over the ones of the speed tier.
+            slat_sampler_params (dict): Additional parameters for the structured latent sampler, over the ones of the speed tier.
+            conds (List[torch.Tensor]): Already encoded image conditions, one per task, None where the image must be encoded.
+
+        Returns:
+            List[edict]: For each task, its image condition 'cond', sparse structure 'coords' and structured latent 'slat'.
+        """
+        if self.device_mode == "dynamic":
+            # Start from the models the vram budget allows to keep
+            self.residency.trim()
+
+        assert len({task.speed_tier for task in tasks}) == 1, "Tasks of different speed tiers can't be sampled together"
+        speed_tier = self.speed_tiers[tasks[0].speed_tier]
+        sparse_structure_sampler_params = {**speed_tier['sparse_structure'], **sparse_structure_sampler_params}
+        slat_sampler_params = {**speed_tier['slat'], **slat_sampler_params}
+
+        conds = list(conds) if conds is not None else [None] * len(tasks)
+        missing = [i for i, c in enumerate(conds) if c is None]
+        if missing:
+            encoded = self.get_cond([images[i] for i in missing])['cond']
+            for j, i in enumerate(missing):
+                conds[i] = encoded[j:j+1]
+        cond = torch.cat([c.to(self.compute_device) for c in conds], dim=0)
+        cond = {
+            'cond': cond,
+            'neg_cond': torch.zeros_like(cond),
+        }
+        for task in tasks:
+            task.progress = 45
+            self._update_task(task)
+
+        generators = [torch.Generator().manual_seed(seed) for _ in tasks]
+
+        coords = self.sample_sparse_structure(cond, len(tasks), sparse_structure_sampler_params, generators)
+        for i, task in enumerate(tasks):
+            task.progress = 65
+            self._update_task(task)
+            self._publish_voxel_preview(task, coords[coords[:, 0] == i, 1:])
+
+        slat = self.sample_slat(cond, coords, slat_sampler_params, generators)
+        for task in tasks:
+            task.progress = 75
+            self._update_task(task)
+
+        slats = [slat] if len(tasks) == 1 else [slat[i] for i in range(len(tasks))]
+        return [
+            edict(cond=conds[i], coords=slats[i].coords, slat=slats[i])
+            for i in range(len(tasks))
+        ]
+
+    def resume_task(self, task: Img23DTask, progress: int) -> None:
+        """
+        Mark a task as generating from a later stage, when its intermediate results were cached.
+        """
+        task.generate_status = "generating"
+        task.progress = progress
+        self._update_task(task)
+
+    @torch.no_grad()
+    def run_decoding(
+        self,
+        slat: sp.SparseTensor,
+        task: Img23DTask,
+    ) -> dict:
+        """
+        Third stage of `run`: decode the structured latent into the formats required by the task output type.
+
+        Args:
+            slat (sp.SparseTensor): The structured latent.
+            task (Img23DTask): The task to report progress to.
+        """
+        if task.output_type == "base_model":
+            formats = ["mesh"]
+        elif task.output_type == "model":
+            formats = ["mesh", "gaussian"]
+        elif task.output_type == "gaussian":
+            formats = ["gaussian"]
+        decoded_slat = self.decode_slat(slat, formats)
+        # The attention partitions of this job's coordinates won't be used again
+        sp.clear_partition_cache()
+        task.progress = 90
+        self._update_task(task)
+        return decoded_slat
+
+    @torch.no_grad()
+    def run_postprocessing(
+        self,
+        decoded_slat: dict,
+        task: Img23DTask,
+    ) -> str:
+        """
+        Last stage of `run`: simplify, bake and export the decoded result to a glb file in the outputs folder.
+        Gaussian outputs skip the mesh postprocessing and are saved as a ply file as is.
+
+        Args:
+            decoded_slat (dict): The decoded structured latent.
+            task (Img23DTask): The task to report progress to.
+
+        Returns:
+            str: The path of the exported file.
+        """
+        if task.output_type == "gaussian":
+            ply_path = os.path.normpath(f"{OUTPUTS_DIR}/{task.tid}.ply")
+            decoded_slat["gaussian"][0].save_ply(ply_path)
+            task.output_url = f"/download?extension=ply&token={task.tid}"
+            self._discard_previews(task)
+            task.progress = 100
+            task.generate_status = "generating_end"
+            self._update_task(task)
+            return ply_path
+        self._publish_preview(task, "mesh", lambda: postprocessing_utils.preview_mesh(decoded_slat["mesh"][0]))
+        with torch.enable_grad():
+            if task.output_type == "base_model":
+                mesh = postprocessing_utils.to_glb(
+                    mesh=decoded_slat["mesh"][0], 
+                    get_base_model=True, 
+                )
+            if task.output_type == "model":
+                mesh = postprocessing_utils.to_glb(
+                    mesh=decoded_slat["mesh"][0], 
+                    get_base_model=False, 
+                    app_rep=decoded_slat["gaussian"][0], 
+                    preset=self.texture_preset, 
+                )
+        glb_path = os.path.normpath(f"{OUTPUTS_DIR}/{task.tid}.glb")
+        mesh.export(glb_path)
+        task.output_url = f"/download?extension=glb&token={task.tid}"
+        self._discard_previews(task)
+        task.progress = 100
+        task.generate_status = "generating_end"
+        self._update_task(task)
+        gc.collect()
+        return glb_path
+
     @torch.no_grad()
     def run(
         self,
@@ -369,74 +645,77 @@ class TrellisImageTo3DPipeline(Pipeline):
             preprocess_image (bool): Whether to preprocess the image.
         """
         try:
-            from ...trellis_generator import TrellisGenerator
-            trellis_generator = TrellisGenerator.instance()
-            if task.output_type == "base_model":
-                formats = ["mesh"]
-            elif task.output_type == "model":
-                formats = ["mesh", "gaussian"]
-            preprocess_image = task.preprocess_image
+            image = self.run_preprocess(image, task)
+            slat = self.run_sampling(image, task, num_samples, seed, sparse_structure_sampler_params, slat_sampler_params)
+            decoded_slat = self.run_decoding(slat, task)
+            self.run_postprocessing(decoded_slat, task)
+        except Exception as e:
+            self.fail_task(task, e)
 
-            task.generate_status = "generating"
-            trellis_generator.sqlite_img23d_task.update_item(task)
-            
-            if self.device_mode == "dynamic":
-                with MoveModelsToCpu(list(self.models.keys()), pipeline=self) as mmc:
-                    pass
-
-            if preprocess_image:
-                task.progress = 15
-                trellis_generator.sqlite_img23d_task.update_item(task)
-                image = self.preprocess_image(image)
-            task.progress = 30
-            trellis_generator.sqlite_img23d_task.update_item(task)
-            cond = self.get_cond([image])
-            task.progress = 45
-            trellis_generator.sqlite_img23d_task.update_item(task) 
+    def fail_task(self, task: Img23DTask, e: Exception) -> None:
+        """
+        Mark the task as failed and log the error.
+        """
+        task.generate_status = "generating_failed"
+        task.generate_failed_message = f"Generation failed because error happened: {e}"
+        self._discard_previews(task)
+        self._update_task(task)
+        logger.error(traceback.format_exc())
 
-            torch.manual_seed(seed)
+    def _publish_voxel_preview(self, task: Img23DTask, coords: torch.Tensor) -> None:
+        """
+        Publish the voxel preview of a task from the preview thread, only the coordinates are copied in the calling stage.
+        """
+        if not self.publish_previews:
+            return
+        resolution = self.models['slat_flow_model'].resolution
+        coords = coords.cpu()
+        _preview_executor.submit(self._publish_preview, task, "voxel", lambda: postprocessing_utils.preview_voxels(coords, resolution))
 
-            coords = self.sample_sparse_structure(cond, num_samples, sparse_structure_sampler_params)
-            task.progress = 65
-            trellis_generator.sqlite_img23d_task.update_item(task)
+    def _publish_preview(self, task: Img23DTask, kind: Literal["voxel", "mesh"], build: Callable[[], Any]) -> None:
+        """
+        Export a preview of the task to the outputs folder and publish its download url.
+        The preview is best effort, the task goes on without it if it fails.
 
-            slat = self.sample_slat(cond, coords, slat_sampler_params)
-            task.progress = 75
-            trellis_generator.sqlite_img23d_task.update_item(task)
-
-            decoded_slat = self.decode_slat(slat, formats)
-            task.progress = 90
-            trellis_generator.sqlite_img23d_task.update_item(task)
-            with torch.enable_grad():
-                if task.output_type == "base_model":
-                    mesh = postprocessing_utils.to_glb(
-                        mesh=decoded_slat["mesh"][0], 
-                        get_base_model=True, 
-                    )
-                    glb_path = os.path.normpath(f"{OUTPUTS_DIR}/{task.tid}.glb")
-                    mesh.export(glb_path)
-                    task.output_url = f"/download?extension=glb&token={task.tid}"
-                    task.progress = 100
-                    task.generate_status = "generating_end"
-                    trellis_generator.sqlite_img23d_task.update_item(task)
-                if task.output_type == "model":
-                    mesh = postprocessing_utils.to_glb(
-                        mesh=decoded_slat["mesh"][0], 
-                        get_base_model=False, 
-                        app_rep=decoded_slat["gaussian"][0], 
-                    )
-                    glb_path = os.path.normpath(f"{OUTPUTS_DIR}/{task.tid}.glb")
-                    mesh.export(glb_path)
-                    task.output_url = f"/download?extension=glb&token={task.tid}"
-                    task.progress = 100
-                    task.generate_status = "generating_end"
-                    trellis_generator.sqlite_img23d_task.update_item(task)
-            gc.collect()
+        Args:
+            task (Img23DTask): The task to publish the preview of.
+            kind (str): The kind of preview, names the `{kind}_preview_url` field of the task.
+            build (Callable): Builds the preview trimesh, only called if previews are published.
+        """
+        if not self.publish_previews or task.output_url is not None or task.generate_status == "generating_failed":
+            # Too late for a preview, the task is already over
+            return
+        token = f"{task.tid}_{kind}"
+        try:
+            build().export(os.path.normpath(f"{OUTPUTS_DIR}/{token}.glb"))
         except Exception as e:
-            task.generate_status = "generating_failed"
-            task.generate_failed_message = f"Generation failed because error happened: {e}"
-            trellis_generator.sqlite_img23d_task.update_item(task)
-            logger.error(traceback.format_exc())
+            logger.warning(f"Can't publish the {kind} preview of task {task.tid}: {e}")
+            return
+        setattr(task, f"{kind}_preview_url", f"/download?extension=glb&token={token}")
+        self._update_task(task)
+
+    def _discard_previews(self, task: Img23DTask) -> None:
+        """
+        Drop the preview urls of a task once it is over, and delete the preview files after the previews still queued.
+        """
+        task.voxel_preview_url = None
+        task.mesh_preview_url = None
+        _preview_executor.submit(self._remove_previews, task)
+
+    def _remove_previews(self, task: Img23DTask) -> None:
+        for kind in ("voxel", "mesh"):
+            path = os.path.normpath(f"{OUTPUTS_DIR}/{task.tid}_{kind}.glb")
+            if os.path.exists(path):
+                os.remove(path)
+        if task.voxel_preview_url is not None or task.mesh_preview_url is not None:
+            # A preview was published while the task was finishing
+            task.voxel_preview_url = None
+            task.mesh_preview_url = None
+            self._update_task(task)
+
+    def _update_task(self, task: Img23DTask) -> None:
+        SqliteImg23dTask.instance().update_item(task)
+        TaskProgressBus.instance().publish(task)
 
     @contextmanager
     def inject_sampler_multi_image(
@@ -462,16 +741,20 @@ class TrellisImageTo3DPipeline(Pipeline):
                 print(f"\033[93mWarning: number of conditioning images is greater than number of steps for {sampler_name}. "
                     "This may lead to performance degradation.\033[0m")
 
-            cond_indices = (np.arange(num_steps) % num_images).tolist()
+            # Cycle through the images, the heun solver evaluates the model twice per step
+            cond_indices = itertools.cycle(range(num_images))
             def _new_inference_model(self, model, x_t, t, cond, **kwargs):
-                cond_idx = cond_indices.pop(0)
+                cond_idx = next(cond_indices)
                 cond_i = cond[cond_idx:cond_idx+1]
                 return self._old_inference_model(model, x_t, t, cond=cond_i, **kwargs)
         
         elif mode =='multidiffusion':
             from .samplers import FlowEulerSampler
-            def _new_inference_model(self, model, x_t, t, cond, neg_cond, cfg_strength, cfg_interval, **kwargs):
-                if cfg_interval[0] <= t <= cfg_interval[1]:
+            def _new_inference_model(self, model, x_t, t, cond, neg_cond, cfg_strength, cfg_interval, guided=None, **kwargs):
+                # Honour the guidance decided for the whole step by the heun solver, like `GuidanceIntervalSamplerMixin`
+                if guided is None:
+                    guided = cfg_interval[0] <= t <= cfg_interval[1]
+                if guided:
                     preds = []
                     for i in range(len(cond)):
                         preds.append(FlowEulerSampler._inference_model(self, model, x_t, t, cond[i:i+1], **kwargs))
@@ -521,57 +804,11 @@ class TrellisImageTo3DPipeline(Pipeline):
             images = [self.preprocess_image(image) for image in images]
         cond = self.get_cond(images)
         cond['neg_cond'] = cond['neg_cond'][:1]
-        torch.manual_seed(seed)
+        generators = [torch.Generator().manual_seed(seed)] * num_samples
         ss_steps = {**self.sparse_structure_sampler_params, **sparse_structure_sampler_params}.get('steps')
         with self.inject_sampler_multi_image('sparse_structure_sampler', len(images), ss_steps, mode=mode):
-            coords = self.sample_sparse_structure(cond, num_samples, sparse_structure_sampler_params)
+            coords = self.sample_sparse_structure(cond, num_samples, sparse_structure_sampler_params, generators)
         slat_steps = {**self.slat_sampler_params, **slat_sampler_params}.get('steps')
         with self.inject_sampler_multi_image('slat_sampler', len(images), slat_steps, mode=mode):
-            slat = self.sample_slat(cond, coords, slat_sampler_params)
+            slat = self.sample_slat(cond, coords, slat_sampler_params, generators)
         return self.decode_slat(slat, formats)
-    
-    
-
-
-
-class MoveModelsToCuda:
-
-    def __init__(self, model_names: list[str], pipeline: TrellisImageTo3DPipeline):
-        self.model_names = model_names
-        self.pipeline = pipeline
-
-    def __enter__(self):
-        for name in self.model_names:
-            current_device = next(self.pipeline.models[name].parameters()).device #works for DinoVision, who doesn't have 'self.device'
-            target_device = torch.device("cuda")
-            # Only move if current device is different from target device
-            if current_device != target_device:
-                self.pipeline.models[name].to(target_device)
-        logger.debug(f"Move models {self.model_names} to cuda")
-
-    def __exit__(self, exc_type, exc_value, traceback):
-        for name in self.model_names:
-            current_device = next(self.pipeline.models[name].parameters()).device #works for DinoVision, who doesn't have 'self.device'
-            target_device = torch.device("cpu")
-            # Only move if current device is different from target device
-            if current_device != target_device:
-                self.pipeline.models[name].to(target_device)
-        torch.cuda.empty_cache()
-        logger.debug(f"Move models {self.model_names} to cpu")
-    
-class MoveModelsToCpu:
-
-    def __init__(self, model_names: list[str], pipeline: TrellisImageTo3DPipeline):
-        self.model_names = model_names
-        self.pipeline = pipeline
-
-    def __enter__(self):
-        for name in self.model_names:
-            current_device = next(self.pipeline.models[name].parameters()).device #works for DinoVision, who doesn't have 'self.device'
-            target_device = torch.device("cpu")
-            # Only move if current device is different from target device
-            if current_device != target_device:
-                self.pipeline.models[name].to(target_device)
-
-    def __exit__(self, exc_type, exc_value, traceback):
-        logger.debug(f"Move models {self.model_names} to cpu")
\ No newline at end of file
@@ -1,6 +1,6 @@
 import torch
 import numpy as np
-from plyfile import PlyData, PlyElement
+from .ply_io import PLY_CHUNK_BYTES, iter_vertex_ply, read_vertex_ply, write_vertex_ply
 from .general_utils import inverse_sigmoid, strip_symmetric, build_scaling_rotation
 import utils3d
 
@@ -63,10 +63,10 @@ class Gaussian:
 
         self.rotation_activation = torch.nn.functional.normalize
         
-        self.scale_bias = self.inverse_scaling_activation(torch.tensor(self.scaling_bias)).cuda()
-        self.rots_bias = torch.zeros((4)).cuda()
+        self.scale_bias = self.inverse_scaling_activation(torch.tensor(self.scaling_bias)).to(self.device)
+        self.rots_bias = torch.zeros((4)).to(self.device)
         self.rots_bias[0] = 1
-        self.opacity_bias = self.inverse_opacity_activation(torch.tensor(self.opacity_bias)).cuda()
+        self.opacity_bias = self.inverse_opacity_activation(torch.tensor(self.opacity_bias)).to(self.device)
 
     @property
     def get_scaling(self):
@@ -122,7 +122,14 @@ class Gaussian:
             l.append('rot_{}'.format(i))
         return l
         
-    def save_ply(self, path, transform=[[1, 0, 0], [0, 0, -1], [0, 1, 0]]):
+    def to_ply_attributes(self, transform=[[1, 0, 0], [0, 0, -1], [0, 1, 0]]):
+        """
+        The vertex properties of the PLY file of the gaussians.
+
+        Returns:
+            (List[str]): The names of the properties.
+            (np.ndarray): One float32 row per gaussian and one column per property.
+        """
         xyz = self.get_xyz.detach().cpu().numpy()
         normals = np.zeros_like(xyz)
         f_dc = self._features_dc.detach().transpose(1, 2).flatten(start_dim=1).contiguous().cpu().numpy()
@@ -137,55 +144,48 @@ class Gaussian:
             rotation = np.matmul(transform, rotation)
             rotation = utils3d.numpy.matrix_to_quaternion(rotation)
 
-        dtype_full = [(attribute, 'f4') for attribute in self.construct_list_of_attributes()]
+        attributes = np.concatenate((xyz, normals, f_dc, opacities, scale, rotation), axis=1, dtype=np.float32)
+        return self.construct_list_of_attributes(), attributes
+
+    def save_ply(self, path, transform=[[1, 0, 0], [0, 0, -1], [0, 1, 0]]):
+        names, attributes = self.to_ply_attributes(transform)
+        write_vertex_ply(path, attributes, names)
 
-        elements = np.empty(xyz.shape[0], dtype=dtype_full)
-        attributes = np.concatenate((xyz, normals, f_dc, opacities, scale, rotation), axis=1)
-        elements[:] = list(map(tuple, attributes))
-        el = PlyElement.describe(elements, 'vertex')
-        PlyData([el]).write(path)
+    def iter_ply(self, transform=[[1, 0, 0], [0, 0, -1], [0, 1, 0]], chunk_bytes=PLY_CHUNK_BYTES):
+        """
+        Serialize the gaussians to a PLY file chunk by chunk, e.g. for streaming it into a http response.
+        """
+        names, attributes = self.to_ply_attributes(transform)
+        return iter_vertex_ply(attributes, names, chunk_bytes)
 
     def load_ply(self, path, transform=[[1, 0, 0], [0, 0, -1], [0, 1, 0]]):
-        plydata = PlyData.read(path)
+        names, data = read_vertex_ply(path)
+        columns = {name: i for i, name in enumerate(names)}
 
-        xyz = np.stack((np.asarray(plydata.elements[0]["x"]),
-                        np.asarray(plydata.elements[0]["y"]),
-                        np.asarray(plydata.elements[0]["z"])),  axis=1)
-        opacities = np.asarray(plydata.elements[0]["opacity"])[..., np.newaxis]
+        def sorted_columns(prefix):
+            property_names = sorted([name for name in names if name.startswith(prefix)], key = lambda x: int(x.split('_')[-1]))
+            return data[:, [columns[name] for name in property_names]]
 
-        features_dc = np.zeros((xyz.shape[0], 3, 1))
-        features_dc[:, 0, 0] = np.asarray(plydata.elements[0]["f_dc_0"])
-        features_dc[:, 1, 0] = np.asarray(plydata.elements[0]["f_dc_1"])
-        features_dc[:, 2, 0] = np.asarray(plydata.elements[0]["f_dc_2"])
+        xyz = data[:, [columns["x"], columns["y"], columns["z"]]]
+        opacities = data[:, [columns["opacity"]]]
+
+        features_dc = data[:, [columns["f_dc_0"], columns["f_dc_1"], columns["f_dc_2"]]][..., np.newaxis]
 
         if self.sh_degree > 0:
-            extra_f_names = [p.name for p in plydata.elements[0].properties if p.name.startswith("f_rest_")]
-            extra_f_names = sorted(extra_f_names, key = lambda x: int(x.split('_')[-1]))
-            assert len(extra_f_names)==3*(self.sh_degree + 1) ** 2 - 3
-            features_extra = np.zeros((xyz.shape[0], len(extra_f_names)))
-            for idx, attr_name in enumerate(extra_f_names):
-                features_extra[:, idx] = np.asarray(plydata.elements[0][attr_name])
+            features_extra = sorted_columns("f_rest_")
+            assert features_extra.shape[1]==3*(self.sh_degree + 1) ** 2 - 3
             # Reshape (P,F*SH_coeffs) to (P, F, SH_coeffs except DC)
             features_extra = features_extra.reshape((features_extra.shape[0], 3, (self.max_sh_degree + 1) ** 2 - 1))
 
-        scale_names = [p.name for p in plydata.elements[0].properties if p.name.startswith("scale_")]
-        scale_names = sorted(scale_names, key = lambda x: int(x.split('_')[-1]))
-        scales = np.zeros((xyz.shape[0], len(scale_names)))
-        for idx, attr_name in enumerate(scale_names):
-            scales[:, idx] = np.asarray(plydata.elements[0][attr_name])
-
-        rot_names = [p.name for p in plydata.elements[0].properties if p.name.startswith("rot")]
-        rot_names = sorted(rot_names, key = lambda x: int(x.split('_')[-1]))
-        rots = np.zeros((xyz.shape[0], len(rot_names)))
-        for idx, attr_name in enumerate(rot_names):
-            rots[:, idx] = np.asarray(plydata.elements[0][attr_name])
+        scales = sorted_columns("scale_")
+        rots = sorted_columns("rot")
             
         if transform is not None:
             transform = np.array(transform)
             xyz = np.matmul(xyz, transform)
-            rotation = utils3d.numpy.quaternion_to_matrix(rotation)
-            rotation = np.matmul(rotation, transform)
-            rotation = utils3d.numpy.matrix_to_quaternion(rotation)
+            rots = utils3d.numpy.quaternion_to_matrix(rots)
+            rots = np.matmul(transform.T, rots)
+            rots = utils3d.numpy.matrix_to_quaternion(rots)
             
         # convert to actual gaussian attributes
         xyz = torch.tensor(xyz, dtype=torch.float, device=self.device)
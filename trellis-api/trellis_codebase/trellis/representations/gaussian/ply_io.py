@@ -0,0 +1,104 @@
+from typing import *
+import numpy as np
+from plyfile import PlyData
+
+# Bytes of vertex data per chunk yielded by `iter_vertex_ply`
+PLY_CHUNK_BYTES = 4 * 1024 * 1024
+
+
+def vertex_ply_header(names: List[str], num_vertices: int) -> bytes:
+    """
+    The header of a binary little endian PLY file with one float property per name, as written by plyfile.
+    """
+    lines = ['ply', 'format binary_little_endian 1.0', f'element vertex {num_vertices}']
+    lines += [f'property float {name}' for name in names]
+    lines.append('end_header')
+    return ('\n'.join(lines) + '\n').encode('ascii')
+
+
+def _as_vertex_data(attributes: np.ndarray, names: List[str]) -> np.ndarray:
+    assert attributes.ndim == 2 and attributes.shape[1] == len(names), \
+        f"Invalid shape for attributes, got {attributes.shape}, expected [N, {len(names)}]"
+    # Rows of little endian floats are the vertex records already, no copy if the array is laid out like that
+    return np.ascontiguousarray(attributes, dtype='<f4')
+
+
+def iter_vertex_ply(attributes: np.ndarray, names: List[str], chunk_bytes: int = PLY_CHUNK_BYTES) -> Iterator[bytes]:
+    """
+    Serialize vertices to a binary PLY file chunk by chunk, for streaming it without building the whole file in memory.
+
+    Args:
+        attributes (np.ndarray): One row per vertex and one column per property. Shape (N, K).
+        names (List[str]): The names of the K properties.
+        chunk_bytes (int): The approximate size of every chunk after the header.
+    """
+    data = _as_vertex_data(attributes, names)
+    yield vertex_ply_header(names, data.shape[0])
+    rows = max(1, chunk_bytes // max(1, data.shape[1] * 4))
+    view = memoryview(data).cast('B')
+    row_bytes = data.shape[1] * 4
+    for start in range(0, data.shape[0], rows):
+        yield view[start * row_bytes:(start + rows) * row_bytes]
+
+
+def write_vertex_ply(path: str, attributes: np.ndarray, names: List[str]) -> None:
+    """
+    Write vertices to a binary PLY file, readable by plyfile and `read_vertex_ply`.
+
+    Args:
+        path (str): The path of the file.
+        attributes (np.ndarray): One row per vertex and one column per property. Shape (N, K).
+        names (List[str]): The names of the K properties.
+    """
+    data = _as_vertex_data(attributes, names)
+    with open(path, 'wb') as f:
+        f.write(vertex_ply_header(names, data.shape[0]))
+        f.write(memoryview(data))
+
+
+def _parse_header(f: BinaryIO) -> Tuple[Optional[str], int, List[Tuple[str, str]], bool]:
+    fmt, num_vertices, properties, single_element = None, 0, [], True
+    element = None
+    line = f.readline()
+    if line.strip() != b'ply':
+        raise ValueError("Not a PLY file")
+    while True:
+        line = f.readline()
+        if not line:
+            raise ValueError("Truncated PLY header")
+        tokens = line.decode('ascii').split()
+        if not tokens or tokens[0] in ('comment', 'obj_info'):
+            continue
+        if tokens[0] == 'end_header':
+            return fmt, num_vertices, properties, single_element
+        if tokens[0] == 'format':
+            fmt = tokens[1]
+        elif tokens[0] == 'element':
+            element = tokens[1]
+            if element == 'vertex':
+                num_vertices = int(tokens[2])
+            else:
+                single_element = False
+        elif tokens[0] == 'property' and element == 'vertex':
+            properties.append((tokens[1], tokens[-1]))
+
+
+def read_vertex_ply(path: str) -> Tuple[List[str], np.ndarray]:
+    """
+    Read the vertices of a PLY file as one float32 array.
+    Binary little endian files with only float vertex properties, like the ones `write_vertex_ply` writes,
+    are mapped straight into the array, other files go through plyfile.
+
+    Returns:
+        (List[str]): The names of the vertex properties.
+        (np.ndarray): One row per vertex and one column per property. Shape (N, K).
+    """
+    with open(path, 'rb') as f:
+        fmt, num_vertices, properties, single_element = _parse_header(f)
+        names = [name for _, name in properties]
+        if fmt == 'binary_little_endian' and single_element and all(t in ('float', 'float32') for t, _ in properties):
+            data = np.fromfile(f, dtype='<f4', count=num_vertices * len(names))
+            return names, data.reshape(num_vertices, len(names))
+    vertices = PlyData.read(path)['vertex'].data
+    names = list(vertices.dtype.names)
+    return names, np.stack([np.asarray(vertices[name], dtype=np.float32) for name in names], axis=1)
@@ -56,18 +56,21 @@ class MeshExtractResult:
 
 
 class SparseFeatures2Mesh:
-    def __init__(self, device="cuda", res=64, use_color=True):
+    def __init__(self, device="cuda", res=64, use_color=True, sparse=True):
         '''
         a model to generate a mesh from sparse features structures using flexicube
+        sparse: only build the cubes near the surface, instead of the dense grid of all res^3 cubes, same mesh with far less memory and time
         '''
         super().__init__()
         self.device=device
         self.res = res
         self.mesh_extractor = FlexiCubes(device=device) #TODO Replace FlexCubes with Commercially-Free Modules
         self.sdf_bias = -1.0 / res
-        verts, cube = construct_dense_grid(self.res, self.device)
-        self.reg_c = cube.to(self.device)
-        self.reg_v = verts.to(self.device)
+        self.sparse = sparse
+        if not sparse:
+            verts, cube = construct_dense_grid(self.res, self.device)
+            self.reg_c = cube.to(self.device)
+            self.reg_v = verts.to(self.device)
         self.use_color = use_color
         self._calc_layout()
     
@@ -111,26 +114,31 @@ class SparseFeatures2Mesh:
         sdf += self.sdf_bias
         v_attrs = [sdf, deform, color] if self.use_color else [sdf, deform]
         v_pos, v_attrs, reg_loss = sparse_cube2verts(coords, torch.cat(v_attrs, dim=-1), training=training)
-        v_attrs_d = get_dense_attrs(v_pos, v_attrs, res=self.res+1, sdf_init=True)
-        weights_d = get_dense_attrs(coords, weights, res=self.res, sdf_init=False)
+        if self.sparse:
+            grid_v, v_attrs_d, grid_c, grid_c_coords, weights_d = construct_sparse_grid(coords, weights, v_pos, v_attrs, res=self.res)
+        else:
+            grid_v, grid_c, grid_c_coords = self.reg_v, self.reg_c, None
+            v_attrs_d = get_dense_attrs(v_pos, v_attrs, res=self.res+1, sdf_init=True)
+            weights_d = get_dense_attrs(coords, weights, res=self.res, sdf_init=False)
         if self.use_color:
             sdf_d, deform_d, colors_d = v_attrs_d[..., 0], v_attrs_d[..., 1:4], v_attrs_d[..., 4:]
         else:
             sdf_d, deform_d = v_attrs_d[..., 0], v_attrs_d[..., 1:4]
             colors_d = None
             
-        x_nx3 = get_defomed_verts(self.reg_v, deform_d, self.res)
+        x_nx3 = get_defomed_verts(grid_v, deform_d, self.res)
         
         vertices, faces, L_dev, colors = self.mesh_extractor(
             voxelgrid_vertices=x_nx3,
             scalar_field=sdf_d,
-            cube_idx=self.reg_c,
+            cube_idx=grid_c,
             resolution=self.res,
             beta=weights_d[:, :12],
             alpha=weights_d[:, 12:20],
             gamma_f=weights_d[:, 20],
             voxelgrid_colors=colors_d,
-            training=training)
+            training=training,
+            cube_coords=grid_c_coords)
         
         mesh = MeshExtractResult(vertices=vertices, faces=faces, vertex_attrs=colors, res=self.res)
         if training:
@@ -141,3 +149,70 @@ class SparseFeatures2Mesh:
             mesh.tsdf_v = get_defomed_verts(v_pos, v_attrs[:, 1:4], self.res)
             mesh.tsdf_s = v_attrs[:, 0]
         return mesh
+
+    @torch.no_grad()
+    def extract_batch(self, cubefeats : SparseTensor):
+        """
+        Generates the meshes of all the batch items at once, for inference on the sparse grid.
+        The batch items are laid side by side along x, one empty cube apart so that no surface crosses from one to the next,
+        and FlexiCubes runs once over all of them. The meshes are only split at the end, each the same as with `__call__`.
+        Returns:
+            a list of MeshExtractResult, one per batch item
+        """
+        assert self.sparse, "Batched extraction needs the sparse grid"
+        batch_size = cubefeats.shape[0]
+        coords = cubefeats.coords
+        feats = cubefeats.feats
+
+        sdf, deform, color, weights = [self.get_layout(feats, name) for name in ['sdf', 'deform', 'color', 'weights']]
+        sdf += self.sdf_bias
+        v_attrs = [sdf, deform, color] if self.use_color else [sdf, deform]
+        v_pos, v_attrs, _ = sparse_cube2verts(coords, torch.cat(v_attrs, dim=-1), training=False)
+        grid_v, v_attrs_d, grid_c, grid_c_coords, weights_d = construct_sparse_grid(coords, weights, v_pos, v_attrs, res=self.res)
+        if self.use_color:
+            sdf_d, deform_d, colors_d = v_attrs_d[..., 0], v_attrs_d[..., 1:4], v_attrs_d[..., 4:]
+        else:
+            sdf_d, deform_d = v_attrs_d[..., 0], v_attrs_d[..., 1:4]
+            colors_d = None
+
+        x_nx3 = get_defomed_verts(grid_v[:, 1:], deform_d, self.res)
+        cube_coords = grid_c_coords[:, 1:].clone()
+        cube_coords[:, 0] += grid_c_coords[:, 0] * (self.res + 1)
+
+        vertices, faces, _, colors, vd_cubes = self.mesh_extractor(
+            voxelgrid_vertices=x_nx3,
+            scalar_field=sdf_d,
+            cube_idx=grid_c,
+            resolution=[batch_size * (self.res + 1), self.res, self.res],
+            beta=weights_d[:, :12],
+            alpha=weights_d[:, 12:20],
+            gamma_f=weights_d[:, 20],
+            voxelgrid_colors=colors_d,
+            training=False,
+            cube_coords=cube_coords,
+            return_vd_cubes=True)
+
+        # Group the vertices and faces by batch item, keeping their order within every item
+        v_batch = grid_c_coords[vd_cubes, 0]
+        v_order = torch.sort(v_batch, stable=True).indices
+        v_remap = torch.empty_like(v_order)
+        v_remap[v_order] = torch.arange(v_order.shape[0], device=v_order.device)
+        faces = v_remap[faces.long()]
+        f_batch = v_batch[v_order][faces[:, 0]] if faces.shape[0] > 0 else v_batch[:0]
+        faces = faces[torch.sort(f_batch, stable=True).indices]
+        vertices = vertices[v_order]
+        colors = colors[v_order] if colors is not None else None
+        v_counts = torch.bincount(v_batch, minlength=batch_size).tolist()
+        f_counts = torch.bincount(f_batch, minlength=batch_size).tolist()
+
+        meshes = []
+        v_start, f_start = 0, 0
+        for v_count, f_count in zip(v_counts, f_counts):
+            meshes.append(MeshExtractResult(
+                vertices=vertices[v_start:v_start + v_count],
+                faces=faces[f_start:f_start + f_count] - v_start,
+                vertex_attrs=colors[v_start:v_start + v_count] if colors is not None else None,
+                res=self.res))
+            v_start += v_count
+            f_start += f_count
+        return meshes
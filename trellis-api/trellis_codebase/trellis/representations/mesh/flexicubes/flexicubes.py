@@ -49,10 +49,14 @@ class FlexiCubes:
 
     def __call__(self, voxelgrid_vertices, scalar_field, cube_idx, resolution, qef_reg_scale=1e-3,
                  weight_scale=0.99, beta=None, alpha=None, gamma_f=None, voxelgrid_colors=None, training=False,
-                 dtype=None): #dtype so that it can work with half precision.
+                 dtype=None, cube_coords=None, return_vd_cubes=False): #dtype so that it can work with half precision.
         """
         Optionally specify 'dtype' to unify all float inputs (e.g. torch.float16).
         If 'dtype' is None, we infer from voxelgrid_vertices or default to float32.
+        Optionally specify 'cube_coords', the (num_cubes, 3) grid coordinates of the cubes, when 'cube_idx' only holds
+        some cubes of the grid instead of all of them in raster order.
+        Optionally set 'return_vd_cubes' to also return the index in 'cube_idx' of the cube every vertex comes from,
+        only outside of training, where every vertex is a dual vertex.
         """
         # unify floating tensors to a chosen dtype, so it can work with half, etc:
         if dtype is None:
@@ -103,14 +107,14 @@ class FlexiCubes:
                 torch.zeros((0, 3), dtype=torch.int32, device=self.device),
                 torch.zeros((0), device=self.device, dtype=dtype),
                 torch.zeros((0, voxelgrid_colors.shape[-1]), device=self.device, dtype=dtype) if voxelgrid_colors is not None else None
-            )
+            ) + ((torch.zeros((0), dtype=torch.int64, device=self.device), ) if return_vd_cubes else ())
         beta, alpha, gamma_f = self._normalize_weights(
             beta, alpha, gamma_f, surf_cubes, weight_scale)
         
         if voxelgrid_colors is not None:
             voxelgrid_colors = torch.sigmoid(voxelgrid_colors)
 
-        case_ids = self._get_case_id(occ_fx8, surf_cubes, resolution)
+        case_ids = self._get_case_id(occ_fx8, surf_cubes, resolution, cube_coords)
 
         surf_edges, idx_map, edge_counts, surf_edges_mask = self._identify_surf_edges(
             scalar_field, cube_idx, surf_cubes
@@ -122,6 +126,12 @@ class FlexiCubes:
         vertices, faces, s_edges, edge_indices, vertices_color = self._triangulate(
             scalar_field, surf_edges, vd, vd_gamma, edge_counts, idx_map,
             vd_idx_map, surf_edges_mask, training, vd_color)
+        if return_vd_cubes:
+            # _compute_vd emits the dual vertices cube after cube, grouped by their number of dual vertices
+            num_vd = torch.index_select(input=self.num_vd_table, index=case_ids, dim=0)
+            surf_cubes_idx = torch.nonzero(surf_cubes)[:, 0]
+            vd_cubes = torch.cat([surf_cubes_idx[num_vd == num].repeat_interleave(int(num)) for num in torch.unique(num_vd)])
+            return vertices, faces, L_dev, vertices_color, vd_cubes
         return vertices, faces, L_dev, vertices_color
 
     def _compute_reg_loss(self, vd, ue, edge_group_to_vd, vd_num_edges):
@@ -158,7 +168,7 @@ class FlexiCubes:
         return beta[surf_cubes], alpha[surf_cubes], gamma_f[surf_cubes]
 
     @torch.no_grad()
-    def _get_case_id(self, occ_fx8, surf_cubes, res):
+    def _get_case_id(self, occ_fx8, surf_cubes, res, cube_coords=None):
         """
         Obtains the ID of topology cases based on cell corner occupancy. This function resolves the 
         ambiguity in the Dual Marching Cubes (DMC) configurations as described in Section 1.3 of the 
@@ -174,13 +184,18 @@ class FlexiCubes:
         if not isinstance(res, (list, tuple)):
             res = [res, res, res]
 
-        # The 'problematic_configs' only contain configurations for surface cubes. Next, we construct a 3D array,
-        # 'problem_config_full', to store configurations for all cubes (with default config for non-surface cubes).
-        # This allows efficient checking on adjacent cubes.
-        problem_config_full = torch.zeros(list(res) + [5], device=self.device, dtype=torch.int32)
-        vol_idx = torch.nonzero(problem_config_full[..., 0] == 0)  # N, 3
-        vol_idx_problem = vol_idx[surf_cubes][to_check]
-        problem_config_full[vol_idx_problem[..., 0], vol_idx_problem[..., 1], vol_idx_problem[..., 2]] = problem_config
+        if cube_coords is None:
+            # The 'problematic_configs' only contain configurations for surface cubes. Next, we construct a 3D array,
+            # 'problem_config_full', to store configurations for all cubes (with default config for non-surface cubes).
+            # This allows efficient checking on adjacent cubes.
+            problem_config_full = torch.zeros(list(res) + [5], device=self.device, dtype=torch.int32)
+            vol_idx = torch.nonzero(problem_config_full[..., 0] == 0)  # N, 3
+            vol_idx_problem = vol_idx[surf_cubes][to_check]
+            problem_config_full[vol_idx_problem[..., 0], vol_idx_problem[..., 1], vol_idx_problem[..., 2]] = problem_config
+        else:
+            # Without a dense grid, the adjacent cubes are looked up among the problematic cubes by their hashed coordinates.
+            vol_idx_problem = cube_coords.to(self.device)[surf_cubes][to_check].long()
+            problem_keys = torch.sort((vol_idx_problem[..., 0] * res[1] + vol_idx_problem[..., 1]) * res[2] + vol_idx_problem[..., 2]).values
         vol_idx_problem_adj = vol_idx_problem + problem_config[..., 1:4]
 
         within_range = (
@@ -194,8 +209,16 @@ class FlexiCubes:
         vol_idx_problem = vol_idx_problem[within_range]
         vol_idx_problem_adj = vol_idx_problem_adj[within_range]
         problem_config = problem_config[within_range]
-        problem_config_adj = problem_config_full[vol_idx_problem_adj[..., 0],
-                                                 vol_idx_problem_adj[..., 1], vol_idx_problem_adj[..., 2]]
+        if cube_coords is None:
+            problem_config_adj = problem_config_full[vol_idx_problem_adj[..., 0],
+                                                     vol_idx_problem_adj[..., 1], vol_idx_problem_adj[..., 2]]
+        else:
+            # Only the first value of the adjacent configurations is used, 1 for the problematic cubes, 0 for the others
+            problem_config_adj = torch.zeros_like(problem_config)
+            if problem_keys.shape[0] > 0:
+                adj_keys = (vol_idx_problem_adj[..., 0] * res[1] + vol_idx_problem_adj[..., 1]) * res[2] + vol_idx_problem_adj[..., 2]
+                adj_pos = torch.searchsorted(problem_keys, adj_keys).clamp(max=problem_keys.shape[0] - 1)
+                problem_config_adj[..., 0] = (problem_keys[adj_pos] == adj_keys).to(problem_config_adj.dtype)
         # If two cubes with cases C16 and C19 share an ambiguous face, both cases are inverted.
         to_invert = (problem_config_adj[..., 0] == 1)
         idx = torch.arange(case_ids.shape[0], dtype=torch.int32, device=self.device)[to_check][within_range][to_invert]
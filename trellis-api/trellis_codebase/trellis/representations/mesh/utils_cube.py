@@ -17,7 +17,11 @@ def construct_dense_grid(res, device='cuda'):
 
 
 def construct_voxel_grid(coords):
-    verts = (cube_corners.unsqueeze(0).to(coords) + coords.unsqueeze(1)).reshape(-1, 3)
+    corners = cube_corners.to(coords)
+    if coords.shape[-1] == 4:
+        # coords with a leading batch index, the corners stay in the same batch item
+        corners = torch.nn.functional.pad(corners, (1, 0))
+    verts = (corners.unsqueeze(0) + coords.unsqueeze(1)).reshape(-1, coords.shape[-1])
     verts_unique, inverse_indices = torch.unique(verts, dim=0, return_inverse=True)
     cubes = inverse_indices.reshape(-1, 8)
     return verts_unique, cubes
@@ -59,6 +63,71 @@ def get_dense_attrs(coords : torch.Tensor, feats : torch.Tensor, res : int, sdf_
     return dense_attrs.reshape(-1, F)
 
 
+def _grid_keys(coords: torch.Tensor, res: int):
+    """Hash integer grid coordinates, with a leading batch index, to one int64 key each, in the raster order of the dense grids."""
+    coords = coords.long()
+    return ((coords[:, 0] * res + coords[:, 1]) * res + coords[:, 2]) * res + coords[:, 3]
+
+
+def _grid_coords(keys: torch.Tensor, res: int):
+    return torch.stack([keys // (res ** 3), (keys // (res ** 2)) % res, (keys // res) % res, keys % res], dim=1)
+
+
+def _grid_lookup(keys: torch.Tensor, query: torch.Tensor):
+    """Find the index of every query key in the sorted unique keys, and whether it's there at all."""
+    idx = torch.searchsorted(keys, query).clamp(max=max(keys.shape[0] - 1, 0))
+    found = keys[idx] == query if keys.shape[0] > 0 else torch.zeros_like(query, dtype=torch.bool)
+    return idx, found
+
+
+def construct_sparse_grid(coords : torch.Tensor, cube_attrs : torch.Tensor, v_pos : torch.Tensor, v_attrs : torch.Tensor, res : int):
+    """
+    Sparse counterpart of `construct_dense_grid` and `get_dense_attrs`.
+    Only the cubes with a corner inside the surface (negative sdf) can be crossed by it, so only they and their corners
+    are built, instead of the whole grid. FlexiCubes then finds the same surface cubes among them as in the dense grid,
+    with the same attributes and in the same order, so both grids give the same mesh.
+
+    Args:
+        coords [Nx3] or [Nx4] : the occupied cubes, with a leading batch index for several batch items at once
+        cube_attrs [NxC] : attributes of the occupied cubes, the other cubes get zeros
+        v_pos [Vx3] or [Vx4] : the corners of the occupied cubes, with a leading batch index like the coords
+        v_attrs [VxF] : attributes of the corners, sdf first, the other corners get an outside sdf of 1 and zeros
+        res : resolution of the cubes grid
+    Returns:
+        verts [Mx3] or [Mx4] : grid coordinates of the vertices
+        verts_attrs [MxF] : attributes of the vertices
+        cubes [Kx8] : vertex indices of the cubes
+        cubes_coords [Kx3] or [Kx4] : grid coordinates of the cubes
+        cubes_attrs [KxC] : attributes of the cubes
+    """
+    res_v = res + 1
+    batched = coords.shape[-1] == 4
+    if not batched:
+        coords = torch.nn.functional.pad(coords, (1, 0))
+        v_pos = torch.nn.functional.pad(v_pos, (1, 0))
+    corners = torch.nn.functional.pad(cube_corners.to(v_pos.device).long(), (1, 0))
+    inside = v_pos[v_attrs[:, 0] < 0].long()
+    candidates = (inside.unsqueeze(1) - corners.unsqueeze(0)).reshape(-1, 4)
+    candidates = candidates[((candidates[:, 1:] >= 0) & (candidates[:, 1:] < res)).all(dim=-1)]
+    # Sorted unique keys put the cubes, and then the vertices, in the raster order of the dense grid, batch item after batch item
+    cubes_keys = torch.unique(_grid_keys(candidates, res))
+    cubes_coords = _grid_coords(cubes_keys, res)
+    verts_keys, cubes = torch.unique(_grid_keys((cubes_coords.unsqueeze(1) + corners.unsqueeze(0)).reshape(-1, 4), res_v), return_inverse=True)
+    cubes = cubes.reshape(-1, 8)
+    verts = _grid_coords(verts_keys, res_v)
+
+    verts_attrs = torch.zeros(verts.shape[0], v_attrs.shape[-1], device=v_attrs.device, dtype=v_attrs.dtype)
+    verts_attrs[:, 0] = 1 # initial outside sdf value
+    idx, found = _grid_lookup(verts_keys, _grid_keys(v_pos, res_v))
+    verts_attrs[idx[found]] = v_attrs[found]
+    cubes_attrs = torch.zeros(cubes.shape[0], cube_attrs.shape[-1], device=cube_attrs.device, dtype=cube_attrs.dtype)
+    idx, found = _grid_lookup(cubes_keys, _grid_keys(coords, res))
+    cubes_attrs[idx[found]] = cube_attrs[found]
+    if not batched:
+        verts, cubes_coords = verts[:, 1:], cubes_coords[:, 1:]
+    return verts, verts_attrs, cubes, cubes_coords, cubes_attrs
+
+
 def get_defomed_verts(v_pos: torch.Tensor, deform: torch.Tensor, res):
     # Cast v_pos to match deform's dtype without extra allocation when possible
     half_res = (1 - 1e-8) / (res * 2)
@@ -1,4 +1,5 @@
 from typing import * # type: ignore
+import functools
 import numpy as np
 import torch
 import utils3d
@@ -12,11 +13,218 @@ from pymeshfix import _meshfix
 import igraph
 import cv2
 from PIL import Image
-from .random_utils import sphere_hammersley_sequence
+from .random_utils import sphere_hammersley_sequence_batch, sphere_halton_sequence_batch
 from .render_utils import render_multiview
 from ..renderers import GaussianRenderer
 from ..representations import Strivec, Gaussian, MeshExtractResult
 
+# Views rasterized at once by `_compute_visibility`
+VISIBILITY_VIEW_BATCH = 8
+# Without a gpu the visibility is rasterized in pure PyTorch, at most at this resolution
+CPU_VISIBILITY_RESOLUTION = 256
+
+
+def _visibility_views(num_views: int, adaptive: bool, device: torch.device) -> torch.Tensor:
+    """
+    Build the view matrices of the cameras looking at the mesh, shape (num_views, 4, 4).
+    Adaptive views follow a Halton sequence, so any prefix of them covers the sphere evenly.
+    Built once per set of arguments, every call gets its own copy of the cached views.
+    """
+    return _cached_visibility_views(num_views, adaptive, torch.device(device)).clone()
+
+
+@functools.lru_cache(maxsize=8)
+def _cached_visibility_views(num_views: int, adaptive: bool, device: torch.device) -> torch.Tensor:
+    if adaptive:
+        yaws, pitchs = sphere_halton_sequence_batch(num_views)
+    else:
+        yaws, pitchs = sphere_hammersley_sequence_batch(num_views)
+    yaws = torch.tensor(yaws, dtype=torch.float32, device=device)
+    pitchs = torch.tensor(pitchs, dtype=torch.float32, device=device)
+    radius = 2.0
+    origs = torch.stack([
+        torch.sin(yaws) * torch.cos(pitchs),
+        torch.cos(yaws) * torch.cos(pitchs),
+        torch.sin(pitchs),
+    ], dim=1) * radius
+    look_at = torch.zeros_like(origs)
+    up = torch.tensor([0, 0, 1], dtype=torch.float32, device=device).expand_as(origs)
+    return utils3d.torch.view_look_at(origs, look_at, up)
+
+
+def _rasterize_face_ids_cpu(pos_clip: torch.Tensor, faces: torch.Tensor, resolution: int, max_pairs: int = 1 << 24) -> torch.Tensor:
+    """
+    Rasterize the id of the nearest face of every pixel with a z-buffer in pure PyTorch.
+
+    Args:
+        pos_clip (torch.Tensor): Clip space vertices of every view. Shape (B, V, 4).
+        faces (torch.Tensor): Faces of the mesh. Shape (F, 3).
+        resolution (int): Resolution of the rasterization.
+        max_pairs (int): Max number of (face, pixel) candidates tested at once.
+
+    Returns:
+        (torch.Tensor): Face id of every pixel, -1 where empty. Shape (B, resolution, resolution).
+    """
+    B, F = pos_clip.shape[0], faces.shape[0]
+    device = pos_clip.device
+    tris = pos_clip[:, faces.long()].reshape(B * F, 3, 4)
+    visible = (tris[..., 3] > 0).all(dim=1)
+    tris = tris[..., :3] / tris[..., 3:].clamp(min=1e-8)
+    # Pixel centers at integer positions
+    xy = (tris[..., :2] + 1) * 0.5 * resolution - 0.5
+    z = tris[..., 2]
+    mins = torch.ceil(xy.min(dim=1).values).clamp(0, resolution - 1).long()
+    maxs = torch.floor(xy.max(dim=1).values).clamp(0, resolution - 1).long()
+    sizes = (maxs - mins + 1).clamp(min=0)
+    area = (xy[:, 1, 0] - xy[:, 0, 0]) * (xy[:, 2, 1] - xy[:, 0, 1]) - (xy[:, 1, 1] - xy[:, 0, 1]) * (xy[:, 2, 0] - xy[:, 0, 0])
+    visible &= (xy.max(dim=1).values >= 0).all(dim=1) & (xy.min(dim=1).values <= resolution - 1).all(dim=1) & (area != 0)
+    counts = torch.where(visible, sizes[:, 0] * sizes[:, 1], 0)
+
+    # Nearest depth in the high bits and face id in the low bits, so the min of a pixel is its nearest face
+    empty = torch.iinfo(torch.int64).max
+    zbuffer = torch.full((B * resolution * resolution,), empty, dtype=torch.int64, device=device)
+    instances = torch.nonzero(counts).reshape(-1)
+    chunk_ends = torch.cumsum(counts[instances], dim=0)
+    start = 0
+    while start < instances.shape[0]:
+        base = chunk_ends[start - 1] if start > 0 else 0
+        end = max(int(torch.searchsorted(chunk_ends, base + max_pairs, right=True)), start + 1)
+        inst = instances[start:end]
+        inst_counts = counts[inst]
+        pair_inst = torch.repeat_interleave(inst, inst_counts)
+        local = torch.arange(pair_inst.shape[0], device=device) - torch.repeat_interleave(torch.cumsum(inst_counts, dim=0) - inst_counts, inst_counts)
+        width = sizes[pair_inst, 0]
+        px = mins[pair_inst, 0] + local % width
+        py = mins[pair_inst, 1] + local // width
+        a, b, c = xy[pair_inst].unbind(dim=1)
+        p = torch.stack([px, py], dim=-1).float()
+        def edge(u, v):
+            return (v[:, 0] - u[:, 0]) * (p[:, 1] - u[:, 1]) - (v[:, 1] - u[:, 1]) * (p[:, 0] - u[:, 0])
+        pair_area = area[pair_inst]
+        w0, w1, w2 = edge(b, c) / pair_area, edge(c, a) / pair_area, edge(a, b) / pair_area
+        depth = (torch.stack([w0, w1, w2], dim=-1) * z[pair_inst]).sum(dim=-1)
+        inside = (w0 >= 0) & (w1 >= 0) & (w2 >= 0) & (depth >= -1) & (depth <= 1)
+        depth_key = ((depth[inside] + 1) * 0.5 * (2 ** 30)).long() << 32
+        pixels = (pair_inst[inside] // F) * resolution * resolution + py[inside] * resolution + px[inside]
+        zbuffer.scatter_reduce_(0, pixels, depth_key | (pair_inst[inside] % F), reduce='amin')
+        start = end
+    face_ids = torch.where(zbuffer == empty, -1, zbuffer & 0xFFFFFFFF)
+    return face_ids.reshape(B, resolution, resolution)
+
+
+def _compute_visibility(
+    verts: torch.Tensor,
+    faces: torch.Tensor,
+    resolution: int,
+    num_views: int,
+    adaptive: bool = False,
+    min_views: int = 64,
+    converge_ratio: float = 1e-4,
+    verbose: bool = False,
+) -> torch.Tensor:
+    """
+    Rasterize a mesh from multiple views, in batches of views, and count how often each face is seen.
+    Uses nvdiffrast when the mesh is on the gpu, and a pure PyTorch rasterizer otherwise.
+
+    Args:
+        verts (torch.Tensor): Vertices of the mesh. Shape (V, 3).
+        faces (torch.Tensor): Faces of the mesh. Shape (F, 3).
+        resolution (int): Resolution of the rasterization.
+        num_views (int): Max number of views to rasterize the mesh.
+        adaptive (bool): Whether to stop before `num_views` once a batch of views reveals almost no new face.
+        min_views (int): Number of views rasterized before stopping early.
+        converge_ratio (float): Ratio of the faces a batch of views may newly reveal while still counting as converged.
+        verbose (bool): Whether to print progress.
+
+    Returns:
+        (torch.Tensor): Ratio of the rasterized views seeing each face. Shape (F,).
+    """
+    device = verts.device
+    views = _visibility_views(num_views, adaptive, device)
+    fov = torch.deg2rad(torch.tensor(40.0, device=device))
+    projection = utils3d.torch.perspective_from_fov_xy(fov, fov, 1, 3)
+    verts_h = torch.cat([verts.float(), torch.ones_like(verts[:, :1], dtype=torch.float32)], dim=-1)
+    faces_i32 = faces.int().contiguous()
+    if device.type == 'cuda':
+        rastctx = dr.RasterizeCudaContext(device=device)
+    else:
+        resolution = min(resolution, CPU_VISIBILITY_RESOLUTION)
+
+    visiblity = torch.zeros(faces.shape[0], dtype=torch.int32, device=device)
+    num_rasterized = 0
+    with tqdm(total=num_views, disable=not verbose, desc='Rasterizing') as pbar:
+        for start in range(0, num_views, VISIBILITY_VIEW_BATCH):
+            batch_views = views[start:start + VISIBILITY_VIEW_BATCH]
+            B = batch_views.shape[0]
+            pos_clip = verts_h[None] @ (projection[None] @ batch_views).transpose(-1, -2)     # [B, V, 4]
+            if device.type == 'cuda':
+                rast, _ = dr.rasterize(rastctx, pos_clip.contiguous(), faces_i32, (resolution, resolution))
+                face_ids = rast[..., 3].long() - 1
+            else:
+                face_ids = _rasterize_face_ids_cpu(pos_clip, faces_i32, resolution)
+            # Mark each face once per view it appears in
+            seen = torch.zeros((B, faces.shape[0]), dtype=torch.bool, device=device)
+            view_ids = torch.arange(B, device=device)[:, None, None].expand_as(face_ids)
+            covered = face_ids >= 0
+            seen[view_ids[covered], face_ids[covered]] = True
+            newly_seen = int(((visiblity == 0) & seen.any(dim=0)).sum())
+            visiblity += seen.sum(dim=0, dtype=torch.int32)
+            num_rasterized += B
+            pbar.update(B)
+            if adaptive and num_rasterized >= min_views and newly_seen <= converge_ratio * faces.shape[0]:
+                if verbose:
+                    tqdm.write(f'Visibility converged after {num_rasterized} views')
+                break
+    return visiblity.float() / num_rasterized
+
+
+def _segment_labels(segments: List[torch.Tensor], num_items: int, device: torch.device) -> torch.Tensor:
+    """
+    Turn a list of index tensors, one per segment, into the segment label of every item, -1 for items in no segment.
+    """
+    labels = torch.full((num_items,), -1, dtype=torch.long, device=device)
+    if len(segments) > 0:
+        sizes = torch.tensor([len(s) for s in segments], device=device)
+        labels[torch.cat(segments).long()] = torch.repeat_interleave(torch.arange(len(segments), device=device), sizes)
+    return labels
+
+
+def _segment_sorted(values: torch.Tensor, labels: torch.Tensor, num_segments: int) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """
+    Sort values by segment, then by value.
+
+    Returns:
+        (torch.Tensor): The sorted values.
+        (torch.Tensor): The start of each segment in the sorted values.
+        (torch.Tensor): The size of each segment.
+    """
+    order = torch.argsort(values, stable=True)
+    order = order[torch.argsort(labels[order], stable=True)]
+    sizes = torch.bincount(labels, minlength=num_segments)
+    starts = torch.cumsum(sizes, dim=0) - sizes
+    return values[order], starts, sizes
+
+
+def _segment_quantile(values: torch.Tensor, labels: torch.Tensor, num_segments: int, q: float) -> torch.Tensor:
+    """
+    The q quantile of the values of each segment, linearly interpolated like `torch.quantile`.
+    """
+    values, starts, sizes = _segment_sorted(values, labels, num_segments)
+    pos = q * (sizes - 1).clamp(min=0).to(values.dtype)
+    low = pos.floor().long()
+    high = pos.ceil().long()
+    low_values = values[starts + low]
+    return low_values + (values[starts + high] - low_values) * (pos - low)
+
+
+def _segment_median(values: torch.Tensor, labels: torch.Tensor, num_segments: int) -> torch.Tensor:
+    """
+    The lower median of the values of each segment, like `torch.median`.
+    """
+    values, starts, sizes = _segment_sorted(values, labels, num_segments)
+    return values[starts + (sizes - 1) // 2]
+
+
 @torch.no_grad()
 def _fill_holes(
     verts,
@@ -25,6 +233,7 @@ def _fill_holes(
     max_hole_nbe=32,
     resolution=128,
     num_views=500,
+    adaptive_views=False,
     debug=False,
     verbose=False
 ):
@@ -39,54 +248,24 @@ def _fill_holes(
         faces (torch.Tensor): Faces of the mesh. Shape (F, 3).
         max_hole_size (float): Maximum area of a hole to fill.
         resolution (int): Resolution of the rasterization.
-        num_views (int): Number of views to rasterize the mesh.
+        num_views (int): Number of views to rasterize the mesh, the max number if `adaptive_views`.
+        adaptive_views (bool): Whether to stop rasterizing views once the visibility converges.
         verbose (bool): Whether to print progress.
     """
-    # Construct cameras
-    yaws = []
-    pitchs = []
-    for i in range(num_views):
-        y, p = sphere_hammersley_sequence(i, num_views)
-        yaws.append(y)
-        pitchs.append(p)
-    yaws = torch.tensor(yaws).cuda()
-    pitchs = torch.tensor(pitchs).cuda()
-    radius = 2.0
-    fov = torch.deg2rad(torch.tensor(40)).cuda()
-    projection = utils3d.torch.perspective_from_fov_xy(fov, fov, 1, 3)
-    views = []
-    for (yaw, pitch) in zip(yaws, pitchs):
-        orig = torch.tensor([
-            torch.sin(yaw) * torch.cos(pitch),
-            torch.cos(yaw) * torch.cos(pitch),
-            torch.sin(pitch),
-        ]).cuda().float() * radius
-        view = utils3d.torch.view_look_at(orig, torch.tensor([0, 0, 0]).float().cuda(), torch.tensor([0, 0, 1]).float().cuda())
-        views.append(view)
-    views = torch.stack(views, dim=0)
+    device = verts.device
+    num_faces = faces.shape[0]
 
     # Rasterize
-    visblity = torch.zeros(faces.shape[0], dtype=torch.int32, device=verts.device)
-    rastctx = utils3d.torch.RastContext(backend='cuda')
-    for i in tqdm(range(views.shape[0]), total=views.shape[0], disable=not verbose, desc='Rasterizing'):
-        view = views[i]
-        buffers = utils3d.torch.rasterize_triangle_faces(
-            rastctx, verts[None], faces, resolution, resolution, view=view, projection=projection
-        )
-        face_id = buffers['face_id'][0][buffers['mask'][0] > 0.95] - 1
-        face_id = torch.unique(face_id).long()
-        visblity[face_id] += 1
-    visblity = visblity.float() / num_views
+    visblity = _compute_visibility(verts, faces, resolution, num_views, adaptive=adaptive_views, verbose=verbose)
     
     # Mincut
     ## construct outer faces
     edges, face2edge, edge_degrees = utils3d.torch.compute_edges(faces)
     boundary_edge_indices = torch.nonzero(edge_degrees == 1).reshape(-1)
     connected_components = utils3d.torch.compute_connected_components(faces, edges, face2edge)
-    outer_face_indices = torch.zeros(faces.shape[0], dtype=torch.bool, device=faces.device)
-    for i in range(len(connected_components)):
-        outer_face_indices[connected_components[i]] = visblity[connected_components[i]] > min(max(visblity[connected_components[i]].quantile(0.75).item(), 0.25), 0.5)
-    outer_face_indices = outer_face_indices.nonzero().reshape(-1)
+    face_cc = _segment_labels(connected_components, num_faces, device)
+    cc_thresholds = _segment_quantile(visblity, face_cc, len(connected_components), 0.75).clamp(0.25, 0.5)
+    outer_face_indices = torch.nonzero(visblity > cc_thresholds[face_cc]).reshape(-1)
     
     ## construct inner faces
     inner_face_indices = torch.nonzero(visblity == 0).reshape(-1)
@@ -103,61 +282,74 @@ def _fill_holes(
         tqdm.write(f'Dual graph: {dual_edges.shape[0]} edges')
 
     ## solve mincut problem
-    ### construct main graph
-    g = igraph.Graph()
-    g.add_vertices(faces.shape[0])
-    g.add_edges(dual_edges.cpu().numpy())
-    g.es['weight'] = dual_edges_weights.cpu().numpy()
-    
-    ### source and target
-    g.add_vertex('s')
-    g.add_vertex('t')
-    
-    ### connect invisible faces to source
-    g.add_edges([(f, 's') for f in inner_face_indices], attributes={'weight': torch.ones(inner_face_indices.shape[0], dtype=torch.float32).cpu().numpy()})
-    
-    ### connect outer faces to target
-    g.add_edges([(f, 't') for f in outer_face_indices], attributes={'weight': torch.ones(outer_face_indices.shape[0], dtype=torch.float32).cpu().numpy()})
+    ### source and target are the two vertices after the faces
+    source, target = num_faces, num_faces + 1
+    inner_face_indices_np = inner_face_indices.cpu().numpy()
+    outer_face_indices_np = outer_face_indices.cpu().numpy()
+    graph_edges = np.concatenate([
+        dual_edges.cpu().numpy().reshape(-1, 2),
+        ### connect invisible faces to source
+        np.stack([inner_face_indices_np, np.full_like(inner_face_indices_np, source)], axis=1),
+        ### connect outer faces to target
+        np.stack([outer_face_indices_np, np.full_like(outer_face_indices_np, target)], axis=1),
+    ], axis=0)
+    capacity = np.concatenate([
+        dual_edges_weights.float().cpu().numpy(),
+        np.ones(inner_face_indices_np.shape[0], dtype=np.float32),
+        np.ones(outer_face_indices_np.shape[0], dtype=np.float32),
+    ]) * 1000
+    g = igraph.Graph(n=num_faces + 2, edges=graph_edges)
                 
     ### solve mincut
-    cut = g.mincut('s', 't', (np.array(g.es['weight']) * 1000).tolist())
-    remove_face_indices = torch.tensor([v for v in cut.partition[0] if v < faces.shape[0]], dtype=torch.long, device=faces.device)
+    cut = g.mincut(source, target, capacity.tolist())
+    partition = np.asarray(cut.partition[0], dtype=np.int64)
+    remove_face_indices = torch.tensor(partition[partition < num_faces], dtype=torch.long, device=device)
     if verbose:
         tqdm.write(f'Mincut solved, start checking the cut')
     
     ### check if the cut is valid with each connected component
     to_remove_cc = utils3d.torch.compute_connected_components(faces[remove_face_indices])
+    num_remove_cc = len(to_remove_cc)
     if debug:
-        tqdm.write(f'Number of connected components of the cut: {len(to_remove_cc)}')
-    valid_remove_cc = []
-    cutting_edges = []
-    for cc in to_remove_cc:
-        #### check if the connected component has low visibility
-        visblity_median = visblity[remove_face_indices[cc]].median()
+        tqdm.write(f'Number of connected components of the cut: {num_remove_cc}')
+    remove_cc = _segment_labels(to_remove_cc, remove_face_indices.shape[0], device)
+    in_cc = remove_cc >= 0
+    remove_faces_in_cc, remove_cc = remove_face_indices[in_cc], remove_cc[in_cc]
+
+    #### check if the connected component has low visibility
+    visblity_median = _segment_median(visblity[remove_faces_in_cc], remove_cc, num_remove_cc)
+    if debug:
+        tqdm.write(f'visblity_median: {visblity_median}')
+    valid_cc = visblity_median <= 0.25
+
+    #### check if the cutting loop is small enough
+    ##### edges used once by a component are its boundary, the ones not on the mesh boundary are opened by the cut
+    cc_edges = face2edge[remove_faces_in_cc].long()
+    cc_edge_keys, cc_edges_degree = torch.unique(remove_cc[:, None] * edges.shape[0] + cc_edges, return_counts=True)
+    cc_boundary_keys = cc_edge_keys[cc_edges_degree == 1]
+    cc_new_boundary_keys = cc_boundary_keys[~torch.isin(cc_boundary_keys % edges.shape[0], boundary_edge_indices)]
+    cutting_edges = [cc_new_boundary_keys % edges.shape[0]]
+    if cc_new_boundary_keys.shape[0] > 0:
+        cc_new_boundary_cc = cc_new_boundary_keys // edges.shape[0]
+        cc_new_boundary_edges = edges[cc_new_boundary_keys % edges.shape[0]].long()
+        ##### keep the loops of different components apart even where they share a vertex
+        _, loop_edges = torch.unique(cc_new_boundary_cc[:, None] * verts.shape[0] + cc_new_boundary_edges, return_inverse=True)
+        loops = utils3d.torch.compute_edge_connected_components(loop_edges)
+        edge_loop = _segment_labels(loops, loop_edges.shape[0], device)
+        loop_cc = torch.zeros(len(loops), dtype=torch.long, device=device).scatter_(0, edge_loop, cc_new_boundary_cc)
+        loop_sizes = torch.bincount(edge_loop, minlength=len(loops)).unsqueeze(1)
+        _e1 = verts[cc_new_boundary_edges[:, 0]].float()
+        _e2 = verts[cc_new_boundary_edges[:, 1]].float()
+        loop_centers = torch.zeros((len(loops), 3), device=device).index_add_(0, edge_loop, (_e1 + _e2) * 0.5) / loop_sizes
+        _e1 = _e1 - loop_centers[edge_loop]
+        _e2 = _e2 - loop_centers[edge_loop]
+        loop_areas = torch.zeros(len(loops), device=device).index_add_(0, edge_loop, torch.norm(torch.cross(_e1, _e2, dim=-1), dim=1) * 0.5)
         if debug:
-            tqdm.write(f'visblity_median: {visblity_median}')
-        if visblity_median > 0.25:
-            continue
-        
-        #### check if the cuting loop is small enough
-        cc_edge_indices, cc_edges_degree = torch.unique(face2edge[remove_face_indices[cc]], return_counts=True)
-        cc_boundary_edge_indices = cc_edge_indices[cc_edges_degree == 1]
-        cc_new_boundary_edge_indices = cc_boundary_edge_indices[~torch.isin(cc_boundary_edge_indices, boundary_edge_indices)]
-        if len(cc_new_boundary_edge_indices) > 0:
-            cc_new_boundary_edge_cc = utils3d.torch.compute_edge_connected_components(edges[cc_new_boundary_edge_indices])
-            cc_new_boundary_edges_cc_center = [verts[edges[cc_new_boundary_edge_indices[edge_cc]]].mean(dim=1).mean(dim=0) for edge_cc in cc_new_boundary_edge_cc]
-            cc_new_boundary_edges_cc_area = []
-            for i, edge_cc in enumerate(cc_new_boundary_edge_cc):
-                _e1 = verts[edges[cc_new_boundary_edge_indices[edge_cc]][:, 0]] - cc_new_boundary_edges_cc_center[i]
-                _e2 = verts[edges[cc_new_boundary_edge_indices[edge_cc]][:, 1]] - cc_new_boundary_edges_cc_center[i]
-                cc_new_boundary_edges_cc_area.append(torch.norm(torch.cross(_e1, _e2, dim=-1), dim=1).sum() * 0.5)
-            if debug:
-                cutting_edges.append(cc_new_boundary_edge_indices)
-                tqdm.write(f'Area of the cutting loop: {cc_new_boundary_edges_cc_area}')
-            if any([l > max_hole_size for l in cc_new_boundary_edges_cc_area]):
-                continue
-            
-        valid_remove_cc.append(cc)
+            tqdm.write(f'Area of the cutting loops: {loop_areas}')
+        too_large = torch.zeros(num_remove_cc, dtype=torch.bool, device=device)
+        too_large[loop_cc[loop_areas > max_hole_size]] = True
+        valid_cc &= ~too_large
+    valid_remove_face_indices = remove_faces_in_cc[valid_cc[remove_cc]]
         
     if debug:
         face_v = verts[faces].mean(dim=1).cpu().numpy()
@@ -166,8 +358,8 @@ def _fill_holes(
         vis_colors[inner_face_indices.cpu().numpy()] = [0, 0, 255]
         vis_colors[outer_face_indices.cpu().numpy()] = [0, 255, 0]
         vis_colors[remove_face_indices.cpu().numpy()] = [255, 0, 255]
-        if len(valid_remove_cc) > 0:
-            vis_colors[remove_face_indices[torch.cat(valid_remove_cc)].cpu().numpy()] = [255, 0, 0]
+        if valid_remove_face_indices.shape[0] > 0:
+            vis_colors[valid_remove_face_indices.cpu().numpy()] = [255, 0, 0]
         utils3d.io.write_ply('dbg_dual.ply', face_v, edges=vis_dual_edges, vertex_colors=vis_colors)
         
         vis_verts = verts.cpu().numpy()
@@ -175,8 +367,8 @@ def _fill_holes(
         utils3d.io.write_ply('dbg_cut.ply', vis_verts, edges=vis_edges)
         
     
-    if len(valid_remove_cc) > 0:
-        remove_face_indices = remove_face_indices[torch.cat(valid_remove_cc)]
+    if valid_remove_face_indices.shape[0] > 0:
+        remove_face_indices = valid_remove_face_indices
         mask = torch.ones(faces.shape[0], dtype=torch.bool, device=faces.device)
         mask[remove_face_indices] = 0
         faces = faces[mask]
@@ -191,7 +383,7 @@ def _fill_holes(
     mesh.load_array(verts.cpu().numpy(), faces.cpu().numpy())
     mesh.fill_small_boundaries(nbe=max_hole_nbe, refine=True)
     verts, faces = mesh.return_arrays()
-    verts, faces = torch.tensor(verts, device='cuda', dtype=torch.float32), torch.tensor(faces, device='cuda', dtype=torch.int32)
+    verts, faces = torch.tensor(verts, device=device, dtype=torch.float32), torch.tensor(faces, device=device, dtype=torch.int32)
 
     return verts, faces
 
@@ -206,6 +398,7 @@ def postprocess_mesh(
     fill_holes_max_hole_nbe: int = 32,
     fill_holes_resolution: int = 1024,
     fill_holes_num_views: int = 1000,
+    fill_holes_adaptive_views: bool = False,
     debug: bool = False,
     verbose: bool = False,
 ):
@@ -222,6 +415,7 @@ def postprocess_mesh(
         fill_holes_max_hole_nbe (int): Maximum number of boundary edges of a hole to fill.
         fill_holes_resolution (int): Resolution of the rasterization.
         fill_holes_num_views (int): Number of views to rasterize the mesh.
+        fill_holes_adaptive_views (bool): Whether to stop rasterizing views once the visibility converges.
         verbose (bool): Whether to print progress.
     """
 
@@ -239,13 +433,15 @@ def postprocess_mesh(
 
     # Remove invisible faces
     if fill_holes:
-        vertices, faces = torch.tensor(vertices).cuda(), torch.tensor(faces.astype(np.int32)).cuda()
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        vertices, faces = torch.tensor(vertices, device=device), torch.tensor(faces.astype(np.int32), device=device)
         vertices, faces = _fill_holes(
             vertices, faces,
             max_hole_size=fill_holes_max_hole_size,
             max_hole_nbe=fill_holes_max_hole_nbe,
             resolution=fill_holes_resolution,
             num_views=fill_holes_num_views,
+            adaptive_views=fill_holes_adaptive_views,
             debug=debug,
             verbose=verbose,
         )
@@ -286,6 +482,11 @@ def bake_texture(
     far: float = 10.0,
     mode: Literal['fast', 'opt'] = 'opt',
     lambda_tv: float = 1e-2,
+    total_steps: int = 2500,
+    batch_views: int = 1,
+    patience: int = 0,
+    min_delta: float = 1e-3,
+    half_uv: bool = False,
     verbose: bool = False,
 ):
     """
@@ -304,6 +505,11 @@ def bake_texture(
         far (float): Far plane of the camera.
         mode (Literal['fast', 'opt']): Mode of texture baking.
         lambda_tv (float): Weight of total variation loss in optimization.
+        total_steps (int): Max number of optimization steps in 'opt' mode.
+        batch_views (int): Number of views fitted together in every optimization step.
+        patience (int): Stop the optimization when the smoothed loss hasn't improved for this many steps, 0 never stops early.
+        min_delta (float): Relative decrease of the smoothed loss counted as an improvement.
+        half_uv (bool): Whether to keep the uv coordinates of the pixels in half precision, half their memory but coarser texel lookups.
         verbose (bool): Whether to print progress.
     """
     vertices = torch.tensor(vertices).cuda()
@@ -346,15 +552,20 @@ def bake_texture(
         rastctx = utils3d.torch.RastContext(backend='cuda')
         observations = [observations.flip(0) for observations in observations]
         masks = [m.flip(0) for m in masks]
+        # Only the masked pixels enter the loss, keep just those, packed
+        uv_dtype = torch.float16 if half_uv else torch.float32
         _uv = []
         _uv_dr = []
-        for observation, view, projection in tqdm(zip(observations, views, projections), total=len(views), disable=not verbose, desc='Texture baking (opt): UV'):
+        _obs = []
+        for observation, mask, view, projection in tqdm(zip(observations, masks, views, projections), total=len(views), disable=not verbose, desc='Texture baking (opt): UV'):
             with torch.no_grad():
                 rast = utils3d.torch.rasterize_triangle_faces(
                     rastctx, vertices[None], faces, observation.shape[1], observation.shape[0], uv=uvs[None], view=view, projection=projection
                 )
-                _uv.append(rast['uv'].detach())
-                _uv_dr.append(rast['uv_dr'].detach())
+                _uv.append(rast['uv'][0][mask].detach().to(uv_dtype))
+                _uv_dr.append(rast['uv_dr'][0][mask].detach().to(uv_dtype))
+                _obs.append(observation[mask])
+        del observations, masks
 
         texture = torch.nn.Parameter(torch.zeros((1, texture_size, texture_size, 3), dtype=torch.float32).cuda())
         optimizer = torch.optim.Adam([texture], betas=(0.5, 0.9), lr=1e-2)
@@ -369,22 +580,40 @@ def bake_texture(
             return torch.nn.functional.l1_loss(texture[:, :-1, :, :], texture[:, 1:, :, :]) + \
                    torch.nn.functional.l1_loss(texture[:, :, :-1, :], texture[:, :, 1:, :])
     
-        total_steps = 2500
+        batch_views = max(1, min(batch_views, len(views)))
+        smoothed_loss = None
+        best_loss = float('inf')
+        steps_since_best = 0
         with tqdm(total=total_steps, disable=not verbose, desc='Texture baking (opt): optimizing') as pbar:
             for step in range(total_steps):
                 optimizer.zero_grad()
-                selected = np.random.randint(0, len(views))
-                uv, uv_dr, observation, mask = _uv[selected], _uv_dr[selected], observations[selected], masks[selected]
-                render = dr.texture(texture, uv, uv_dr)[0]
-                loss = torch.nn.functional.l1_loss(render[mask], observation[mask])
+                selected = np.random.choice(len(views), batch_views, replace=False)
+                # The pixels of all selected views form one [1, 1, N] image for a single texture lookup
+                uv = torch.cat([_uv[i] for i in selected]).float()[None, None]
+                uv_dr = torch.cat([_uv_dr[i] for i in selected]).float()[None, None]
+                observation = torch.cat([_obs[i] for i in selected])
+                render = dr.texture(texture, uv, uv_dr)[0, 0]
+                loss = torch.nn.functional.l1_loss(render, observation)
                 if lambda_tv > 0:
                     loss += lambda_tv * tv_loss(texture)
                 loss.backward()
                 optimizer.step()
                 # annealing
                 optimizer.param_groups[0]['lr'] = cosine_anealing(optimizer, step, total_steps, 1e-2, 1e-5)
-                pbar.set_postfix({'loss': loss.item()})
+                loss_value = loss.item()
+                pbar.set_postfix({'loss': loss_value})
                 pbar.update()
+                # early stopping on a plateau of the smoothed loss
+                smoothed_loss = loss_value if smoothed_loss is None else 0.95 * smoothed_loss + 0.05 * loss_value
+                if smoothed_loss < best_loss * (1 - min_delta):
+                    best_loss = smoothed_loss
+                    steps_since_best = 0
+                else:
+                    steps_since_best += 1
+                if patience > 0 and steps_since_best >= patience:
+                    if verbose:
+                        tqdm.write(f'Texture baking converged after {step + 1} steps')
+                    break
         texture = np.clip(texture[0].flip(0).detach().cpu().numpy() * 255, 0, 255).astype(np.uint8)
         mask = 1 - utils3d.torch.rasterize_triangle_faces(
             rastctx, (uvs * 2 - 1)[None], faces, texture_size, texture_size
@@ -396,6 +625,14 @@ def bake_texture(
     return texture
 
 
+# Speed/quality trade-offs of hole filling and texture baking in `to_glb`, 'quality' is the original postprocessing
+TEXTURE_BAKE_PRESETS = {
+    'quality': {'nviews': 100, 'resolution': 1024, 'total_steps': 2500, 'batch_views': 1, 'patience': 0, 'half_uv': False, 'adaptive_views': False},
+    'balanced': {'nviews': 60, 'resolution': 1024, 'total_steps': 1000, 'batch_views': 4, 'patience': 100, 'half_uv': True, 'adaptive_views': True},
+    'fast': {'nviews': 30, 'resolution': 512, 'total_steps': 400, 'batch_views': 8, 'patience': 50, 'half_uv': True, 'adaptive_views': True},
+}
+
+
 def to_glb(
     mesh: MeshExtractResult,
     simplify: float = 0.95,
@@ -406,6 +643,7 @@ def to_glb(
     verbose: bool = True,
     get_base_model: bool = False, 
     app_rep: Union[Strivec, Gaussian, None] = None,
+    preset: Literal['quality', 'balanced', 'fast'] = 'quality',
 ) -> trimesh.Trimesh:
     """
     Convert a generated asset to a glb file.
@@ -420,7 +658,9 @@ def to_glb(
         debug (bool): Whether to print debug information.
         verbose (bool): Whether to print progress.
         get_base_model(bool): Base model is the mesh without color. Default to get the colored mesh
+        preset (str): The hole filling and texture baking preset, one of `TEXTURE_BAKE_PRESETS`, from the slowest to the fastest 'quality', 'balanced' and 'fast'.
     """
+    bake_preset = TEXTURE_BAKE_PRESETS[preset]
     vertices = mesh.vertices.cpu().numpy()
     faces = mesh.faces.cpu().numpy()
     
@@ -434,6 +674,7 @@ def to_glb(
         fill_holes_max_hole_nbe=int(250 * np.sqrt(1-simplify)),
         fill_holes_resolution=1024,
         fill_holes_num_views=1000,
+        fill_holes_adaptive_views=bake_preset['adaptive_views'],
         debug=debug,
         verbose=verbose,
     )
@@ -443,7 +684,7 @@ def to_glb(
         vertices, faces, uvs = parametrize_mesh(vertices, faces)
 
         # bake texture
-        observations, extrinsics, intrinsics = render_multiview(app_rep, resolution=1024, nviews=100)
+        observations, extrinsics, intrinsics = render_multiview(app_rep, resolution=bake_preset['resolution'], nviews=bake_preset['nviews'])
         masks = [np.any(observation > 0, axis=-1) for observation in observations]
         extrinsics = [extrinsics[i].cpu().numpy() for i in range(len(extrinsics))]
         intrinsics = [intrinsics[i].cpu().numpy() for i in range(len(intrinsics))]
@@ -452,6 +693,10 @@ def to_glb(
             observations, masks, extrinsics, intrinsics,
             texture_size=texture_size, mode='opt',
             lambda_tv=0.01,
+            total_steps=bake_preset['total_steps'],
+            batch_views=bake_preset['batch_views'],
+            patience=bake_preset['patience'],
+            half_uv=bake_preset['half_uv'],
             verbose=verbose,
         )
         texture = Image.fromarray(texture)
@@ -471,6 +716,58 @@ def to_glb(
     return mesh
 
 
+# Corners of the outer face of a unit voxel in every direction, counter clockwise seen from outside
+_VOXEL_FACE_CORNERS = {
+    (0, 1): [(1, 0, 0), (1, 1, 0), (1, 1, 1), (1, 0, 1)],
+    (0, -1): [(0, 0, 0), (0, 0, 1), (0, 1, 1), (0, 1, 0)],
+    (1, 1): [(0, 1, 0), (0, 1, 1), (1, 1, 1), (1, 1, 0)],
+    (1, -1): [(0, 0, 0), (1, 0, 0), (1, 0, 1), (0, 0, 1)],
+    (2, 1): [(0, 0, 1), (1, 0, 1), (1, 1, 1), (0, 1, 1)],
+    (2, -1): [(0, 0, 0), (0, 1, 0), (1, 1, 0), (1, 0, 0)],
+}
+
+
+def preview_voxels(coords: Union[torch.Tensor, np.ndarray], resolution: int) -> trimesh.Trimesh:
+    """
+    Build a blocky preview of a sparse structure, with only the voxel faces between occupied and empty space.
+    The voxels fill the same [-0.5, 0.5] box as the decoded meshes, and are rotated like `to_glb` outputs.
+
+    Args:
+        coords (Union[torch.Tensor, np.ndarray]): The integer coordinates of the occupied voxels. Shape (N, 3).
+        resolution (int): The resolution of the voxel grid.
+    """
+    if isinstance(coords, torch.Tensor):
+        coords = coords.cpu().numpy()
+    coords = coords.astype(np.int64)
+    # Padded so the neighbours of the border voxels are in the grid
+    occupied = np.zeros((resolution + 2,) * 3, dtype=bool)
+    occupied[coords[:, 0] + 1, coords[:, 1] + 1, coords[:, 2] + 1] = True
+    quads = []
+    for (axis, sign), corners in _VOXEL_FACE_CORNERS.items():
+        neighbours = coords + 1
+        neighbours[:, axis] += sign
+        exposed = coords[~occupied[neighbours[:, 0], neighbours[:, 1], neighbours[:, 2]]]
+        quads.append(exposed[:, None, :] + np.array(corners)[None])
+    quads = np.concatenate(quads, axis=0)
+    vertices = quads.reshape(-1, 3).astype(np.float32) / resolution - 0.5
+    faces = np.arange(quads.shape[0] * 4).reshape(-1, 4)
+    faces = np.concatenate([faces[:, [0, 1, 2]], faces[:, [0, 2, 3]]], axis=0)
+    # rotate mesh (from z-up to y-up)
+    vertices = vertices @ np.array([[1, 0, 0], [0, 0, -1], [0, 1, 0]])
+    return trimesh.Trimesh(vertices, faces, process=False)
+
+
+def preview_mesh(mesh: MeshExtractResult) -> trimesh.Trimesh:
+    """
+    Convert a decoded mesh to an untextured preview as it is, without the postprocessing of `to_glb`.
+    """
+    vertices = mesh.vertices.cpu().numpy()
+    faces = mesh.faces.cpu().numpy()
+    # rotate mesh (from z-up to y-up)
+    vertices = vertices @ np.array([[1, 0, 0], [0, 0, -1], [0, 1, 0]])
+    return trimesh.Trimesh(vertices, faces, process=False)
+
+
 def simplify_gs(
     gs: Gaussian,
     simplify: float = 0.95,
@@ -27,4 +27,60 @@ def sphere_hammersley_sequence(n, num_samples, offset=(0, 0), remap=False):
         u = 2 * u if u < 0.25 else 2 / 3 * u + 1 / 3
     theta = np.arccos(1 - 2 * u) - np.pi / 2
     phi = v * 2 * np.pi
-    return [phi, theta]
\ No newline at end of file
+    return [phi, theta]
+
+def sphere_halton_sequence(n, offset=(0, 0), remap=False):
+    """
+    Like `sphere_hammersley_sequence`, but every prefix of the sequence covers the sphere evenly,
+    so the number of samples doesn't need to be known in advance.
+    """
+    u, v = halton_sequence(2, n + 1)
+    u += offset[0]
+    v += offset[1]
+    if remap:
+        u = 2 * u if u < 0.25 else 2 / 3 * u + 1 / 3
+    theta = np.arccos(1 - 2 * u) - np.pi / 2
+    phi = v * 2 * np.pi
+    return [phi, theta]
+
+
+# Vectorized versions of the sequences above, taking an array of sample indices instead of one index.
+# They give exactly the same values as the scalar versions.
+
+def radical_inverse_batch(base, n):
+    n = np.array(n, dtype=np.int64)
+    val = np.zeros(n.shape, dtype=np.float64)
+    inv_base = 1.0 / base
+    inv_base_n = inv_base
+    while np.any(n > 0):
+        digit = n % base
+        val += digit * inv_base_n
+        n //= base
+        inv_base_n *= inv_base
+    return val
+
+def halton_sequence_batch(dim, n):
+    """Halton points of the indices `n`, shape (len(n), dim)."""
+    return np.stack([radical_inverse_batch(PRIMES[d], n) for d in range(dim)], axis=-1)
+
+def hammersley_sequence_batch(dim, n, num_samples):
+    """Hammersley points of the indices `n` out of `num_samples`, shape (len(n), dim)."""
+    n = np.asarray(n)
+    return np.concatenate([(n / num_samples)[:, None], halton_sequence_batch(dim - 1, n)], axis=-1)
+
+def _sphere_from_uv(u, v, remap):
+    if remap:
+        u = np.where(u < 0.25, 2 * u, 2 / 3 * u + 1 / 3)
+    theta = np.arccos(1 - 2 * u) - np.pi / 2
+    phi = v * 2 * np.pi
+    return phi, theta
+
+def sphere_hammersley_sequence_batch(num_samples, offset=(0, 0), remap=False):
+    """All `num_samples` points of `sphere_hammersley_sequence`, as arrays of phis and thetas."""
+    uv = hammersley_sequence_batch(2, np.arange(num_samples), num_samples)
+    return _sphere_from_uv(uv[:, 0] + offset[0] / num_samples, uv[:, 1] + offset[1], remap)
+
+def sphere_halton_sequence_batch(num_samples, offset=(0, 0), remap=False):
+    """The first `num_samples` points of `sphere_halton_sequence`, as arrays of phis and thetas."""
+    uv = halton_sequence_batch(2, np.arange(num_samples) + 1)
+    return _sphere_from_uv(uv[:, 0] + offset[0], uv[:, 1] + offset[1], remap)
@@ -1,3 +1,4 @@
+import functools
 import torch
 import numpy as np
 from tqdm import tqdm
@@ -7,9 +8,11 @@ from PIL import Image
 from ..renderers import OctreeRenderer, GaussianRenderer, MeshRenderer
 from ..representations import Octree, Gaussian, MeshExtractResult
 from ..modules import sparse as sp
-from .random_utils import sphere_hammersley_sequence
+from .random_utils import sphere_hammersley_sequence_batch
 
-def yaw_pitch_r_fov_to_extrinsics_intrinsics(yaws, pitchs, rs, fovs, dtype=torch.float32):
+def yaw_pitch_r_fov_to_extrinsics_intrinsics(yaws, pitchs, rs, fovs, dtype=torch.float32, device=None):
+    if device is None:
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
     is_list = isinstance(yaws, list)
     if not is_list:
         yaws = [yaws]
@@ -18,31 +21,51 @@ def yaw_pitch_r_fov_to_extrinsics_intrinsics(yaws, pitchs, rs, fovs, dtype=torch
         rs = [rs] * len(yaws)
     if not isinstance(fovs, list):
         fovs = [fovs] * len(yaws)
-    extrinsics = []
-    intrinsics = []
-    for yaw, pitch, r, fov in zip(yaws, pitchs, rs, fovs):
-        fov = torch.deg2rad(torch.tensor(float(fov))).cuda()
-        yaw = torch.tensor(float(yaw)).cuda()
-        pitch = torch.tensor(float(pitch)).cuda()
-        orig = torch.tensor([
-            torch.sin(yaw) * torch.cos(pitch),
-            torch.cos(yaw) * torch.cos(pitch),
-            torch.sin(pitch),
-        ],  dtype=dtype, device='cuda') * r
-        extr = utils3d.torch.extrinsics_look_at(orig,
-                                                torch.tensor([0, 0, 0], dtype=dtype, device='cuda'),
-                                                torch.tensor([0, 0, 1], dtype=dtype, device='cuda'))
-        intr = utils3d.torch.intrinsics_from_fov_xy(fov, fov)
-        if intr.dtype != dtype:
-            intr = intr.to(dtype)
-        extrinsics.append(extr)
-        intrinsics.append(intr)
+    # Build every camera at once
+    fovs = torch.deg2rad(torch.tensor(fovs, dtype=torch.float32, device=device))
+    yaws = torch.tensor(yaws, dtype=torch.float32, device=device)
+    pitchs = torch.tensor(pitchs, dtype=torch.float32, device=device)
+    rs = torch.tensor(rs, dtype=torch.float32, device=device)
+    origs = torch.stack([
+        torch.sin(yaws) * torch.cos(pitchs),
+        torch.cos(yaws) * torch.cos(pitchs),
+        torch.sin(pitchs),
+    ], dim=-1).to(dtype) * rs[:, None].to(dtype)
+    extrinsics = utils3d.torch.extrinsics_look_at(origs,
+                                                  torch.tensor([0, 0, 0], dtype=dtype, device=device).expand_as(origs),
+                                                  torch.tensor([0, 0, 1], dtype=dtype, device=device).expand_as(origs))
+    intrinsics = utils3d.torch.intrinsics_from_fov_xy(fovs, fovs)
+    if intrinsics.dtype != dtype:
+        intrinsics = intrinsics.to(dtype)
+    extrinsics = list(extrinsics.unbind(dim=0))
+    intrinsics = list(intrinsics.unbind(dim=0))
     if not is_list:
         extrinsics = extrinsics[0]
         intrinsics = intrinsics[0]
     return extrinsics, intrinsics
 
 
+@functools.lru_cache(maxsize=16)
+def _multiview_cameras(nviews, r, fov, offset, dtype, device):
+    yaws, pitchs = sphere_hammersley_sequence_batch(nviews, offset)
+    return yaw_pitch_r_fov_to_extrinsics_intrinsics(yaws.tolist(), pitchs.tolist(), r, fov, dtype=dtype, device=device)
+
+
+def multiview_cameras(nviews, r=2, fov=40, offset=(0, 0), dtype=torch.float32, device=None):
+    """
+    The cameras of `render_multiview`, spread over a sphere by a Hammersley sequence.
+    Built once per set of arguments, every call gets its own copy of the cached cameras.
+
+    Returns:
+        (List[torch.Tensor]): Extrinsics of the cameras, each of shape (4, 4).
+        (List[torch.Tensor]): Intrinsics of the cameras, each of shape (3, 3).
+    """
+    if device is None:
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    extrinsics, intrinsics = _multiview_cameras(nviews, r, fov, tuple(offset), dtype, torch.device(device))
+    return [e.clone() for e in extrinsics], [i.clone() for i in intrinsics]
+
+
 def render_frames(sample, extrinsics, intrinsics, options={}, colors_overwrite=None, verbose=True, **kwargs):
     if isinstance(sample, Octree):
         renderer = OctreeRenderer()
@@ -115,13 +138,9 @@ def render_multiview(sample, resolution=512, nviews=30):
         dtype = sample.vertices.dtype
     else:
         dtype = torch.float32 #for Gaussian etc - use default dtype, since float16 isn't supported by those
+    device = sample.vertices.device if hasattr(sample, 'vertices') else getattr(sample, 'device', None)
     # proceed:
-    r = 2
-    fov = 40
-    cams = [sphere_hammersley_sequence(i, nviews) for i in range(nviews)]
-    yaws = [cam[0] for cam in cams]
-    pitchs = [cam[1] for cam in cams]
-    extrinsics, intrinsics = yaw_pitch_r_fov_to_extrinsics_intrinsics(yaws, pitchs, r, fov, dtype=dtype)
+    extrinsics, intrinsics = multiview_cameras(nviews, r=2, fov=40, dtype=dtype, device=device)
     res = render_frames(sample, extrinsics, intrinsics, {'resolution': resolution, 'bg_color': (0, 0, 0)})
     return res['color'], extrinsics, intrinsics
 
@@ -1,11 +1,18 @@
 from .utils import *
 import os
-import queue
+import io
+import hashlib
 import threading
 from .trellis.pipelines import TrellisImageTo3DPipeline
+from .trellis.pipelines.model_residency import ModelResidencyManager
 import torch
 import logging
-from .models import SqliteImg23dTask
+from .models import SqliteImg23dTask, Img23DTaskIn
+from .result_cache import ResultCache
+from .latent_cache import LatentCache
+from .trellis.modules import sparse as sp
+from .scheduler import StagedScheduler
+from easydict import EasyDict as edict
 from PIL import Image
 from pathlib import Path
 import shutil
@@ -18,9 +25,9 @@ class TrellisGenerator:
     _instance = None
 
     @classmethod
-    def instance(cls, device="dynamic", precision="float16"):
+    def instance(cls, device="dynamic", precision="float16", batched_cfg=False, stage_workers=None, stage_queue_size=2, max_batch_size=1, max_batch_wait_ms=50, result_cache_size_mb=2048, latent_cache_size_mb=1024, prefetch_models=False, vram_budget_gb=0, eviction_policy="next_use", texture_preset="quality", previews=True, gzip_downloads=False, occupancy_slab_size=0, compile_flow_model="off"):
         if cls._instance is None:
-            cls._instance = cls(device, precision)
+            cls._instance = cls(device, precision, batched_cfg, stage_workers, stage_queue_size, max_batch_size, max_batch_wait_ms, result_cache_size_mb, latent_cache_size_mb, prefetch_models, vram_budget_gb, eviction_policy, texture_preset, previews, gzip_downloads, occupancy_slab_size, compile_flow_model)
         return cls._instance
 
     def __new__(cls, *args, **kwargs):
@@ -29,16 +36,29 @@ class TrellisGenerator:
             cls._instance.initialized = False
         return cls._instance
 
-    def __init__(self, device="dynamic", precision="float16"):
+    def __init__(self, device="dynamic", precision="float16", batched_cfg=False, stage_workers=None, stage_queue_size=2, max_batch_size=1, max_batch_wait_ms=50, result_cache_size_mb=2048, latent_cache_size_mb=1024, prefetch_models=False, vram_budget_gb=0, eviction_policy="next_use", texture_preset="quality", previews=True, gzip_downloads=False, occupancy_slab_size=0, compile_flow_model="off"):
         if self.initialized:
             return 
         self._initial_db()
-        self.img23d_pipeline = self._initial_img23d_pipeline(device, precision)
-        self.lock = threading.Lock()
-        self.queue = queue.Queue()
-        logger.info("Open a new thread for Trellis generator...")
-        self.worker_thread = threading.Thread(target=self._worker, daemon=True)
-        self.worker_thread.start()
+        self.img23d_pipeline = self._initial_img23d_pipeline(device, precision, batched_cfg, prefetch_models, vram_budget_gb, eviction_policy, texture_preset, previews, occupancy_slab_size, compile_flow_model)
+        if self.img23d_pipeline.models['sparse_structure_flow_model'].compile_mode is not None:
+            logger.info("Compile the sparse structure flow model for every batch size...")
+            self.img23d_pipeline.warmup_sparse_structure_flow_model(max_batch_size)
+        model_revision = self._model_revision(precision)
+        self.result_cache = ResultCache(
+            cache_dir=RESULT_CACHE_DIR, 
+            max_bytes=int(result_cache_size_mb * 1024 * 1024), 
+            # The texture preset changes the outputs but not the latents
+            model_revision=f"{model_revision}-{texture_preset}", 
+        )
+        self.latent_cache = LatentCache(
+            cache_dir=LATENT_CACHE_DIR, 
+            max_bytes=int(latent_cache_size_mb * 1024 * 1024), 
+            model_revision=model_revision, 
+        )
+        # Whether the download api compresses large glb files for the clients accepting gzip
+        self.gzip_downloads = gzip_downloads
+        self.scheduler = self._initial_scheduler(stage_workers or {}, stage_queue_size, max_batch_size, max_batch_wait_ms)
         self.initialized = True
         
     def _initial_db(self):
@@ -47,11 +67,13 @@ class TrellisGenerator:
         self.sqlite_img23d_task.create_table()
         self._empty_folder(UPLOADS_IMAGE_DIR)
         self._empty_folder(OUTPUTS_DIR)
+        # The index of the result cache is in memory only
+        self._empty_folder(RESULT_CACHE_DIR)
 
         # Ensure every time the trellis generator startup, it would get optimized vram usage
         torch.cuda.empty_cache()
 
-    def _initial_img23d_pipeline(self, device="dynamic", precision="float16"):
+    def _initial_img23d_pipeline(self, device="dynamic", precision="float16", batched_cfg=False, prefetch_models=False, vram_budget_gb=0, eviction_policy="next_use", texture_preset="quality", previews=True, occupancy_slab_size=0, compile_flow_model="off"):
         img23d_pipeline = TrellisImageTo3DPipeline.from_pretrained(TRELLIS_IMAGE_LARGE_REPO_DIR)
         if device == "cuda":
             img23d_pipeline.cuda()
@@ -62,49 +84,174 @@ class TrellisGenerator:
             if "image_cond_model" in img23d_pipeline.models:
                 img23d_pipeline.models['image_cond_model'].half() 
         img23d_pipeline.device_mode = device
+        if device == "dynamic":
+            img23d_pipeline.residency = ModelResidencyManager(
+                img23d_pipeline.models, 
+                vram_budget=int(vram_budget_gb * 1024**3), 
+                prefetch=prefetch_models, 
+                policy=eviction_policy, 
+                use_order=TrellisImageTo3DPipeline.model_use_order, 
+            )
+            for name, footprint in img23d_pipeline.residency.footprints.items():
+                logger.info(f"Model {name} takes {footprint / 1024**2:.0f}MB")
+            logger.info(f"Keep up to {img23d_pipeline.residency.vram_budget / 1024**3:.1f}GB of models on the gpu between uses")
         img23d_pipeline.precision_mode = precision
+        img23d_pipeline.sparse_structure_sampler.batched_cfg = batched_cfg
+        img23d_pipeline.slat_sampler.batched_cfg = batched_cfg
+        img23d_pipeline.texture_preset = texture_preset
+        img23d_pipeline.publish_previews = previews
+        img23d_pipeline.occupancy_slab_size = occupancy_slab_size
+        if compile_flow_model != "off":
+            if compile_flow_model == "reduce-overhead" and device != "cuda":
+                # The cuda graphs replay on the memory of the weights, which moves between cpu and gpu in dynamic device mode
+                logger.warning("Cuda graphs need the cuda device mode, compile the sparse structure flow model in default mode instead")
+                compile_flow_model = "default"
+            img23d_pipeline.models['sparse_structure_flow_model'].enable_compile(compile_flow_model)
         return img23d_pipeline
     
-    def _worker(self):
-        """Worker thread that processes operations sequentially."""
-        while True:
-            operation, args, kwargs = self.queue.get()  # Wait for an operation
-            try:
-                task = kwargs.get("task")
-                with self.lock:
-                    operation(*args, **kwargs)  # Perform the operation
-                self.queue.task_done()  # Mark the task as done
-            except Exception as e:
-                task.generate_status = "generating_failed"
-                task.generate_failed_message = f"Generation failed because error happened: {e}"
-                self.sqlite_img23d_task.update_item(task)
-                continue
-    
-    def _enqueue_operation(self, operation, *args, **kwargs):
-        """Enqueue an operation to be processed by the worker thread."""
-        self.queue.put((operation, args, kwargs))
+    def _model_revision(self, precision):
+        """Identify the loaded models, so cached outputs of other models or precisions never match."""
+        h = hashlib.sha256()
+        with open(os.path.join(TRELLIS_IMAGE_LARGE_REPO_DIR, "pipeline.json"), "rb") as f:
+            h.update(f.read())
+        h.update(precision.encode("utf-8"))
+        return h.hexdigest()
+
+    def _initial_scheduler(self, stage_workers: dict, stage_queue_size: int, max_batch_size: int, max_batch_wait_ms: float):
+        """
+        Split a job into stages with their own workers, so the cpu stages of one job overlap the gpu stages of another.
+        The stages using the models share one lock, as they move models between devices in dynamic mode.
+        The sampling stage takes up to `max_batch_size` queued jobs and samples them as one batch.
+        The postprocess stage runs outside the lock although `to_glb` bakes with nvdiffrast on the gpu,
+        so the vram it takes is not counted by the vram budget of dynamic mode, leave some headroom for it.
+        """
+        self.gpu_lock = threading.Lock()
+        scheduler = StagedScheduler(on_failed=self._on_job_failed)
+        # The first queue stays unbounded, so creating a task from the api never blocks
+        scheduler.add_stage("preprocess", self._preprocess_stage, workers=stage_workers.get("preprocess", 1))
+        scheduler.add_stage(
+            "sampling", 
+            self._sampling_stage, 
+            workers=stage_workers.get("sampling", 1), 
+            queue_size=max(stage_queue_size, max_batch_size), 
+            lock=self.gpu_lock, 
+            batched=True, 
+            batch_size=max_batch_size, 
+            max_wait_ms=max_batch_wait_ms, 
+            # The tasks of a batch sample with the same sampler params
+            batch_key=lambda job: job.task.speed_tier, 
+        )
+        scheduler.add_stage("decoding", self._decoding_stage, workers=stage_workers.get("decoding", 1), queue_size=stage_queue_size, lock=self.gpu_lock)
+        scheduler.add_stage("postprocess", self._postprocess_stage, workers=stage_workers.get("postprocess", 1), queue_size=stage_queue_size)
+        logger.info("Open worker threads for Trellis generator...")
+        scheduler.start()
+        return scheduler
+
+    def _preprocess_stage(self, job):
+        device = self.img23d_pipeline.compute_device
+        cached = self.latent_cache.load(job.slat_key, device)
+        if cached is not None:
+            # Sampled before with other output settings, only decoding is left
+            logger.info(f"Task {job.task.tid} resumes from cached structured latent")
+            job.slat = sp.SparseTensor(feats=cached["slat_feats"], coords=cached["slat_coords"])
+            job.image = None
+            self.img23d_pipeline.resume_task(job.task, progress=75)
+            return job
+        cached = self.latent_cache.load(job.cond_key, device)
+        if cached is not None:
+            logger.info(f"Task {job.task.tid} resumes from cached image condition")
+            job.cond = cached["cond"]
+            job.image = None
+            self.img23d_pipeline.resume_task(job.task, progress=30)
+            return job
+        job.image = self.img23d_pipeline.run_preprocess(job.image, job.task)
+        return job
+
+    def _sampling_stage(self, jobs):
+        to_sample = [job for job in jobs if job.get("slat") is None]
+        if to_sample:
+            results = self.img23d_pipeline.run_sampling_batch(
+                [job.image for job in to_sample], 
+                [job.task for job in to_sample], 
+                conds=[job.get("cond") for job in to_sample], 
+            )
+            for job, result in zip(to_sample, results):
+                if job.get("cond") is None:
+                    self.latent_cache.save(job.cond_key, {"cond": result.cond})
+                job.slat = result.slat
+                job.image = None
+                job.cond = None
+                self.latent_cache.save(job.slat_key, {
+                    "coords": result.coords, 
+                    "slat_feats": result.slat.feats, 
+                    "slat_coords": result.slat.coords, 
+                })
+        return jobs
+
+    def _decoding_stage(self, job):
+        job.decoded_slat = self.img23d_pipeline.run_decoding(job.slat, job.task)
+        job.slat = None
+        return job
+
+    def _postprocess_stage(self, job):
+        output_path = self.img23d_pipeline.run_postprocessing(job.decoded_slat, job.task)
+        job.decoded_slat = None
+        extension = os.path.splitext(output_path)[1][1:]
+        self.result_cache.put(job.cache_key, extension, output_path)
+        return job
+
+    def _on_job_failed(self, job, e):
+        self.img23d_pipeline.fail_task(job.task, e)
 
     @property
     def queue_size(self):
-        return self.queue.qsize
+        return self.scheduler.pending
+
+    def create_img23d_task(self, task, image_bytes=None):
+        """
+        Queue a task, or finish it at once with a cached output of the same image and settings.
 
-    def create_img23d_task(self, task):
+        Args:
+            task (Img23DTask): The task to create.
+            image_bytes (bytes): The encoded image, read from the uploaded image of the task if not given.
+        """
         try:
             task.create_status = "creating"
-            image_path = os.path.normpath(os.path.join(UPLOADS_IMAGE_DIR, f"{task.image_token}.{task.image_type}"))
-            image = Image.open(image_path).convert("RGBA")
-            def run_img23d_task_operation(task):
-                result = self.img23d_pipeline.run(
-                    image=image, 
-                    task=task,
-                )
-            self._enqueue_operation(run_img23d_task_operation, task=task)
+            if image_bytes is None:
+                image_path = os.path.normpath(os.path.join(UPLOADS_IMAGE_DIR, f"{task.image_token}.{task.image_type}"))
+                with open(image_path, "rb") as f:
+                    image_bytes = f.read()
+            cache_key = self.result_cache.key(image_bytes, self._cache_params(task))
+            cached = self.result_cache.restore(cache_key, OUTPUTS_DIR, task.tid)
+            if cached is not None:
+                logger.info(f"Task {task.tid} reuses the cached output {cached['path']}")
+                task.output_url = f"/download?extension={cached['extension']}&token={task.tid}"
+                task.progress = 100
+                task.generate_status = "generating_end"
+                task.create_status = "creating_end"
+                return
+            image = Image.open(io.BytesIO(image_bytes)).convert("RGBA")
+            latent_params = self._cache_params(task)
+            latent_params.pop("output_type")
             task.generate_status = "queued"
             task.create_status = "creating_end"
+            self.scheduler.submit(edict(
+                task=task, 
+                image=image, 
+                cache_key=cache_key, 
+                cond_key=self.latent_cache.key(image_bytes, {"cond": task.preprocess_image}), 
+                slat_key=self.latent_cache.key(image_bytes, latent_params), 
+            ))
         except Exception as e:
             task.create_status = "creating_failed"
             raise e
         
+    def _cache_params(self, task):
+        """Every parameter of the task input which changes the output, and the seed used for sampling."""
+        params = task.model_dump(include=set(Img23DTaskIn.model_fields) - {"image_token", "image_type"})
+        params["seed"] = 42
+        return params
+
     def _empty_folder(self, folder_path: str):
         folder = Path(folder_path)
         if folder.exists() and folder.is_dir():
@@ -125,8 +272,8 @@ class TrellisGenerator:
             return 
 
     def close(self):
-        """Wait for all operations to complete and stop the worker thread."""
-        self.queue.join()
+        """Wait for all jobs to go through every stage."""
+        self.scheduler.join()
         self.sqlite_img23d_task.drop_table()
         self._empty_folder(UPLOADS_IMAGE_DIR)
         self._empty_folder(OUTPUTS_DIR)
@@ -23,3 +23,9 @@ OUTPUTS_DIR = absolute_path_based_on_addon("user_data/trellis-api/outputs")
 os.makedirs(OUTPUTS_DIR, exist_ok=True)
 DB_DIR = absolute_path_based_on_addon("user_data/trellis-api/db")
 os.makedirs(DB_DIR, exist_ok=True)
+RESULT_CACHE_DIR = absolute_path_based_on_addon("user_data/trellis-api/cache/results")
+os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+LATENT_CACHE_DIR = absolute_path_based_on_addon("user_data/trellis-api/cache/latents")
+os.makedirs(LATENT_CACHE_DIR, exist_ok=True)
+COMPILE_CACHE_DIR = absolute_path_based_on_addon("user_data/trellis-api/cache/compile")
+os.makedirs(COMPILE_CACHE_DIR, exist_ok=True)
@@ -31,6 +31,7 @@ class Trellisgen_UL_Image23D_Tasks(bpy.types.UIList):
             row.label(text=image_upload_status_info[0], icon_value=icons_loader.get_icon_id(image_upload_status_info[1]))
             output_type_info = (
                 (_("Model", '*'), "shine_model") if task.output.type == "model" else
+                (_("Gaussian Splat", '*'), "shine_pbr_model") if task.output.type == "gaussian" else
                 (_("Base Model", '*'), "shine_base_model")
             )
             row.label(text=output_type_info[0], icon_value=icons_loader.get_icon_id(output_type_info[1]))